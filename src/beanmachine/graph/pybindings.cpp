@@ -6,14 +6,136 @@
  */
 
 #include "beanmachine/graph/pybindings.h"
+#include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <algorithm>
+#include <stdexcept>
 
 namespace beanmachine {
 namespace graph {
 
 namespace py = pybind11;
 
+using Samples = std::vector<std::vector<std::vector<NodeValue>>>;
+
+// Copies the samples of one query, from every chain, into a new contiguous
+// array of the given shape. write_value writes one sample at the given
+// position and returns the position just past it.
+template <typename T, typename WriteValue>
+py::array_t<T> query_samples_to_array(
+    const Samples& samples,
+    uint query,
+    const std::vector<py::ssize_t>& shape,
+    WriteValue write_value) {
+  py::array_t<T> result(shape);
+  T* out = result.mutable_data();
+  for (const auto& chain : samples) {
+    for (const auto& sample : chain) {
+      out = write_value(sample[query], out);
+    }
+  }
+  return result;
+}
+
+// Eigen matrices are stored in column-major order, so the data of a
+// rows x cols matrix is laid out exactly like a row-major cols x rows array.
+// That is the transposed shape in which BMGInference returns matrix samples.
+template <typename T, typename Matrix>
+T* write_matrix(const Matrix& m, T* out) {
+  return std::transform(m.data(), m.data() + m.size(), out, [](auto x) {
+    return static_cast<T>(x);
+  });
+}
+
+// Runs multi-chain inference and returns one array per query, of shape
+// (n_chains, num_samples) for scalar queries, (n_chains, num_samples, rows)
+// for column vectors and (n_chains, num_samples, cols, rows) for other
+// matrices. The samples are written directly into the arrays, rather than
+// being converted to Python objects one at a time, and the graph's own copy
+// of the samples is released once it has been transferred.
+std::vector<py::array> infer_to_numpy(
+    Graph& g,
+    uint num_samples,
+    InferenceType algorithm,
+    uint seed,
+    uint n_chains,
+    InferConfig infer_config) {
+  Samples* samples;
+  {
+    py::gil_scoped_release release;
+    samples = &g.infer(num_samples, algorithm, seed, n_chains, infer_config);
+  }
+  std::vector<py::array> result;
+  if (samples->empty() || samples->front().empty()) {
+    return result;
+  }
+  auto chain_length = samples->front().size();
+  for (const auto& chain : *samples) {
+    if (chain.size() != chain_length) {
+      throw std::runtime_error(
+          "infer_to_numpy requires all chains to have the same length");
+    }
+  }
+  auto n_queries = static_cast<uint>(samples->front().front().size());
+  for (uint query = 0; query < n_queries; query++) {
+    const ValueType& type = samples->front().front()[query].type;
+    std::vector<py::ssize_t> shape = {
+        static_cast<py::ssize_t>(samples->size()),
+        static_cast<py::ssize_t>(chain_length)};
+    if (type.variable_type == VariableType::SCALAR) {
+      switch (type.atomic_type) {
+        case AtomicType::BOOLEAN:
+          result.push_back(query_samples_to_array<bool>(
+              *samples, query, shape, [](const NodeValue& v, bool* out) {
+                *out = v._bool;
+                return out + 1;
+              }));
+          break;
+        case AtomicType::NATURAL:
+          result.push_back(query_samples_to_array<int64_t>(
+              *samples, query, shape, [](const NodeValue& v, int64_t* out) {
+                *out = static_cast<int64_t>(v._natural);
+                return out + 1;
+              }));
+          break;
+        default:
+          result.push_back(query_samples_to_array<double>(
+              *samples, query, shape, [](const NodeValue& v, double* out) {
+                *out = v._double;
+                return out + 1;
+              }));
+      }
+      continue;
+    }
+    if (type.cols != 1) {
+      shape.push_back(type.cols);
+    }
+    shape.push_back(type.rows);
+    switch (type.atomic_type) {
+      case AtomicType::BOOLEAN:
+        result.push_back(query_samples_to_array<bool>(
+            *samples, query, shape, [](const NodeValue& v, bool* out) {
+              return write_matrix(v._bmatrix, out);
+            }));
+        break;
+      case AtomicType::NATURAL:
+        result.push_back(query_samples_to_array<int64_t>(
+            *samples, query, shape, [](const NodeValue& v, int64_t* out) {
+              return write_matrix(v._nmatrix, out);
+            }));
+        break;
+      default:
+        result.push_back(query_samples_to_array<double>(
+            *samples, query, shape, [](const NodeValue& v, double* out) {
+              return write_matrix(v._matrix, out);
+            }));
+    }
+  }
+  Samples().swap(*samples);
+  return result;
+}
+
 PYBIND11_MODULE(graph, module) {
   module.doc() = "module for python bindings to the graph API";
 
@@ -365,6 +487,16 @@ PYBIND11_MODULE(graph, module) {
           py::arg("seed") = 5123401,
           py::arg("n_chains") = 4,
           py::arg("infer_config") = InferConfig())
+      .def(
+          "infer_to_numpy",
+          &infer_to_numpy,
+          "infer the empirical distribution of the queried nodes using multiple chains, "
+          "returning one contiguous numpy array of samples per query",
+          py::arg("num_samples"),
+          py::arg("algorithm") = InferenceType::GIBBS,
+          py::arg("seed") = 5123401,
+          py::arg("n_chains") = 4,
+          py::arg("infer_config") = InferConfig())
       .def(
           "variational",
           &Graph::variational,
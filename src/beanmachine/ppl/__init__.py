@@ -7,7 +7,13 @@ from torch.distributions import Distribution
 
 from . import experimental
 from .diagnostics import Diagnostics
-from .diagnostics.common_statistics import effective_sample_size, r_hat, split_r_hat
+from .diagnostics.common_statistics import (
+    bulk_effective_sample_size,
+    effective_sample_size,
+    r_hat,
+    split_r_hat,
+    tail_effective_sample_size,
+)
 from .diagnostics.tools import viz
 from .inference import (
     CompositionalInference,
@@ -22,6 +28,7 @@ from .inference import (
     SingleSiteNoUTurnSampler,
     SingleSiteRandomWalk,
     SingleSiteUniformMetropolisHastings,
+    StochasticGradientLangevinDynamics,
 )
 from .model import (
     functional,
@@ -49,6 +56,8 @@ __all__ = [
     "SingleSiteNoUTurnSampler",
     "SingleSiteRandomWalk",
     "SingleSiteUniformMetropolisHastings",
+    "StochasticGradientLangevinDynamics",
+    "bulk_effective_sample_size",
     "effective_sample_size",
     "empirical",
     "experimental",
@@ -59,5 +68,6 @@ __all__ = [
     "random_variable",
     "simulate",
     "split_r_hat",
+    "tail_effective_sample_size",
     "viz",
 ]
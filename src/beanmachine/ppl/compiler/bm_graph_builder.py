@@ -4,7 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import math
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Set
 
 import beanmachine.ppl.compiler.bmg_nodes as bn
 import beanmachine.ppl.compiler.bmg_types as bt
@@ -126,6 +126,7 @@ class BMGraphBuilder:
             raise ValueError("remove_leaf called with node from wrong builder")
         for i in node.inputs.inputs:
             i.outputs.remove_item(node)
+        bn.mark_modified(*node.inputs.inputs)
         del self._nodes[node]
 
     def remove_node(self, node: BMGNode) -> None:
@@ -142,6 +143,7 @@ class BMGraphBuilder:
             raise ValueError("remove_node called with node from wrong builder")
         for i in node.inputs.inputs:
             i.outputs.remove_item(node)
+        bn.mark_modified(*node.inputs.inputs)
         del self._nodes[node]
 
     # ####
@@ -1030,8 +1032,14 @@ class BMGraphBuilder:
 
     # TODO: Should this be idempotent?
     # TODO: Should it be an error to add two unequal observations to one node?
-    def add_observation(self, observed: bn.SampleNode, value: Any) -> bn.Observation:
-        node = bn.Observation(observed, value)
+    def add_observation(
+        self,
+        observed: bn.SampleNode,
+        value: Any,
+        rvidentifier: Optional[RVIdentifier] = None,
+        element_index: Optional[int] = None,
+    ) -> bn.Observation:
+        node = bn.Observation(observed, value, rvidentifier, element_index)
         self.add_node(node)
         return node
 
@@ -1124,29 +1132,32 @@ class BMGraphBuilder:
     def all_ancestor_nodes(self) -> List[BMGNode]:
         """Returns a topo-sorted list of nodes that are ancestors to any
         sample, observation, query or factor."""
+        return self._traverse(_is_ancestor_root)
 
-        def is_root(n: BMGNode) -> bool:
-            return (
-                isinstance(n, bn.SampleNode)
-                or isinstance(n, bn.Observation)
-                or isinstance(n, bn.Query)
-                or isinstance(n, bn.FactorNode)
-            )
-
-        return self._traverse(is_root)
+    def ancestor_nodes_within(self, nodes: Set[BMGNode]) -> List[BMGNode]:
+        """Given a set of nodes which contains all of the descendants of its
+        nodes, returns a topo-sorted list of those nodes that are ancestors to
+        any sample, observation, query or factor. Only the given nodes are
+        visited, rather than the whole graph."""
+        return self._traverse(_is_ancestor_root, nodes)
 
     def all_nodes(self) -> List[BMGNode]:
         """Returns a topo-sorted list of all nodes."""
         return self._traverse(lambda n: n.is_leaf)
 
-    def _traverse(self, is_root: Callable[[BMGNode], bool]) -> List[BMGNode]:
+    def _traverse(
+        self,
+        is_root: Callable[[BMGNode], bool],
+        within: Optional[Set[BMGNode]] = None,
+    ) -> List[BMGNode]:
         """This returns a list of the reachable graph nodes
         in topologically sorted order. The ordering invariants are
         (1) all sample, observation, query and factor nodes are
         enumerated in the order they were added, and
         (2) all inputs are enumerated before their outputs, and
         (3) inputs to the "left" are enumerated before those to
-        the "right"."""
+        the "right".
+        If within is given, only the nodes in it are enumerated."""
 
         # We require here that the graph is acyclic.
 
@@ -1170,9 +1181,12 @@ class BMGraphBuilder:
         # our invariants.
 
         result = []
-        work_stack = sorted(
-            (n for n in self._nodes if is_root(n)), key=key, reverse=True
-        )
+        if within is None:
+            roots = (n for n in self._nodes if is_root(n))
+        else:
+            # nodes which have been removed from the graph are skipped
+            roots = (n for n in within if n in self._nodes and is_root(n))
+        work_stack = sorted(roots, key=key, reverse=True)
         already_in_result = set()
         inputs_already_pushed = set()
 
@@ -1203,7 +1217,8 @@ class BMGraphBuilder:
                 # reverse them so that the left inputs go on the stack last, and
                 # are therefore closer to the top.
                 for i in reversed(current.inputs):
-                    work_stack.append(i)
+                    if within is None or i in within:
+                        work_stack.append(i)
                 inputs_already_pushed.add(current)
 
         return result
@@ -1215,6 +1230,15 @@ class BMGraphBuilder:
         )
 
 
+def _is_ancestor_root(n: BMGNode) -> bool:
+    return (
+        isinstance(n, bn.SampleNode)
+        or isinstance(n, bn.Observation)
+        or isinstance(n, bn.Query)
+        or isinstance(n, bn.FactorNode)
+    )
+
+
 def rv_to_query(bmg: BMGraphBuilder) -> Dict[RVIdentifier, bn.Query]:
     rv_to_query_map: Dict[RVIdentifier, bn.Query] = {}
     for node in bmg.all_nodes():
@@ -4,7 +4,8 @@
 # LICENSE file in the root directory of this source tree.
 
 from abc import ABC, ABCMeta
-from typing import Any, Iterable, List
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator, List, Optional, Set
 
 import beanmachine.ppl.compiler.bmg_types as bt
 import torch
@@ -12,6 +13,31 @@ from beanmachine.ppl.model.rv_identifier import RVIdentifier
 from beanmachine.ppl.utils.item_counter import ItemCounter
 from torch import Tensor
 
+# Passes which cache facts about nodes, such as worklist_graph_fixer in
+# fix_problem.py, need to know which nodes might have changed since. While a set
+# is being recorded into, every node which has an edge added, changed or removed,
+# or whose type a typer finds has changed, is added to it.
+_modification_logs: List[Set["BMGNode"]] = []
+
+
+@contextmanager
+def recording_modifications() -> Iterator[Set["BMGNode"]]:
+    """Returns the set of nodes which are modified inside the with block"""
+    log: Set["BMGNode"] = set()
+    _modification_logs.append(log)
+    try:
+        yield log
+    finally:
+        # the with blocks are nested, so the log is the last one
+        _modification_logs.pop()
+
+
+def mark_modified(*nodes: "BMGNode") -> None:
+    """Records that the edges or types of the given nodes have changed"""
+    for log in _modification_logs:
+        log.update(nodes)
+
+
 # Note that we're not going to subclass list or UserList here because we
 # only need to use the most basic list operations: initialization, getting
 # an item, and setting an item. We never want to delete items, append to
@@ -28,6 +54,7 @@ class InputList:
         self.inputs = inputs
         for i in inputs:
             i.outputs.add_item(node)
+        mark_modified(node, *inputs)
 
     def __setitem__(self, index: int, value: "BMGNode") -> None:
         # If this is a no-op, do nothing.
@@ -43,6 +70,7 @@ class InputList:
         old_value.outputs.remove_item(self.node)
         self.inputs[index] = value
         value.outputs.add_item(self.node)
+        mark_modified(self.node, old_value, value)
 
     def __getitem__(self, index: int) -> "BMGNode":
         return self.inputs[index]
@@ -1573,19 +1601,43 @@ class Observation(BMGNode):
     # without knowing the observations ahead of time.
     value: Any
 
-    def __init__(self, observed: BMGNode, value: Any):
+    # The observation also remembers which random variable of the original
+    # model it came from, and if the observed value was split into elements
+    # by the devectorizer, the (row-major) index of the element it observes.
+    # This allows a compiled graph to be re-observed with fresh values without
+    # compiling the model again; see compilation_cache.py.
+    _rvidentifier: Optional[RVIdentifier]
+    _element_index: Optional[int]
+
+    def __init__(
+        self,
+        observed: BMGNode,
+        value: Any,
+        rvidentifier: Optional[RVIdentifier] = None,
+        element_index: Optional[int] = None,
+    ):
         # The observed node is required to be a sample by BMG,
         # but during model transformations it is possible for
         # an observation to temporarily observe a non-sample.
         # TODO: Consider adding a verification pass which ensures
         # this invariant is maintained by the rewriters.
         self.value = value
+        self._rvidentifier = rvidentifier
+        self._element_index = element_index
         BMGNode.__init__(self, [observed])
 
     @property
     def observed(self) -> BMGNode:
         return self.inputs[0]
 
+    @property
+    def rv_identifier(self) -> Optional[RVIdentifier]:
+        return self._rvidentifier
+
+    @property
+    def element_index(self) -> Optional[int]:
+        return self._element_index
+
     def __str__(self) -> str:
         return str(self.observed) + "=" + str(self.value)
 
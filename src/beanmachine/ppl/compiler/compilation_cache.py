@@ -0,0 +1,349 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""A cache of compiled BMG graphs.
+
+Compiling a model for BMG means lifting every model function, accumulating
+the graph, running all the problem fixers and then building the C++ graph.
+None of that depends on the *values* of the observations, only on the model
+and on which random variables are queried and observed. If a user runs
+inference on the same model many times with fresh data, we can therefore
+reuse the generated graph and simply observe the new values.
+
+To make that possible every Observation node remembers which random variable
+(and which element of that random variable, if the observation was
+devectorized) it came from. After compilation we record, for each observation
+in the final graph, the graph node it observes and how to turn the
+user-supplied value into the value that BMG expects.
+
+Some rewrites -- the conjugate prior fixers and the "observe true" fixer --
+fold observed values into the graph itself. Graphs produced by those
+rewrites cannot be re-observed and are never cached.
+
+The cache key consists of:
+
+* a digest of the source of the modules which define the queried and
+  observed random variables,
+* the queried and observed random variables and their arguments,
+* the shape and dtype of each observed value, and
+* the compiler options.
+
+The BMG type of an observed value does not change the compiled graph, but
+the value must still be possible for the observed sample. New values are
+checked against the type of the sample before they are observed; if the
+check fails, the model is compiled again so that the error is reported in
+the usual way.
+
+Note that the key does not capture the values of any constants the model
+reads from global state or from model objects; the cache assumes that only
+the observations change between calls.
+
+Entries are always kept in memory. If a cache directory is given then entries
+are also written to disk as Python code that rebuilds the graph, so that they
+can be reused by other processes. Only load cache directories you trust; the
+cached code is executed when it is loaded."""
+
+import hashlib
+import inspect
+import json
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import beanmachine.ppl.compiler.bmg_nodes as bn
+import beanmachine.ppl.compiler.bmg_types as bt
+import torch
+from beanmachine import __version__
+from beanmachine.graph import Graph
+from beanmachine.ppl.compiler.bm_graph_builder import rv_to_query
+from beanmachine.ppl.compiler.gen_bmg_graph import GeneratedGraph
+from beanmachine.ppl.compiler.gen_bmg_python import GeneratedGraphPython
+from beanmachine.ppl.compiler.lattice_typer import LatticeTyper
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.utils.memoize import MemoizationKey, tensor_to_tuple
+
+
+_conversions: Dict[str, Callable[[Any], Any]] = {
+    "bool": bool,
+    "int": int,
+    "float": float,
+}
+
+
+class _ObservationBinding(NamedTuple):
+    # The id of the observed node in the BMG graph
+    graph_id: int
+    # The position of the observed random variable in the observations dictionary
+    position: int
+    # The row-major index of the observed element, if the observation was
+    # devectorized
+    element_index: Optional[int]
+    # The name of the conversion applied to the value by the observations fixer
+    conversion: Optional[str]
+    # The type of the observed sample
+    sample_type: bt.BMGMatrixType
+
+    def _to_json(self) -> List[Any]:
+        t = self.sample_type
+        return [
+            self.graph_id,
+            self.position,
+            self.element_index,
+            self.conversion,
+            [type(t).__name__, t.rows, t.columns],
+        ]
+
+    @staticmethod
+    def _from_json(b: List[Any]) -> "_ObservationBinding":
+        name, rows, columns = b[4]
+        return _ObservationBinding(*b[:4], getattr(bt, name)(rows, columns))
+
+
+class _CacheKey(NamedTuple):
+    digest: str
+    rvs: Tuple[MemoizationKey, ...]
+
+
+class CompiledGraph:
+    """A BMG graph which can be re-observed with new values."""
+
+    graph: Graph
+    query_ids: List[int]
+    bindings: List[_ObservationBinding]
+
+    def __init__(
+        self, graph: Graph, query_ids: List[int], bindings: List[_ObservationBinding]
+    ) -> None:
+        self.graph = graph
+        self.query_ids = query_ids
+        self.bindings = bindings
+
+    def observe(self, observations: Dict[RVIdentifier, Any]) -> bool:
+        """Replace the observed values of the graph. The observations must
+        have the same structure as the observations the graph was compiled with.
+        Returns False, leaving the graph unchanged, if a value is impossible for
+        the sample it observes."""
+        values = list(observations.values())
+        bound_values = []
+        for binding in self.bindings:
+            value = values[binding.position]
+            if binding.element_index is not None:
+                value = value.reshape(-1)[binding.element_index]
+            value_type = bt.type_of_value(value)
+            if bt.supremum(value_type, binding.sample_type) != binding.sample_type:
+                return False
+            if binding.conversion is not None:
+                value = _conversions[binding.conversion](value)
+            bound_values.append(value)
+        self.graph.remove_observations()
+        for binding, value in zip(self.bindings, bound_values):
+            self.graph.observe(binding.graph_id, value)
+        return True
+
+    def rv_to_query_id(self, queries: List[RVIdentifier]) -> Dict[RVIdentifier, int]:
+        return dict(zip(queries, self.query_ids))
+
+    def _to_json(self, code: str) -> str:
+        return json.dumps(
+            {
+                "code": code,
+                "query_ids": self.query_ids,
+                "bindings": [b._to_json() for b in self.bindings],
+            }
+        )
+
+    @staticmethod
+    def _from_json(s: str) -> "CompiledGraph":
+        d = json.loads(s)
+        namespace = {}
+        exec(d["code"], namespace)
+        bindings = [_ObservationBinding._from_json(b) for b in d["bindings"]]
+        return CompiledGraph(namespace["g"], d["query_ids"], bindings)
+
+
+def _numel(value: Any) -> int:
+    return value.numel() if isinstance(value, torch.Tensor) else 1
+
+
+def _compiled_graph(
+    generated_graph: GeneratedGraph,
+    queries: List[RVIdentifier],
+    observations: Dict[RVIdentifier, Any],
+) -> Optional[CompiledGraph]:
+    # Returns None if the observations in the generated graph cannot be
+    # traced back to the observations supplied by the user.
+    bmg = generated_graph.bmg
+    node_to_graph_id = generated_graph.node_to_graph_id
+    positions = {rv: i for i, rv in enumerate(observations)}
+    observed_elements: Dict[RVIdentifier, Set[Optional[int]]] = {
+        rv: set() for rv in observations
+    }
+    bindings = []
+    typer = LatticeTyper()
+    for o in bmg.all_observations():
+        rv = o.rv_identifier
+        if rv not in positions or o.observed not in node_to_graph_id:
+            return None
+        sample_type = typer[o.observed]
+        if not isinstance(sample_type, bt.BMGMatrixType):
+            return None
+        observed_elements[rv].add(o.element_index)
+        conversion = type(o.value).__name__
+        bindings.append(
+            _ObservationBinding(
+                node_to_graph_id[o.observed],
+                positions[rv],
+                o.element_index,
+                conversion if conversion in _conversions else None,
+                sample_type,
+            )
+        )
+
+    # If a rewriter removed an observation then its value has been folded into
+    # the graph and we cannot re-observe it.
+    for rv, value in observations.items():
+        elements = observed_elements[rv]
+        if None not in elements and elements != set(range(_numel(value))):
+            return None
+
+    rv_to_query_map = rv_to_query(bmg)
+    query_to_query_id = generated_graph.query_to_query_id
+    query_ids = [query_to_query_id[rv_to_query_map[rv]] for rv in queries]
+    return CompiledGraph(generated_graph.graph, query_ids, bindings)
+
+
+def _to_python(generated_graph: GeneratedGraph) -> str:
+    # Produces Python code which rebuilds the generated graph without any
+    # observations. The nodes are generated in the same order as in
+    # gen_bmg_graph, so the node and query ids of the two graphs agree.
+    gp = GeneratedGraphPython(generated_graph.bmg)
+    for node in generated_graph.bmg.all_ancestor_nodes():
+        if not isinstance(node, bn.Observation):
+            gp._generate_node(node)
+    return "\n".join(gp._code)
+
+
+def _source_digest(f: Callable) -> str:
+    module = inspect.getmodule(f)
+    try:
+        source = inspect.getsource(module if module is not None else f)
+    except (OSError, TypeError):
+        try:
+            source = inspect.getsource(f)
+        except (OSError, TypeError):
+            source = f.__qualname__
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def _rv_description(rv: RVIdentifier) -> str:
+    arguments = tuple(
+        tensor_to_tuple(a) if isinstance(a, torch.Tensor) else a for a in rv.arguments
+    )
+    return f"{rv.wrapper.__module__}.{rv.wrapper.__qualname__}{arguments!r}"
+
+
+def _value_description(value: Any) -> str:
+    if isinstance(value, torch.Tensor):
+        return f"{tuple(value.shape)}:{value.dtype}"
+    return type(value).__name__
+
+
+class CompilationCache:
+    """
+    A cache of compiled BMG graphs, keyed by the model source and the
+    structure of the queries and observations. Pass an instance to
+    ``BMGInference`` to skip compilation when the same model is run again
+    with new observed values.
+
+    Args:
+        cache_dir: Optional directory in which compiled graphs are persisted.
+            Only use directories you trust, since the cached graphs are stored
+            as Python code which is executed when loaded.
+    """
+
+    cache_dir: Optional[str]
+    hits: int
+    misses: int
+    _entries: Dict[_CacheKey, CompiledGraph]
+
+    def __init__(self, cache_dir: Optional[str] = None) -> None:
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Remove all in-memory entries. Entries on disk are left untouched."""
+        self._entries.clear()
+
+    def make_key(
+        self,
+        queries: List[RVIdentifier],
+        observations: Dict[RVIdentifier, Any],
+        skip_optimizations: Set[str],
+        fix_observe_true: bool,
+    ) -> _CacheKey:
+        rvs = list(queries) + list(observations)
+        h = hashlib.sha256()
+        h.update(__version__.encode())
+        for digest in sorted({_source_digest(rv.function) for rv in rvs}):
+            h.update(digest.encode())
+        for rv in queries:
+            h.update(f"query {_rv_description(rv)}\n".encode())
+        for rv, value in observations.items():
+            description = f"{_rv_description(rv)}={_value_description(value)}"
+            h.update(f"observation {description}\n".encode())
+        h.update(f"skip {sorted(skip_optimizations)}\n".encode())
+        h.update(f"fix_observe_true {fix_observe_true}\n".encode())
+        return _CacheKey(
+            h.hexdigest(),
+            tuple(MemoizationKey(rv.wrapper, rv.arguments) for rv in rvs),
+        )
+
+    def _path(self, key: _CacheKey) -> str:
+        assert self.cache_dir is not None
+        return os.path.join(self.cache_dir, key.digest + ".json")
+
+    def get(self, key: _CacheKey) -> Optional[CompiledGraph]:
+        """Returns the compiled graph for the key, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is None and self.cache_dir is not None:
+            path = self._path(key)
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    entry = CompiledGraph._from_json(f.read())
+                self._entries[key] = entry
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(
+        self,
+        key: _CacheKey,
+        generated_graph: GeneratedGraph,
+        queries: List[RVIdentifier],
+        observations: Dict[RVIdentifier, Any],
+    ) -> Optional[CompiledGraph]:
+        """Adds a freshly generated graph to the cache. Returns None if the
+        graph cannot be re-observed and was therefore not cached."""
+        entry = _compiled_graph(generated_graph, queries, observations)
+        if entry is None:
+            return None
+        self._entries[key] = entry
+        if self.cache_dir is not None:
+            path = self._path(key)
+            # Write to a temporary file first so that concurrent readers never
+            # see a partially written entry.
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(entry._to_json(_to_python(generated_graph)))
+            os.replace(tmp_path, path)
+        return entry
@@ -39,6 +39,8 @@ class Cloner:
         self.bmg_original = original
         self.bmg = BMGraphBuilder(ExecutionContext())
         self.bmg._fix_observe_true = self.bmg_original._fix_observe_true
+        # keep profiling the passes which run on the copy
+        self.bmg._pd = self.bmg_original._pd
         self.sizer = Sizer()
         self.node_factories = _node_factories(self.bmg)
         self.value_factories = _constant_factories(self.bmg)
@@ -56,7 +58,12 @@ class Cloner:
             assert len(parents) == 1
             sample = parents[0]
             if isinstance(sample, bn.SampleNode):
-                image = self.bmg.add_observation(sample, original.value)
+                image = self.bmg.add_observation(
+                    sample,
+                    original.value,
+                    original.rv_identifier,
+                    original.element_index,
+                )
             else:
                 raise ValueError("observations must have a sample operand")
         elif isinstance(original, bn.Query):
@@ -568,18 +568,20 @@ class Devectorizer(NodeTransformer):
             return self.__flatten_parents_with_index(
                 node,
                 parents,
-                lambda i, s: self.__add_observation(s, i, values),
+                lambda i, s: self.__add_observation(s, i, values, node),
             )
         else:
             raise NotImplementedError()
 
     def __add_observation(
-        self, inputs: List[bn.BMGNode], i: int, value: List
+        self, inputs: List[bn.BMGNode], i: int, value: List, original: bn.Observation
     ) -> bn.Observation:
         assert len(inputs) == 1
         sample = inputs[0]
         if isinstance(sample, bn.SampleNode):
-            return self.cloner.bmg.add_observation(sample, value[i])
+            return self.cloner.bmg.add_observation(
+                sample, value[i], original.rv_identifier, i
+            )
         else:
             raise ValueError("expected a sample as a parent to an observation")
 
@@ -40,12 +40,12 @@ from beanmachine.ppl.compiler.fix_observe_true import observe_true_fixer
 from beanmachine.ppl.compiler.fix_problem import (
     ancestors_first_graph_fixer,
     conditional_graph_fixer,
-    fixpoint_graph_fixer,
     GraphFixer,
     GraphFixerResult,
     node_fixer_first_match,
     NodeFixer,
     sequential_graph_fixer,
+    worklist_graph_fixer,
 )
 from beanmachine.ppl.compiler.fix_requirements import requirements_fixer
 from beanmachine.ppl.compiler.fix_transpose import identity_transpose_fixer
@@ -69,27 +69,31 @@ def arithmetic_graph_fixer(skip: Set[str]) -> GraphFixer:
     typer = LatticeTyper()
 
     def _arithmetic_graph_fixer(bmg: BMGraphBuilder) -> GraphFixerResult:
-        node_fixers = [
-            addition_fixer(bmg, typer),
-            bool_arithmetic_fixer(bmg, typer),
-            bool_comparison_fixer(bmg, typer),
-            log1mexp_fixer(bmg, typer),
-            logsumexp_fixer(bmg),
-            multiary_addition_fixer(bmg),
-            multiary_multiplication_fixer(bmg),
-            neg_neg_fixer(bmg),
-            negative_real_multiplication_fixer(bmg, typer),
-            nested_if_same_cond_fixer(bmg),
-            nested_matrix_scale_fixer(bmg),
-            sum_fixer(bmg, typer),
-            trivial_matmul_fixer(bmg, typer),
-            unsupported_node_fixer(bmg, typer),
-            identity_transpose_fixer(bmg, typer),
-        ]
-        node_fixers = [nf for nf in node_fixers if nf.__name__ not in skip]
-        node_fixer = node_fixer_first_match(node_fixers)
-        arith = ancestors_first_graph_fixer(typer, node_fixer)
-        return fixpoint_graph_fixer(arith)(bmg)
+        node_fixers = {
+            "addition_fixer": addition_fixer(bmg, typer),
+            "bool_arithmetic_fixer": bool_arithmetic_fixer(bmg, typer),
+            "bool_comparison_fixer": bool_comparison_fixer(bmg, typer),
+            "log1mexp_fixer": log1mexp_fixer(bmg, typer),
+            "logsumexp_fixer": logsumexp_fixer(bmg),
+            "multiary_addition_fixer": multiary_addition_fixer(bmg),
+            "multiary_multiplication_fixer": multiary_multiplication_fixer(bmg),
+            "neg_neg_fixer": neg_neg_fixer(bmg),
+            "negative_real_multiplication_fixer": negative_real_multiplication_fixer(
+                bmg, typer
+            ),
+            "nested_if_same_cond_fixer": nested_if_same_cond_fixer(bmg),
+            "nested_matrix_scale_fixer": nested_matrix_scale_fixer(bmg),
+            "sum_fixer": sum_fixer(bmg, typer),
+            "trivial_matmul_fixer": trivial_matmul_fixer(bmg, typer),
+            "unsupported_node_fixer": unsupported_node_fixer(bmg, typer),
+            "identity_transpose_fixer": identity_transpose_fixer(bmg, typer),
+        }
+        node_fixers = {
+            name: nf
+            for name, nf in node_fixers.items()
+            if name not in skip and nf.__name__ not in skip
+        }
+        return worklist_graph_fixer(typer, node_fixers)(bmg)
 
     return _arithmetic_graph_fixer
 
@@ -21,11 +21,14 @@ class Event:
     begin: bool
     kind: str
     timestamp: int
+    # The number of calls a begin event stands for; see ProfilerData.record
+    calls: int
 
-    def __init__(self, begin: bool, kind: str, timestamp: int) -> None:
+    def __init__(self, begin: bool, kind: str, timestamp: int, calls: int = 1) -> None:
         self.begin = begin
         self.kind = kind
         self.timestamp = timestamp
+        self.calls = calls
 
     def __str__(self) -> str:
         s = "begin" if self.begin else "finish"
@@ -37,12 +40,14 @@ class ProfileReport:
     total_time: int
     children: Dict[str, "ProfileReport"]
     parent: Optional["ProfileReport"]
+    counts: Dict[str, int]
 
     def __init__(self) -> None:
         self.calls = 0
         self.total_time = 0
         self.children = {}
         self.parent = None
+        self.counts = {}
 
     def _to_string(self, indent: str) -> str:
         s = ""
@@ -56,6 +61,8 @@ class ProfileReport:
             attributed += value.total_time
         if self.parent is None:
             s += "Total time: " + str(attributed // 1000000) + " ms\n"
+            for key, value in self.counts.items():
+                s += f"{key}: {value}\n"
         elif len(self.children) > 0:  # and self.total_time > 0:
             unattributed = self.total_time - attributed
             s += f"{indent}unattributed: {abs(unattributed // 1000000)} ms\n"
@@ -68,10 +75,12 @@ class ProfileReport:
 class ProfilerData:
     events: List[Event]
     in_flight: List[Event]
+    counts: Dict[str, int]
 
     def __init__(self) -> None:
         self.events = []
         self.in_flight = []
+        self.counts = {}
 
     def begin(self, kind: str, timestamp: Optional[int] = None) -> None:
 
@@ -89,6 +98,21 @@ class ProfilerData:
             if top.kind == kind:
                 break
 
+    def record(
+        self, kind: str, calls: int, total_time: int, timestamp: Optional[int] = None
+    ) -> None:
+        """Records that there were a number of calls of the given kind, which took
+        total_time nanoseconds altogether, ending at the given time. This is for
+        frequent short calls, which are timed by the caller, and are too many to
+        record individually."""
+        t = time.time_ns() if timestamp is None else timestamp
+        self.events.append(Event(True, kind, t - total_time, calls))
+        self.events.append(Event(False, kind, t))
+
+    def increment(self, kind: str, amount: int = 1) -> None:
+        """Adds to a counter, such as the number of times some rewrite happened"""
+        self.counts[kind] = self.counts.get(kind, 0) + amount
+
     def __str__(self) -> str:
         return "\n".join(str(e) for e in self.events)
 
@@ -119,7 +143,9 @@ class ProfilerData:
         return total_time
 
     def to_report(self) -> ProfileReport:
-        return event_list_to_report(self.events)
+        report = event_list_to_report(self.events)
+        report.counts = dict(self.counts)
+        return report
 
 
 def event_list_to_report(events) -> ProfileReport:
@@ -135,7 +161,8 @@ def event_list_to_report(events) -> ProfileReport:
                 p.parent = current
                 current.children[e.kind] = p
                 setattr(current, e.kind, p)
-            p.calls += 1
+            # Events deserialized from a BMG performance report have no calls
+            p.calls += getattr(e, "calls", 1)
             current = p
             begins.append(e)
         else:
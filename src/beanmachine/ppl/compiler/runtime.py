@@ -708,7 +708,7 @@ class BMGRuntime:
         for rv, val in observations.items():
             node = self._rv_to_node(rv)
             assert isinstance(node, bn.SampleNode)
-            self._bmg.add_observation(node, val)
+            self._bmg.add_observation(node, val, rv)
         for qrv in queries:
             node = self._rv_to_node(qrv)
             self._bmg.add_query(node, qrv)
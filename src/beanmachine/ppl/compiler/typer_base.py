@@ -50,8 +50,8 @@
 # required typing *their* inputs, we know that all ancestor nodes are typed.
 
 from abc import ABC, abstractmethod
-from queue import Queue
-from typing import Dict, Generic, TypeVar
+from collections import deque
+from typing import Deque, Dict, Generic, TypeVar
 
 import beanmachine.ppl.compiler.bmg_nodes as bn
 
@@ -124,6 +124,7 @@ class TyperBase(ABC, Generic[T]):
         # of its outputs.  Propagate the change to outputs, and
         # then to their outputs, and so on.
         if current_type != new_type:
+            bn.mark_modified(node)
             self._propagate_update_to_outputs(node)
 
     def _propagate_update_to_outputs(self, node: bn.BMGNode) -> None:
@@ -144,13 +145,13 @@ class TyperBase(ABC, Generic[T]):
         # We require that this algorithm, like all algorithms that traverse the
         # graph, be non-recursive.
 
-        work = Queue()
+        work: Deque[bn.BMGNode] = deque()
         for o in node.outputs.items:
             if o in self._nodes:
-                work.put(o)
+                work.append(o)
 
-        while work.qsize() > 0:
-            cur = work.get()
+        while len(work) > 0:
+            cur = work.popleft()
             assert cur in self._nodes
             current_type = self[cur]
             assert self._inputs_known(cur)
@@ -158,9 +159,10 @@ class TyperBase(ABC, Generic[T]):
             self._nodes[cur] = new_type
             if current_type == new_type:
                 continue
+            bn.mark_modified(cur)
             for o in cur.outputs.items:
                 if o in self._nodes:
-                    work.put(o)
+                    work.append(o)
 
     def _update_node_inputs_not_known(self, node: bn.BMGNode) -> None:
         # Preconditions:
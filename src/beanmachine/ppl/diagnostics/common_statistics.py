@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import math
 import warnings
 from typing import Optional, Tuple
 
@@ -74,6 +75,21 @@ def split_r_hat(query_samples: Tensor) -> Optional[Tensor]:
     return torch.sqrt(var_hat / w)
 
 
+def _initial_positive_sum(rho: Tensor) -> Tensor:
+    """
+    Geyer's initial positive sequence estimate of the sum of the autocorrelations
+    rho, of shape (lags, *query_dim): they are summed in pairs of consecutive lags,
+    up to the first pair with a negative sum, for all dimensions at once.
+    """
+    n_lags, *query_dim = rho.shape
+    num_pairs = n_lags // 2
+    rho_pairs = rho.narrow(0, 0, 2 * num_pairs).reshape(num_pairs, 2, *query_dim)
+    rho_pairs = rho_pairs.sum(dim=1)
+    # a NaN does not end the sequence, so that it propagates to the result
+    is_initial = (~(rho_pairs < 0)).cumprod(dim=0).bool()
+    return torch.where(is_initial, rho_pairs, torch.zeros_like(rho_pairs)).sum(0)
+
+
 def effective_sample_size(query_samples: Tensor) -> Tensor:
     n_chains, n_samples, *query_dim = query_samples.shape
 
@@ -109,25 +125,83 @@ def effective_sample_size(query_samples: Tensor) -> Tensor:
         rho = rho_avg / var_hat
     rho[0] = 1
 
-    # reshape to 2d matrix where each row contains all samples for specific dim
-    rho_2d = torch.stack(torch.unbind(rho, dim=0), dim=-1).reshape(-1, n_samples)
-    rho_sum = torch.zeros(rho_2d.shape[0])
-
-    for i, chain in enumerate(torch.unbind(rho_2d, dim=0)):
-        total_sum = torch.tensor(0.0, dtype=samples.dtype)
-        for t in range(n_samples // 2):
-            rho_even = chain[2 * t]
-            rho_odd = chain[2 * t + 1]
-            if rho_even + rho_odd < 0:
-                break
-            else:
-                total_sum += rho_even + rho_odd
-        rho_sum[i] = total_sum
-
-    rho_sum = torch.reshape(rho_sum, query_dim)
-    tau = -1 + 2 * rho_sum
+    tau = -1 + 2 * _initial_positive_sum(rho)
     n_eff = torch.div(n_chains * n_samples, tau)
     if n_eff.isnan().any():
         warnings.warn("NaN encountered in computing effective sample size.")
         return torch.tensor(0.0)
     return n_eff
+
+
+def _split_chains(query_samples: Tensor) -> Tensor:
+    """Splits each chain into its first and second half, as for `split_r_hat`"""
+    n_samples = query_samples.shape[1] // 2
+    return torch.cat(torch.split(query_samples, n_samples, dim=1)[0:2])
+
+
+def rank_normalize(query_samples: Tensor) -> Tensor:
+    """
+    Replaces the samples with the normal scores of their ranks among the samples of
+    all chains, separately for every dimension of the query, as in [1]. Tied samples
+    get the average of their ranks.
+
+    [1] Vehtari et al. `Rank-normalization, folding, and localization: An improved
+        R-hat for assessing convergence of MCMC` (2021).
+    """
+    n_chains, n_samples, *query_dim = query_samples.shape
+    if query_samples.dtype not in [torch.float32, torch.float64]:
+        query_samples = query_samples.float()
+    # one row of pooled samples per dimension of the query
+    pooled = query_samples.reshape(n_chains * n_samples, -1).transpose(0, 1)
+    pooled = pooled.contiguous()
+    sorted_pooled = pooled.sort(dim=-1).values
+    num_less = torch.searchsorted(sorted_pooled, pooled)
+    num_less_or_equal = torch.searchsorted(sorted_pooled, pooled, right=True)
+    ranks = (num_less + num_less_or_equal + 1).to(pooled.dtype) / 2
+    n_total = n_chains * n_samples
+    normal = torch.distributions.Normal(
+        torch.tensor(0.0, dtype=pooled.dtype), torch.tensor(1.0, dtype=pooled.dtype)
+    )
+    scores = normal.icdf((ranks - 3 / 8) / (n_total + 1 / 4))
+    return scores.transpose(0, 1).reshape(query_samples.shape)
+
+
+def bulk_effective_sample_size(query_samples: Tensor) -> Tensor:
+    """
+    The effective sample size of the rank normalized split chains [1], which is
+    robust to heavy tails and sensitive to chains that have not mixed.
+
+    [1] Vehtari et al. `Rank-normalization, folding, and localization: An improved
+        R-hat for assessing convergence of MCMC` (2021).
+    """
+    return effective_sample_size(rank_normalize(_split_chains(query_samples)))
+
+
+def tail_effective_sample_size(query_samples: Tensor, prob: float = 0.05) -> Tensor:
+    """
+    The effective sample size of the tails of the distribution [1], i.e. the minimum
+    of the effective sample sizes of the indicators of the split chains being below
+    their `prob` and `1 - prob` quantiles.
+
+    [1] Vehtari et al. `Rank-normalization, folding, and localization: An improved
+        R-hat for assessing convergence of MCMC` (2021).
+    """
+    query_samples = _split_chains(query_samples)
+    n_chains, n_samples, *query_dim = query_samples.shape
+    if query_samples.dtype not in [torch.float32, torch.float64]:
+        query_samples = query_samples.float()
+    n_total = n_chains * n_samples
+    # torch.quantile is limited to 16M elements, so interpolate linearly between
+    # the order statistics along the draw dimension, as it does
+    sorted_pooled = query_samples.reshape(n_total, *query_dim).sort(dim=0).values
+    quantiles = []
+    for p in [prob, 1 - prob]:
+        position = p * (n_total - 1)
+        below = math.floor(position)
+        above = min(below + 1, n_total - 1)
+        quantiles.append(
+            torch.lerp(sorted_pooled[below], sorted_pooled[above], position - below)
+        )
+    lower = effective_sample_size((query_samples <= quantiles[0]).to(sorted_pooled))
+    upper = effective_sample_size((query_samples <= quantiles[1]).to(sorted_pooled))
+    return torch.minimum(lower, upper)
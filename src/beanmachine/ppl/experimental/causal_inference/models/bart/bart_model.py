@@ -9,8 +9,9 @@ from __future__ import annotations
 import math
 
 from copy import deepcopy
-from typing import cast, List, Optional, Tuple
+from typing import Any, cast, Dict, List, Optional, Tuple
 
+import numpy as np
 import torch
 
 from beanmachine.ppl.experimental.causal_inference.models.bart.exceptions import (
@@ -23,6 +24,9 @@ from beanmachine.ppl.experimental.causal_inference.models.bart.grow_prune_tree_p
     GrowPruneTreeProposer,
 )
 from beanmachine.ppl.experimental.causal_inference.models.bart.node import LeafNode
+from beanmachine.ppl.experimental.causal_inference.models.bart.packed_trees import (
+    PackedTrees,
+)
 from beanmachine.ppl.experimental.causal_inference.models.bart.scalar_samplers import (
     LeafMean,
     NoiseStandardDeviation,
@@ -31,8 +35,26 @@ from beanmachine.ppl.experimental.causal_inference.models.bart.split_rule import
     CompositeRules,
 )
 from beanmachine.ppl.experimental.causal_inference.models.bart.tree import Tree
+from torch import multiprocessing as mp
 from torch.distributions.dirichlet import Dirichlet
 from tqdm.auto import trange
+from typing_extensions import Literal
+
+
+def _run_chain(
+    model: "BART",
+    X: torch.Tensor,
+    y: torch.Tensor,
+    num_samples: int,
+    num_burn: int,
+    seed: int,
+    shared_data: Dict[str, torch.Tensor],
+) -> Dict[str, Any]:
+    """Fit a single chain of the model in a worker process and return its samples."""
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    model._fit_chain(X, y, num_samples=num_samples, num_burn=num_burn, **shared_data)
+    return model.samples
 
 
 class BART:
@@ -72,6 +94,7 @@ class BART:
 
         self.num_trees = num_trees
         self.num_samples = None
+        self.num_chains = 1
         self.all_tree_predictions = None
         self._all_trees = None
         self.leaf_mean = None
@@ -114,12 +137,100 @@ class BART:
         y: torch.Tensor,
         num_samples: int = 1000,
         num_burn: int = 250,
+        num_chains: int = 1,
+        mp_context: Optional[Literal["fork", "spawn", "forkserver"]] = None,
     ) -> BART:
         """Fit the training data and learn the parameters of the model.
 
         Args:
             X: Training data / covariate matrix of shape (num_observations, input_dimensions).
             y: Response vector of shape (num_observations, 1).
+            num_samples: Number of post burnin samples to draw in each chain.
+            num_burn: Number of burnin samples to draw in each chain.
+            num_chains: Number of independent chains. More than one chain are run in parallel worker processes,
+                which share the training data through shared memory; see `get_posterior_predictive_chains`.
+            mp_context: The multiprocessing context used to run the chains in parallel.
+        """
+        if num_chains > 1:
+            return self._fit_chains(X, y, num_samples, num_burn, num_chains, mp_context)
+        self.num_chains = 1
+        return self._fit_chain(X, y, num_samples=num_samples, num_burn=num_burn)
+
+    def _fit_chains(
+        self,
+        X: torch.Tensor,
+        y: torch.Tensor,
+        num_samples: int,
+        num_burn: int,
+        num_chains: int,
+        mp_context: Optional[str],
+    ) -> BART:
+        """Fit independent chains in parallel worker processes and pool their samples.
+
+        Args:
+            X: Training data / covariate matrix of shape (num_observations, input_dimensions).
+            y: Response vector of shape (num_observations, 1).
+            num_samples: Number of post burnin samples to draw in each chain.
+            num_burn: Number of burnin samples to draw in each chain.
+            num_chains: Number of chains.
+            mp_context: The multiprocessing context used to run the chains.
+        """
+        # The workers only read the training data, and whatever is computed from it
+        # once for all chains, so they share it rather than each getting a copy.
+        X.share_memory_()
+        y.share_memory_()
+        shared_data = {
+            name: value.share_memory_() for name, value in self._shared_data(X).items()
+        }
+        seeds = torch.randint(2**31 - 1, (num_chains,)).tolist()
+        ctx = mp.get_context(mp_context)
+        with ctx.Pool(processes=num_chains) as pool:
+            all_samples = pool.starmap(
+                _run_chain,
+                [
+                    (self, X, y, num_samples, num_burn, seed, shared_data)
+                    for seed in seeds
+                ],
+            )
+
+        self._load_data(X, y)
+        self.num_samples = num_samples
+        self.num_chains = num_chains
+        # the draws of all chains, chain by chain
+        self.samples = {
+            key: (
+                PackedTrees.concatenate([samples[key] for samples in all_samples])
+                if key == "trees"
+                else [value for samples in all_samples for value in samples[key]]
+            )
+            for key in all_samples[0]
+        }
+        self.num_trees = self.samples["trees"].num_trees
+        return self
+
+    def _shared_data(self, X: torch.Tensor) -> Dict[str, torch.Tensor]:
+        """
+        Data computed from the training data once for all chains, which is passed to `_fit_chain`.
+
+        Args:
+            X: Training data / covariate matrix of shape (num_observations, input_dimensions).
+        """
+        return {}
+
+    def _fit_chain(
+        self,
+        X: torch.Tensor,
+        y: torch.Tensor,
+        num_samples: int,
+        num_burn: int,
+    ) -> BART:
+        """Fit a single chain.
+
+        Args:
+            X: Training data / covariate matrix of shape (num_observations, input_dimensions).
+            y: Response vector of shape (num_observations, 1).
+            num_samples: Number of post burnin samples to draw.
+            num_burn: Number of burnin samples to draw.
         """
         self.num_samples = num_samples
         self._load_data(X, y)
@@ -130,12 +241,14 @@ class BART:
         )
         self._init_trees(X)
 
+        packed_trees = []
         for iter_id in trange(num_burn + num_samples):
             trees, sigma = self._step()
             self._all_trees = trees
             if iter_id >= num_burn:
-                self.samples["trees"].append(trees)
+                packed_trees.append(PackedTrees.from_trees([trees]))
                 self.samples["sigmas"].append(sigma)
+        self.samples["trees"] = PackedTrees.concatenate(packed_trees)
         return self
 
     def _load_data(self, X: torch.Tensor, y: torch.Tensor):
@@ -197,20 +310,16 @@ class BART:
         self._all_trees = []
         num_dims = X.shape[-1]
         num_points = X.shape[0]
+        all_ids = torch.arange(num_points)
         for _ in range(self.num_trees):
-            self._all_trees.append(
-                Tree(
-                    nodes=[
-                        LeafNode(
-                            val=self.leaf_mean.sample_prior(),
-                            composite_rules=CompositeRules(
-                                all_dims=list(range(num_dims))
-                            ),
-                            depth=0,
-                        )
-                    ]
-                )
+            root_node = LeafNode(
+                val=self.leaf_mean.sample_prior(),
+                composite_rules=CompositeRules(all_dims=list(range(num_dims))),
+                depth=0,
             )
+            # every node grown from the root keeps track of the rows of X it holds
+            root_node.cache_observations(X, all_ids)
+            self._all_trees.append(Tree(nodes=[root_node]))
         self.all_tree_predictions = torch.zeros(
             (num_points, self.num_trees, 1), dtype=torch.float
         )
@@ -225,11 +334,15 @@ class BART:
         if self.X is None or self.y is None:
             raise NotInitializedError("No training data")
 
-        new_trees = [deepcopy(tree) for tree in self._all_trees]
-        all_tree_predictions = deepcopy(self.all_tree_predictions)
+        # The sampled trees are kept, so mutate copies of them. The copies share the
+        # rules and cached observations of the nodes, which never change.
+        new_trees = [tree.copy() for tree in self._all_trees]
+        # The predictions are not kept, so they can be updated in place, along with
+        # their sum over all trees.
+        all_tree_predictions = self.all_tree_predictions
+        # all_tree_predictions.shape -> (num_observations, num_trees, 1)
+        current_predictions = torch.sum(all_tree_predictions, dim=1)
         for tree_id in range(len(new_trees)):
-            # all_tree_predictions.shape -> (num_observations, num_trees, 1)
-            current_predictions = torch.sum(all_tree_predictions, dim=1)
             last_iter_tree_prediction = all_tree_predictions[:, tree_id]
             partial_residual = self.y - current_predictions + last_iter_tree_prediction
             new_trees[tree_id] = self.tree_sampler.propose(
@@ -242,9 +355,10 @@ class BART:
                 leaf_mean_prior_scale=self.leaf_mean_prior_scale,
             )
             self._update_leaf_mean(new_trees[tree_id], partial_residual)
-            all_tree_predictions[:, tree_id] = new_trees[tree_id].predict(self.X)
-        self.all_tree_predictions = all_tree_predictions
-        self._update_sigma(self.y - torch.sum(all_tree_predictions, dim=1))
+            new_tree_prediction = new_trees[tree_id].predict(self.X)
+            current_predictions += new_tree_prediction - last_iter_tree_prediction
+            all_tree_predictions[:, tree_id] = new_tree_prediction
+        self._update_sigma(self.y - current_predictions)
         return new_trees, self.sigma.val
 
     def _update_leaf_mean(self, tree: Tree, partial_residual: torch.Tensor):
@@ -371,13 +485,27 @@ class BART:
         Returns:
             posterior_predictive_samples: Samples from the predictive distribution P(y|X) of shape (num_observations, num_samples).
         """
-        posterior_predictive_samples = []
-        for sample_id in range(self.num_samples):
-            single_prediction_sample = self._inverse_scale(
-                self._predict_step(X=X, trees=self.samples["trees"][sample_id])
-            )  # ( torch.Size(num_observations, 1) )
-            posterior_predictive_samples.append(single_prediction_sample)
-        return torch.concat(posterior_predictive_samples, dim=-1)
+        if self.samples is None:
+            raise NotInitializedError("Model not trained")
+        # the samples of trees are packed into arrays, which predict for all of the
+        # samples at once
+        return self._inverse_scale(self.samples["trees"].predict(X))
+
+    def get_posterior_predictive_chains(self, X: torch.Tensor) -> torch.Tensor:
+        """
+        Returns samples from the posterior predictive distribution P(y|X), chain by chain, in the form
+        taken by diagnostics such as `r_hat` and `effective_sample_size`.
+
+        Args:
+            X: Covariate matrix to predict on of shape (num_observations, input_dimensions).
+
+        Returns:
+            posterior_predictive_chains: Samples of shape (num_chains, num_samples, num_observations).
+        """
+        posterior_predictive_samples = self.get_posterior_predictive_samples(X)
+        return posterior_predictive_samples.reshape(
+            len(X), self.num_chains, -1
+        ).permute(1, 2, 0)
 
     @property
     def leaf_mean_prior_scale(self):
@@ -451,6 +579,7 @@ class XBART(BART):
         else:
             raise NotImplementedError("tree_sampler not implemented")
         self._step = self._grow_from_root_step
+        self._O_ = None
         self.var_counts = None
         self.all_tree_var_counts = None
 
@@ -460,6 +589,8 @@ class XBART(BART):
         y: torch.Tensor,
         num_samples: int = 25,
         num_burn: int = 15,
+        num_chains: int = 1,
+        mp_context: Optional[Literal["fork", "spawn", "forkserver"]] = None,
     ) -> XBART:
         """Fit the training data and learn the parameters of the model.
 
@@ -467,14 +598,60 @@ class XBART(BART):
         [1] He J., Yalov S., Hahn P.R. (2018). "XBART: Accelerated Bayesian Additive Regression Trees"
         https://arxiv.org/abs/1810.02215
 
+        Args:
+            X: Training data / covariate matrix of shape (num_observations, input_dimensions).
+            y: Response vector of shape (num_observations, 1).
+            num_samples: Number of post burnin samples to draw in each chain.
+            num_burn: Number of burnin samples to draw (for adaptation) in each chain.
+            num_chains: Number of independent chains. More than one chain are run in parallel worker processes,
+                which share the training data and its presorted index matrix through shared memory;
+                see `get_posterior_predictive_chains`.
+            mp_context: The multiprocessing context used to run the chains in parallel.
+        """
+        if num_chains > 1:
+            return cast(
+                XBART,
+                self._fit_chains(X, y, num_samples, num_burn, num_chains, mp_context),
+            )
+        self.num_chains = 1
+        return self._fit_chain(
+            X, y, num_samples=num_samples, num_burn=num_burn, **self._shared_data(X)
+        )
+
+    def _shared_data(self, X: torch.Tensor) -> Dict[str, torch.Tensor]:
+        """
+        The presorted index matrix of the training data, as discussed in section 3.2 of [1],
+        which every tree of every step of every chain grows from.
+
+        Reference:
+            [1] He J., Yalov S., Hahn P.R. (2018). "XBART: Accelerated Bayesian Additive Regression Trees"
+        https://arxiv.org/abs/1810.02215
+
+        Args:
+            X: Training data / covariate matrix of shape (num_observations, input_dimensions).
+        """
+        return {"O_": self.tree_sampler._presort(X)}
+
+    def _fit_chain(
+        self,
+        X: torch.Tensor,
+        y: torch.Tensor,
+        num_samples: int,
+        num_burn: int,
+        O_: Optional[torch.Tensor] = None,
+    ) -> XBART:
+        """Fit a single chain.
+
         Args:
             X: Training data / covariate matrix of shape (num_observations, input_dimensions).
             y: Response vector of shape (num_observations, 1).
             num_samples: Number of post burnin samples to draw.
             num_burn: Number of burnin samples to draw (for adaptation).
+            O_: The presorted index matrix of X, of shape (input_dimensions, num_observations).
         """
 
         self.num_samples = num_samples
+        self._O_ = O_
         self._load_data(X, y)
 
         if not self.num_trees > 0:
@@ -502,6 +679,7 @@ class XBART(BART):
 
         is_burnin_period = True
         num_dims_to_sample = self.X.shape[-1]
+        packed_trees = []
         for iter_id in trange(num_burn + num_samples):
             if iter_id >= num_burn:
                 is_burnin_period = False
@@ -509,7 +687,8 @@ class XBART(BART):
             trees = self._step(num_dims_to_sample=num_dims_to_sample)
             self._all_trees = trees
             if not is_burnin_period:
-                self.samples["trees"].append(trees)
+                packed_trees.append(PackedTrees.from_trees([trees]))
+        self.samples["trees"] = PackedTrees.concatenate(packed_trees)
         return self
 
     def _adaptively_init_num_trees(self):
@@ -578,6 +757,7 @@ class XBART(BART):
                 root_node=self._get_root_node(),
                 num_cuts=self.num_cuts,
                 num_null_cuts=self.num_null_cuts,
+                O_=self._O_,
             )
             new_trees.append(new_tree)
             self.var_counts += new_var_counts - self.all_tree_var_counts[tree_id]
@@ -4,7 +4,6 @@
 # LICENSE file in the root directory of this source tree.
 
 import math
-from collections import Counter
 from math import log
 from typing import cast, List, NamedTuple, Optional, Tuple
 
@@ -31,8 +30,10 @@ class CutPoint(NamedTuple):
 
 class SortedInvariants(NamedTuple):
     O_: torch.Tensor
-    uniq_vals: List[List[float]]
-    val_counts: List[Counter]
+    # the increasing unique values along every dimension
+    uniq_vals: List[torch.Tensor]
+    # the number of observations of each unique value along every dimension
+    val_counts: List[torch.Tensor]
 
 
 class GrowFromRootTreeProposer:
@@ -62,6 +63,7 @@ class GrowFromRootTreeProposer:
         root_node: LeafNode,
         num_cuts: int,
         num_null_cuts: int,
+        O_: Optional[torch.Tensor] = None,
     ) -> Tuple[Tree, torch.Tensor]:
         """
         Propose a new tree and modified Dirichlet weights based on the grow-from-root algorithm [1].
@@ -82,6 +84,7 @@ class GrowFromRootTreeProposer:
             root_node: Root of the tree to grow.
             num_cuts: Number of cuts to make along each dimensions.
             num_null_cuts: Weighting given to the no-split cut along each dimension as discussed in [1].
+            O_: (Optional) The presorted index matrix of X returned by `_presort`, if already computed.
 
         """
         if num_cuts <= 0:
@@ -93,7 +96,8 @@ class GrowFromRootTreeProposer:
             )
         self.num_null_cuts = num_null_cuts
 
-        O_ = self._presort(X)
+        if O_ is None:
+            O_ = self._presort(X)
         uniq_vals, val_counts = self._get_uniq_elems(X, O_)
         root_invariants = SortedInvariants(
             O_=O_, uniq_vals=uniq_vals, val_counts=val_counts
@@ -136,7 +140,9 @@ class GrowFromRootTreeProposer:
         O_ = torch.sort(X, 0)[-1]
         return torch.transpose(O_, dim0=0, dim1=1)
 
-    def _get_uniq_elems(self, X: torch.Tensor, O_: torch.Tensor) -> Tuple[list, list]:
+    def _get_uniq_elems(
+        self, X: torch.Tensor, O_: torch.Tensor
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
         """
         Get the unique values along every input dimension and the counts for each unique value.
 
@@ -146,19 +152,40 @@ class GrowFromRootTreeProposer:
                 of input data sorted along each dimension.
 
         """
-        num_dims, num_observations = O_.shape
+        return self._uniq_elems_of_sorted(self._sorted_values(X, O_))
+
+    def _sorted_values(self, X: torch.Tensor, O_: torch.Tensor) -> torch.Tensor:
+        """
+        Gather the input data in sorted order along every dimension.
+
+        Args:
+            X: Training data / covariate matrix of shape (num_observations, input_dimensions).
+            O_: Index matrix of shape (input_dimensions, num_observations) contained the indexes
+                of input data sorted along each dimension.
+
+        Returns:
+            A matrix of shape (input_dimensions, num_observations) whose row `d` is X[O_[d], d].
+        """
+        return torch.gather(torch.transpose(X, dim0=0, dim1=1), 1, O_)
+
+    def _uniq_elems_of_sorted(
+        self, sorted_vals: torch.Tensor
+    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+        """
+        Get the unique values and their counts along every dimension of data which is
+        already sorted along each dimension, such as the output of `_sorted_values`.
+
+        Args:
+            sorted_vals: Matrix of shape (input_dimensions, num_observations) whose rows are sorted.
+        """
         uniq_vals = []
         val_counts = []
-        for inp_dim in range(num_dims):
-            dim_uniq_vals = []
-            value_counter = Counter()
-            for obs in range(num_observations):
-                current_val = X[O_[inp_dim, obs], inp_dim].item()
-                if obs == 0 or (current_val > X[O_[inp_dim, obs - 1], inp_dim]):
-                    dim_uniq_vals.append(current_val)
-                value_counter[current_val] += 1
+        for dim_vals in sorted_vals:
+            dim_uniq_vals, dim_counts = torch.unique_consecutive(
+                dim_vals, return_counts=True
+            )
             uniq_vals.append(dim_uniq_vals)
-            val_counts.append(value_counter)
+            val_counts.append(dim_counts)
         return uniq_vals, val_counts
 
     def _grow_from_root(
@@ -290,7 +317,7 @@ class GrowFromRootTreeProposer:
     def _select_cutpoints(
         self,
         candidate_dims: List[int],
-        uniq_vals: List[List[float]],
+        uniq_vals: List[torch.Tensor],
     ) -> List[CutPoint]:
         """
         Select cutpoints along every dimension.
@@ -315,13 +342,11 @@ class GrowFromRootTreeProposer:
                 skip_val_freq = math.floor(
                     (len(uniq_vals[inp_dim]) - 2) / (self.num_cuts - 1)
                 )
-            curr_id = 0
             # all uniq vals except last get added to the bag
-            while curr_id < (len(uniq_vals[inp_dim]) - 1):
-                candidate_cuts.append(
-                    CutPoint(dim=inp_dim, cut_val=uniq_vals[inp_dim][curr_id])
-                )
-                curr_id += skip_val_freq
+            cut_vals = uniq_vals[inp_dim][: len(uniq_vals[inp_dim]) - 1 : skip_val_freq]
+            candidate_cuts.extend(
+                CutPoint(dim=inp_dim, cut_val=cut_val) for cut_val in cut_vals.tolist()
+            )
         return candidate_cuts
 
     def _sample_cut_point(
@@ -351,20 +376,19 @@ class GrowFromRootTreeProposer:
         """
         if len(candidate_cut_points) == 0:
             return None
-        selection_log_likelihoods = []
-        selection_probabs = []
         total_num_observations = invariants.O_.shape[-1]
-        total_residual = torch.sum(partial_residual[invariants.O_[0]]).item()
+        # residuals are accumulated in double precision, like python floats
+        residuals = partial_residual.reshape(-1).double()
+        total_residual = torch.sum(residuals[invariants.O_[0]])
         tau = leaf_sampler.prior_scale**2
         sigma2 = sigma_val**2
-        MAX_LOG_LIKELIHOOD = -float("inf")
 
         def _integrated_log_likelihood(
-            num_observations: int,
-            residual: float,
-        ) -> float:
+            num_observations: torch.Tensor,
+            residual: torch.Tensor,
+        ) -> torch.Tensor:
 
-            log_likelihood = +0.5 * log(
+            log_likelihood = +0.5 * torch.log(
                 (sigma2) / (sigma2 + tau * num_observations)
             ) + 0.5 * (tau * (residual**2)) / (
                 (sigma2) * (sigma2 + tau * num_observations)
@@ -377,65 +401,57 @@ class GrowFromRootTreeProposer:
 
         null_log_likelihood = (
             _integrated_log_likelihood(
-                num_observations=total_num_observations, residual=total_residual
+                num_observations=torch.tensor(
+                    total_num_observations, dtype=torch.float64
+                ),
+                residual=total_residual,
             )
             + log(kappa)
             + log(len(candidate_cut_points))
         )
-        if null_log_likelihood > MAX_LOG_LIKELIHOOD:
-            MAX_LOG_LIKELIHOOD = null_log_likelihood
-
-        selection_log_likelihoods.append(null_log_likelihood)
-
-        current_O_id_, current_uniq_val_id_ = 0, 0
-        residuals_le_cutpoint, num_obs_le_cutpoint = [], []
-        for cut_id, cut_point in enumerate(candidate_cut_points):
-            current_residual = 0.0
-            current_num_obs = 0
-
-            if cut_id == 0 or cut_point.dim != candidate_cut_points[cut_id - 1].dim:
-                residuals_le_cutpoint = []
-                num_obs_le_cutpoint = []
-                current_O_id_ = 0
-                current_uniq_val_id_ = 0
-            else:
-                current_residual += residuals_le_cutpoint[-1]
-                current_num_obs += num_obs_le_cutpoint[-1]
 
+        # The candidate cut points along each dimension are consecutive and in
+        # increasing order. For every dimension, the number of observations less than
+        # or equal to each unique value, and the sum of their residuals, are
+        # cumulative sums over the presorted observations; each cut point is a unique
+        # value, so look up its position among them.
+        num_obs_le_cutpoint, residuals_le_cutpoint = [], []
+        start = 0
+        while start < len(candidate_cut_points):
+            dim = candidate_cut_points[start].dim
+            end = start
             while (
-                invariants.uniq_vals[cut_point.dim][current_uniq_val_id_]
-                <= cut_point.cut_val
+                end < len(candidate_cut_points) and candidate_cut_points[end].dim == dim
             ):
-                num_ties = invariants.val_counts[cut_point.dim][
-                    invariants.uniq_vals[cut_point.dim][current_uniq_val_id_]
-                ]
-                current_num_obs += num_ties
-                for _ in range(num_ties):
-                    current_residual += partial_residual[
-                        invariants.O_[cut_point.dim, current_O_id_]
-                    ].item()
-                    current_O_id_ += 1
-                current_uniq_val_id_ += 1
-            residuals_le_cutpoint.append(current_residual)
-            num_obs_le_cutpoint.append(current_num_obs)
-            cut_point_log_likelihood = _integrated_log_likelihood(
-                num_observations=current_num_obs,
-                residual=current_residual,
-            ) + _integrated_log_likelihood(
-                num_observations=(total_num_observations - current_num_obs),
-                residual=(total_residual - current_residual),
+                end += 1
+            dim_uniq_vals = invariants.uniq_vals[dim]
+            cum_counts = torch.cumsum(invariants.val_counts[dim], 0)
+            cum_residuals = torch.cumsum(residuals[invariants.O_[dim]], 0)
+            cut_vals = torch.tensor(
+                [cut_point.cut_val for cut_point in candidate_cut_points[start:end]],
+                dtype=dim_uniq_vals.dtype,
+                device=dim_uniq_vals.device,
             )
-            if cut_point_log_likelihood > MAX_LOG_LIKELIHOOD:
-                MAX_LOG_LIKELIHOOD = cut_point_log_likelihood
-            selection_log_likelihoods.append(cut_point_log_likelihood)
+            uniq_ids = torch.searchsorted(dim_uniq_vals, cut_vals)
+            num_obs = cum_counts[uniq_ids]
+            num_obs_le_cutpoint.append(num_obs)
+            residuals_le_cutpoint.append(cum_residuals[num_obs - 1])
+            start = end
+        num_obs_le = torch.cat(num_obs_le_cutpoint).double()
+        residuals_le = torch.cat(residuals_le_cutpoint)
+        cut_point_log_likelihoods = _integrated_log_likelihood(
+            num_observations=num_obs_le,
+            residual=residuals_le,
+        ) + _integrated_log_likelihood(
+            num_observations=(total_num_observations - num_obs_le),
+            residual=(total_residual - residuals_le),
+        )
+        selection_log_likelihoods = torch.cat(
+            [null_log_likelihood.reshape(1), cut_point_log_likelihoods]
+        )
 
         # turn it into likelihoods
-        sum_ = 0.0
-        for log_likelihood in selection_log_likelihoods:
-            likelihood = math.exp(log_likelihood - MAX_LOG_LIKELIHOOD)
-            sum_ += likelihood
-            selection_probabs.append(likelihood)
-        selection_probabs = torch.tensor([_ / sum_ for _ in selection_probabs])
+        selection_probabs = torch.softmax(selection_log_likelihoods, 0).float()
 
         sampled_cut_id = cast(
             int, multinomial(input=selection_probabs, num_samples=1).item()
@@ -456,50 +472,29 @@ class GrowFromRootTreeProposer:
             invariants: The sorted index matrix and unique values and unique counts used to maintain sorted order.
             cut_point: The cut point to split along.
         """
-        num_dims, num_observations = invariants.O_.shape
-        O_left, O_right = [], []
-        uniq_vals_left, uniq_vals_right = [], []
-        val_counts_left, val_counts_right = [], []
-
-        for dim in range(num_dims):
-            dim_O_left, dim_O_right = [], []
-            dim_uniq_vals_left, dim_uniq_vals_right = [], []
-            dim_val_counts_left, dim_val_counts_right = Counter(), Counter()
-
-            for col in range(num_observations):
-                obs_id = invariants.O_[dim, col].item()
-                curr_observation_dim_val = X[obs_id, dim].item()
-
-                if X[obs_id, cut_point.dim] <= cut_point.cut_val:
-                    dim_O_left.append(obs_id)
-                    if (
-                        len(dim_uniq_vals_left) == 0
-                        or dim_uniq_vals_left[-1] != curr_observation_dim_val
-                    ):
-                        dim_uniq_vals_left.append(curr_observation_dim_val)
-                    dim_val_counts_left[curr_observation_dim_val] += 1
-
-                else:
-                    dim_O_right.append(obs_id)
-                    if (
-                        len(dim_uniq_vals_right) == 0
-                        or dim_uniq_vals_right[-1] != curr_observation_dim_val
-                    ):
-                        dim_uniq_vals_right.append(curr_observation_dim_val)
-                    dim_val_counts_right[curr_observation_dim_val] += 1
-            O_left.append(dim_O_left)
-            O_right.append(dim_O_right)
-            uniq_vals_left.append(dim_uniq_vals_left)
-            uniq_vals_right.append(dim_uniq_vals_right)
-            val_counts_left.append(dim_val_counts_left)
-            val_counts_right.append(dim_val_counts_right)
+        num_dims = invariants.O_.shape[0]
+        # A stable partition of every row of O_: the observations of each row which
+        # go left (or right) keep their sorted order.
+        goes_left = X[:, cut_point.dim] <= cut_point.cut_val
+        left_mask = goes_left[invariants.O_]
+        num_left = int(left_mask[0].sum().item())
+        O_left = invariants.O_[left_mask].reshape(num_dims, num_left)
+        O_right = invariants.O_[~left_mask].reshape(
+            num_dims, invariants.O_.shape[1] - num_left
+        )
+        uniq_vals_left, val_counts_left = self._uniq_elems_of_sorted(
+            self._sorted_values(X, O_left)
+        )
+        uniq_vals_right, val_counts_right = self._uniq_elems_of_sorted(
+            self._sorted_values(X, O_right)
+        )
         left_invariants = SortedInvariants(
-            O_=torch.tensor(O_left),
+            O_=O_left,
             uniq_vals=uniq_vals_left,
             val_counts=val_counts_left,
         )
         right_invariants = SortedInvariants(
-            O_=torch.tensor(O_right),
+            O_=O_right,
             uniq_vals=uniq_vals_right,
             val_counts=val_counts_right,
         )
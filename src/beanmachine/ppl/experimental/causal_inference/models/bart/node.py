@@ -20,6 +20,8 @@ class BaseNode:
     """
     Base class for node structures.
     Contains reference to a left and right child which can be used to traverse the tree.
+    A node may also cache the indices of the rows of one input / covariate matrix
+    (usually the training data) which satisfy its rules; see `cache_observations`.
 
     Args:
         depth (int): Distance of node from root node.
@@ -40,6 +42,8 @@ class BaseNode:
         self.composite_rules = composite_rules
         self._left_child = left_child
         self._right_child = right_child
+        self._cached_X: Optional[torch.Tensor] = None
+        self._cached_ids: Optional[torch.Tensor] = None
 
     @property
     def left_child(self) -> Optional["BaseNode"]:
@@ -59,6 +63,36 @@ class BaseNode:
     def right_child(self, right_child: Optional["BaseNode"]):
         self._right_child = right_child
 
+    def cache_observations(
+        self, X: torch.Tensor, ids: Optional[torch.Tensor] = None
+    ) -> None:
+        """
+        Remembers the indices of the rows of X which satisfy the composite rules of
+        this node, so that conditioning on the rules of this node with the same X
+        (the same tensor, not merely an equal one) need not evaluate the rules again.
+        The cached indices are never modified in place, so copies of nodes may share them.
+
+        Args:
+            X: Input / covariate matrix.
+            ids: (Optional) the indices of the rows which satisfy the rules, if already known.
+        """
+        if ids is None:
+            ids = torch.nonzero(self.composite_rules.condition_on_rules(X)).reshape(-1)
+        self._cached_X = X
+        self._cached_ids = ids
+
+    def index_in_node(self, X: torch.Tensor) -> torch.Tensor:
+        """
+        Returns an index selecting the rows of X which satisfy the composite rules of this node:
+        the cached row indices if X is the cached input matrix, else a boolean mask.
+
+        Args:
+            X: Input / covariate matrix.
+        """
+        if X is self._cached_X and self._cached_ids is not None:
+            return self._cached_ids
+        return self.composite_rules.condition_on_rules(X)
+
     @overload
     def data_in_node(
         self, X: torch.Tensor, y: torch.Tensor
@@ -82,10 +116,10 @@ class BaseNode:
             X: Input / covariate matrix.
             y: (Optional) response vector.
         """
-        condition_mask = self.composite_rules.condition_on_rules(X)
+        index = self.index_in_node(X)
         if y is not None:
-            return X[condition_mask], y[condition_mask]
-        return X[condition_mask]
+            return X[index], y[index]
+        return X[index]
 
 
 class LeafNode(BaseNode):
@@ -147,7 +181,7 @@ class LeafNode(BaseNode):
         return [
             dim
             for dim in range(X_conditioned.shape[-1])
-            if len(torch.unique(self.get_growable_vals(X_conditioned, dim))) > 1
+            if len(torch.unique(X_conditioned[:, dim])) > 1
         ]
 
     def get_num_growable_dims(self, X: torch.Tensor) -> int:
@@ -195,6 +229,8 @@ class LeafNode(BaseNode):
         """
         Converts a LeafNode into an internal SplitNode by applying the split rules for the left and right nodes.
         This returns a copy of the oriingal node.
+        If the node caches the rows of an input matrix which satisfy its rules, the children cache theirs,
+        which are found by applying the new rules to those rows only.
         Args:
             left_rule: Rule applied to left child of the grown node.
             right_rule: Rule applied to the right child of the grown node.
@@ -202,16 +238,24 @@ class LeafNode(BaseNode):
         left_composite_rules = node.composite_rules.add_rule(left_rule)
         right_composite_rules = node.composite_rules.add_rule(right_rule)
 
-        return SplitNode(
+        left_child = LeafNode(
+            depth=node.depth + 1, composite_rules=left_composite_rules
+        )
+        right_child = LeafNode(
+            depth=node.depth + 1, composite_rules=right_composite_rules
+        )
+        split_node = SplitNode(
             depth=node.depth,
             composite_rules=node.composite_rules,
-            left_child=LeafNode(
-                depth=node.depth + 1, composite_rules=left_composite_rules
-            ),
-            right_child=LeafNode(
-                depth=node.depth + 1, composite_rules=right_composite_rules
-            ),
+            left_child=left_child,
+            right_child=right_child,
         )
+        if node._cached_X is not None and node._cached_ids is not None:
+            X, ids = node._cached_X, node._cached_ids
+            split_node.cache_observations(X, ids)
+            left_child.cache_observations(X, ids[left_rule.condition_on_rule(X[ids])])
+            right_child.cache_observations(X, ids[right_rule.condition_on_rule(X[ids])])
+        return split_node
 
 
 class SplitNode(BaseNode):
@@ -273,4 +317,7 @@ class SplitNode(BaseNode):
         """
         if not node.is_prunable():
             raise PruneError("Not a valid prunable node")
-        return LeafNode(depth=node.depth, composite_rules=node.composite_rules)
+        leaf_node = LeafNode(depth=node.depth, composite_rules=node.composite_rules)
+        if node._cached_X is not None:
+            leaf_node.cache_observations(node._cached_X, node._cached_ids)
+        return leaf_node
@@ -0,0 +1,279 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from collections import deque
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+from beanmachine.ppl.experimental.causal_inference.models.bart.node import (
+    LeafNode,
+    SplitNode,
+)
+from beanmachine.ppl.experimental.causal_inference.models.bart.tree import Tree
+
+# the number of (draw, tree, observation) triples traversed at once while predicting
+_PREDICT_BATCH_SIZE = 2**22
+
+# the arrays which describe the nodes, in the order of the arguments of PackedTrees
+_ARRAY_NAMES = ("feature", "threshold", "left_child", "right_child", "value")
+
+
+class PackedTrees:
+    """
+    Posterior draws of a sum of trees, packed into flat arrays rather than kept as `Tree` objects.
+    Every array has shape (num_draws, num_trees, max_nodes), and node `i` of tree `t` of draw `d` is
+    described by the entries at [d, t, i]:
+
+    - `feature`: The input dimension a split node splits along, or -1 for a leaf node.
+    - `threshold`: The value a split node splits at; observations with `x[feature] <= threshold`
+        go to the left child and the others to the right child.
+    - `left_child`, `right_child`: The indices of the children of a split node.
+    - `value`: The prediction of a leaf node.
+
+    The root of every tree is node 0. Trees with fewer than `max_nodes` nodes are padded with
+    unreachable leaves.
+
+    Args:
+        feature: Split dimensions.
+        threshold: Split values.
+        left_child: Indices of left children.
+        right_child: Indices of right children.
+        value: Leaf predictions.
+        depth: The maximum depth of any tree.
+    """
+
+    def __init__(
+        self,
+        feature: torch.Tensor,
+        threshold: torch.Tensor,
+        left_child: torch.Tensor,
+        right_child: torch.Tensor,
+        value: torch.Tensor,
+        depth: int,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left_child = left_child
+        self.right_child = right_child
+        self.value = value
+        self.depth = depth
+
+    @classmethod
+    def from_trees(cls, draws: List[List[Tree]]) -> "PackedTrees":
+        """
+        Packs posterior draws, each of which is a list of trees.
+
+        Args:
+            draws: The trees of each draw. Every draw must have the same number of trees.
+        """
+        packed = [[_pack_tree(tree) for tree in trees] for trees in draws]
+        num_trees = len(packed[0]) if len(packed) > 0 else 0
+        if any(len(trees) != num_trees for trees in packed):
+            raise ValueError("Every draw must have the same number of trees")
+        max_nodes = max(
+            (len(arrays[0]) for trees in packed for arrays in trees), default=1
+        )
+        depth = max((arrays[-1] for trees in packed for arrays in trees), default=0)
+        shape = (len(packed), num_trees, max_nodes)
+        feature = torch.full(shape, -1, dtype=torch.int32)
+        threshold = torch.zeros(shape, dtype=torch.float64)
+        left_child = torch.zeros(shape, dtype=torch.int32)
+        right_child = torch.zeros(shape, dtype=torch.int32)
+        value = torch.zeros(shape, dtype=torch.float)
+        for draw_id, trees in enumerate(packed):
+            for tree_id, arrays in enumerate(trees):
+                num_nodes = len(arrays[0])
+                for storage, array in zip(
+                    (feature, threshold, left_child, right_child, value), arrays[:-1]
+                ):
+                    storage[draw_id, tree_id, :num_nodes] = torch.tensor(
+                        array, dtype=storage.dtype
+                    )
+        return cls(feature, threshold, left_child, right_child, value, depth)
+
+    @classmethod
+    def concatenate(cls, all_packed: List["PackedTrees"]) -> "PackedTrees":
+        """
+        Concatenates the draws of packed trees with the same number of trees.
+
+        Args:
+            all_packed: The packed trees to concatenate.
+        """
+        if len(all_packed) == 0:
+            return cls.from_trees([])
+        max_nodes = max(packed.feature.shape[-1] for packed in all_packed)
+
+        def _cat(name: str, fill: Union[int, float]) -> torch.Tensor:
+            arrays = []
+            for packed in all_packed:
+                array = getattr(packed, name)
+                padding = max_nodes - array.shape[-1]
+                if padding > 0:
+                    array = torch.cat(
+                        [array, array.new_full(array.shape[:-1] + (padding,), fill)],
+                        dim=-1,
+                    )
+                arrays.append(array)
+            return torch.cat(arrays)
+
+        return cls(
+            feature=_cat("feature", -1),
+            threshold=_cat("threshold", 0.0),
+            left_child=_cat("left_child", 0),
+            right_child=_cat("right_child", 0),
+            value=_cat("value", 0.0),
+            depth=max(packed.depth for packed in all_packed),
+        )
+
+    @property
+    def num_draws(self) -> int:
+        return self.feature.shape[0]
+
+    @property
+    def num_trees(self) -> int:
+        return self.feature.shape[1]
+
+    def __len__(self) -> int:
+        return self.num_draws
+
+    def predict(self, X: torch.Tensor) -> torch.Tensor:
+        """
+        Predict with every draw, by traversing all of the trees of a batch of draws together,
+        one level at a time.
+
+        Args:
+            X: Covariate matrix to predict on of shape (num_observations, input_dimensions).
+
+        Returns:
+            prediction: The sum of the predictions of the trees of each draw, of shape (num_observations, num_draws).
+        """
+        num_observations = len(X)
+        prediction = torch.zeros((num_observations, self.num_draws), dtype=torch.float)
+        if self.num_draws == 0 or self.num_trees == 0 or num_observations == 0:
+            return prediction
+        batch_draws = max(1, _PREDICT_BATCH_SIZE // (self.num_trees * num_observations))
+        observation_ids = torch.arange(num_observations)
+        for start in range(0, self.num_draws, batch_draws):
+            end = min(start + batch_draws, self.num_draws)
+            # every tree of every draw in the batch, each with one row per observation
+            num_batch_trees = (end - start) * self.num_trees
+            feature, threshold, left_child, right_child, value = (
+                array[start:end].reshape(num_batch_trees, -1)
+                for array in (
+                    self.feature,
+                    self.threshold,
+                    self.left_child,
+                    self.right_child,
+                    self.value,
+                )
+            )
+            # gather needs int64 indices; they are stored more compactly
+            feature, left_child, right_child = (
+                feature.long(),
+                left_child.long(),
+                right_child.long(),
+            )
+            node_ids = torch.zeros(
+                (num_batch_trees, num_observations), dtype=torch.long
+            )
+            for _ in range(self.depth):
+                node_feature = torch.gather(feature, 1, node_ids)
+                is_leaf = node_feature < 0
+                if torch.all(is_leaf):
+                    break
+                x = X[observation_ids, node_feature.clamp(min=0)]
+                goes_left = x <= torch.gather(threshold, 1, node_ids)
+                child_ids = torch.where(
+                    goes_left,
+                    torch.gather(left_child, 1, node_ids),
+                    torch.gather(right_child, 1, node_ids),
+                )
+                node_ids = torch.where(is_leaf, node_ids, child_ids)
+            leaf_values = torch.gather(value, 1, node_ids)
+            prediction[:, start:end] = (
+                leaf_values.reshape(end - start, self.num_trees, num_observations)
+                .sum(dim=1)
+                .transpose(0, 1)
+            )
+        return prediction
+
+    def save(self, path: str) -> None:
+        """
+        Save the packed trees to a file, which `PackedTrees.load` reads back. The arrays are
+        stored in numpy's .npz format, without pickling any objects.
+
+        Args:
+            path: The file to write.
+        """
+        # write to a file object, so that numpy does not append .npz to the path
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                **{name: getattr(self, name).cpu().numpy() for name in _ARRAY_NAMES},
+                depth=np.array(self.depth),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "PackedTrees":
+        """
+        Load packed trees saved by `PackedTrees.save`.
+
+        Args:
+            path: The file to read.
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(
+                **{name: torch.from_numpy(arrays[name]) for name in _ARRAY_NAMES},
+                depth=int(arrays["depth"]),
+            )
+
+
+def _find_root(tree: Tree) -> Optional[Union[LeafNode, SplitNode]]:
+    nodes = tree.split_nodes() + tree.leaf_nodes()
+    children = {
+        id(child)
+        for node in nodes
+        for child in (node.left_child, node.right_child)
+        if child is not None
+    }
+    return next((node for node in nodes if id(node) not in children), None)
+
+
+def _pack_tree(
+    tree: Tree,
+) -> Tuple[List[int], List[float], List[int], List[int], List[float], int]:
+    """
+    Lay out the nodes of a tree breadth first, starting with the root.
+    Returns the feature, threshold, left_child, right_child and value of each node, and the depth of the tree.
+    """
+    feature, threshold, left_child, right_child, value = [], [], [], [], []
+    root = _find_root(tree)
+    if root is None:
+        return [-1], [0.0], [0], [0], [0.0], 0
+    depth = 0
+    queue = deque([(root, 0)])
+    while len(queue) > 0:
+        node, node_depth = queue.popleft()
+        depth = max(depth, node_depth)
+        if isinstance(node, SplitNode):
+            rule = node.most_recent_rule()
+            feature.append(rule.grow_dim)
+            threshold.append(float(rule.grow_val))
+            # the children are laid out after every node already in the queue
+            first_child = len(feature) + len(queue)
+            left_child.append(first_child)
+            right_child.append(first_child + 1)
+            value.append(0.0)
+            queue.append((node.left_child, node_depth + 1))
+            queue.append((node.right_child, node_depth + 1))
+        else:
+            feature.append(-1)
+            threshold.append(0.0)
+            left_child.append(0)
+            right_child.append(0)
+            value.append(float(node.val) if node.val is not None else 0.0)
+    return feature, threshold, left_child, right_child, value, depth
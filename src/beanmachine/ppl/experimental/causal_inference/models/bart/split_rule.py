@@ -40,6 +40,17 @@ class SplitRule:
         self.grow_val = grow_val
         self.operator = operator
 
+    def condition_on_rule(self, X: torch.Tensor) -> torch.Tensor:
+        """Condition the input on this rule alone and get a mask such that X[mask]
+        satisfies the rule.
+
+        Args:
+            X: Input / covariate matrix.
+        """
+        if self.operator == Operator.le:
+            return X[:, self.grow_dim].le(self.grow_val)
+        return X[:, self.grow_dim].gt(self.grow_val)
+
 
 class DimensionalRule:
     """
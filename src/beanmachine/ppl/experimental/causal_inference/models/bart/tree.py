@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import copy
 from typing import List, Optional, Union
 
 import torch
@@ -87,9 +88,23 @@ class Tree:
         """
         prediction = torch.zeros((len(X), 1), dtype=torch.float)
         for leaf in self.leaf_nodes():
-            prediction[leaf.composite_rules.condition_on_rules(X)] = leaf.predict()
+            prediction[leaf.index_in_node(X)] = leaf.predict()
         return prediction
 
+    def copy(self) -> "Tree":
+        """
+        Returns a copy of the tree which can be mutated, and whose leaf values can be changed,
+        without changing this tree. Only the nodes themselves are copied; the copies share
+        the (immutable) rules and cached observations of the nodes of this tree.
+        """
+        copies = {node: copy.copy(node) for node in self._nodes}
+        for node in copies.values():
+            if node.left_child is not None:
+                node._left_child = copies[node.left_child]
+            if node.right_child is not None:
+                node._right_child = copies[node.right_child]
+        return Tree(nodes=list(copies.values()))
+
     def mutate(self, mutation: Union[GrowMutation, PruneMutation]) -> None:
         """
         Apply a change to the structure of the tree.
@@ -9,11 +9,25 @@ from beanmachine.ppl.inference.hmc_inference import (
     GlobalHamiltonianMonteCarlo,
     SingleSiteHamiltonianMonteCarlo,
 )
+from beanmachine.ppl.inference.minibatch import (
+    Minibatch,
+    RandomMinibatch,
+    StreamingMinibatch,
+)
 from beanmachine.ppl.inference.nuts_inference import (
     GlobalNoUTurnSampler,
     SingleSiteNoUTurnSampler,
 )
+from beanmachine.ppl.inference.online_diagnostics import OnlineDiagnostics
 from beanmachine.ppl.inference.predictive import empirical, simulate
+from beanmachine.ppl.inference.sample_sink import (
+    InMemorySink,
+    NetCDFSink,
+    NumpyMemmapSink,
+    SampleSink,
+    SharedMemorySink,
+)
+from beanmachine.ppl.inference.sgld_inference import StochasticGradientLangevinDynamics
 from beanmachine.ppl.inference.single_site_ancestral_mh import (
     SingleSiteAncestralMetropolisHastings,
 )
@@ -30,12 +44,22 @@ __all__ = [
     "CompositionalInference",
     "GlobalHamiltonianMonteCarlo",
     "GlobalNoUTurnSampler",
+    "InMemorySink",
+    "Minibatch",
+    "NetCDFSink",
+    "NumpyMemmapSink",
+    "OnlineDiagnostics",
+    "RandomMinibatch",
+    "SampleSink",
+    "SharedMemorySink",
     "SingleSiteAncestralMetropolisHastings",
     "SingleSiteHamiltonianMonteCarlo",
     "SingleSiteNewtonianMonteCarlo",
     "SingleSiteNoUTurnSampler",
     "SingleSiteRandomWalk",
     "SingleSiteUniformMetropolisHastings",
+    "StochasticGradientLangevinDynamics",
+    "StreamingMinibatch",
     "VerboseLevel",
     "empirical",
     "seed",
@@ -4,14 +4,24 @@
 # LICENSE file in the root directory of this source tree.
 
 import copy
+import queue
+import traceback
 import warnings
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-from typing import List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 import torch
 from beanmachine.ppl.inference.monte_carlo_samples import MonteCarloSamples
+from beanmachine.ppl.inference.online_diagnostics import OnlineDiagnostics
 from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
+from beanmachine.ppl.inference.proposer.batched_hmc_proposer import BatchedHMCProposer
+from beanmachine.ppl.inference.sample_sink import (
+    InMemorySink,
+    SampleSink,
+    SharedMemorySink,
+)
 from beanmachine.ppl.inference.sampler import Sampler
 from beanmachine.ppl.inference.utils import (
     _execute_in_new_thread,
@@ -27,6 +37,121 @@ from tqdm.notebook import tqdm as notebook_tqdm
 from typing_extensions import Literal
 
 
+def _num_retained(num_samples: int, num_adaptive_samples: int, thin: int) -> int:
+    """The number of samples retained after thinning"""
+    return -(-num_samples // thin) + -(-num_adaptive_samples // thin)
+
+
+def _is_retained(iteration: int, num_adaptive_samples: int, thin: int) -> bool:
+    # adaptive and regular samples are thinned separately, so that both start with
+    # a retained sample
+    if iteration >= num_adaptive_samples:
+        iteration -= num_adaptive_samples
+    return iteration % thin == 0
+
+
+def _extract_values(
+    world: World, queries: List[RVIdentifier], observations: RVDict
+) -> List[torch.Tensor]:
+    """Returns the values of the queries followed by the log likelihoods of the
+    observations in the given world"""
+    values = []
+    for query in queries:
+        raw_val = world.call(query)
+        if not isinstance(raw_val, torch.Tensor):
+            raise TypeError(
+                "The value returned by a queried function must be a tensor."
+            )
+        values.append(raw_val)
+    return values + [world.log_prob([obs]) for obs in observations]
+
+
+# how often, in seconds, the main process checks that the processes running the
+# chains in parallel are still alive
+_HEARTBEAT_INTERVAL = 1.0
+
+
+def _chain_process(
+    single_chain_infer: Callable[[int, int], Any],
+    chain_id: int,
+    seed: int,
+    channel: Any,
+    lock: Any,
+) -> None:
+    """Runs one chain in a subprocess, then reports the result of its writer, or the
+    traceback of the exception which stopped it, to the main process"""
+    tqdm.set_lock(lock)
+    try:
+        # run single chain inference in a new thread to avoid forking corrupted
+        # internal states (https://github.com/pytorch/pytorch/issues/17199)
+        result = _execute_in_new_thread(single_chain_infer, chain_id, seed)
+    except BaseException:
+        channel.put((chain_id, False, traceback.format_exc()))
+    else:
+        channel.put((chain_id, True, result))
+
+
+def _run_chains_in_parallel(
+    single_chain_infer: Callable[[int, int], Any],
+    seeds: List[int],
+    ctx: Any,
+) -> List[Any]:
+    """Runs every chain in its own subprocess and returns the results of their
+    writers, in order. Rather than waiting on a pool, the main process waits for
+    messages from the chains, and fails if a chain raises or dies without one."""
+    channel = ctx.Queue()
+    lock = ctx.Lock()
+    processes = [
+        ctx.Process(
+            target=_chain_process,
+            args=(single_chain_infer, chain_id, seed, channel, lock),
+            daemon=True,
+        )
+        for chain_id, seed in enumerate(seeds)
+    ]
+    for process in processes:
+        process.start()
+    results: Dict[int, Any] = {}
+    try:
+        while len(results) < len(processes):
+            # A chain which is already dead has already sent its message, if any,
+            # so if none arrives before the timeout, it never will.
+            dead = [
+                chain_id
+                for chain_id, process in enumerate(processes)
+                if chain_id not in results and not process.is_alive()
+            ]
+            try:
+                chain_id, succeeded, result = channel.get(timeout=_HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                if len(dead) > 0:
+                    raise RuntimeError(
+                        f"Chain {dead[0]} exited unexpectedly with exit code "
+                        f"{processes[dead[0]].exitcode}."
+                    )
+                continue
+            if not succeeded:
+                raise RuntimeError(f"Chain {chain_id} failed:\n{result}")
+            results[chain_id] = result
+    finally:
+        for process in processes:
+            if process.is_alive() and process.pid is not None:
+                process.terminate()
+            process.join()
+    return [results[chain_id] for chain_id in range(len(processes))]
+
+
+def _run_chains_in_threads(
+    single_chain_infer: Callable[[int], Any], num_chains: int
+) -> List[Any]:
+    """Runs every chain in its own thread of the current process and returns the
+    results of their writers, in order. Each thread has its own world stack, and
+    torch releases the GIL inside its ops, so chains whose time is spent in torch run
+    concurrently."""
+    with ThreadPoolExecutor(max_workers=num_chains) as executor:
+        return list(executor.map(single_chain_infer, range(num_chains)))
+
+
 class BaseInference(metaclass=ABCMeta):
     """
     Abstract class all inference methods should inherit from.
@@ -48,6 +173,20 @@ class BaseInference(metaclass=ABCMeta):
         """
         raise NotImplementedError
 
+    def get_batched_proposer(
+        self,
+        worlds: List[World],
+        target_rvs: Set[RVIdentifier],
+        num_adaptive_sample: int,
+    ) -> BatchedHMCProposer:
+        """
+        Returns a proposer which advances all of the chains, one per world, at once.
+        Only algorithms which support vectorized chains implement this method.
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support vectorized chains."
+        )
+
     def _get_default_num_adaptive_samples(self, num_samples: int) -> int:
         """
         Returns a reasonable default number of adaptive samples for the algorithm.
@@ -63,12 +202,16 @@ class BaseInference(metaclass=ABCMeta):
         show_progress_bar: bool,
         initialize_fn: InitializeFn,
         max_init_retries: int,
+        sink: SampleSink,
+        thin: int,
+        num_chains: int,
         chain_id: int,
         seed: Optional[int] = None,
-    ) -> Tuple[List[torch.Tensor], List[torch.Tensor]]:
+    ) -> Any:
         """
-        Run a single chain of inference. Return a list of samples (in the same order as
-        the queries) and a list of log likelihood on observations
+        Run a single chain of inference, writing the retained samples of the queries
+        followed by the log likelihoods of the observations to the sink. Returns the
+        result of the chain's writer.
 
         Args:
             queries: A list of queries.
@@ -79,6 +222,9 @@ class BaseInference(metaclass=ABCMeta):
             initialize_fn: A callable that takes in a distribution and returns a Tensor.
             max_init_retries: The number of attempts to make to initialize values for an
                 inference before throwing an error.
+            sink: The sink to write the samples to.
+            thin: Only every ``thin``-th sample is retained.
+            num_chains: The total number of chains.
             chain_id: The index of the current chain.
             seed: If provided, the seed will be used to initialize the state of the
             random number generators for the current chain
@@ -99,31 +245,156 @@ class BaseInference(metaclass=ABCMeta):
             initialize_fn,
             max_init_retries,
         )
-        samples = [[] for _ in queries]
-        log_likelihoods = [[] for _ in observations]
+        writer = sink.writer(
+            chain_id,
+            num_chains,
+            _num_retained(num_samples, num_adaptive_samples, thin),
+        )
 
         # Main inference loop
-        for world in tqdm(
-            sampler,
-            total=num_samples + num_adaptive_samples,
+        for iteration, world in enumerate(
+            tqdm(
+                sampler,
+                total=num_samples + num_adaptive_samples,
+                desc="Samples collected",
+                disable=not show_progress_bar,
+                position=chain_id,
+            )
+        ):
+            if _is_retained(iteration, num_adaptive_samples, thin):
+                writer.write(_extract_values(world, queries, observations))
+
+        return writer.close()
+
+    def _vectorized_infer(
+        self,
+        queries: List[RVIdentifier],
+        observations: RVDict,
+        num_samples: int,
+        num_chains: int,
+        num_adaptive_samples: int,
+        show_progress_bar: bool,
+        initialize_fn: InitializeFn,
+        max_init_retries: int,
+        sink: SampleSink,
+        thin: int,
+        diagnostics: Optional[OnlineDiagnostics] = None,
+    ) -> Tuple[List[Any], int]:
+        """
+        Run all chains of inference together in a single process, with the state of
+        every chain held in one batched proposer. Returns the results of the writers
+        of all chains, and the number of samples each of them retained.
+        """
+        worlds = [
+            World.initialize_world(
+                queries, observations, initialize_fn, max_init_retries
+            )
+            for _ in range(num_chains)
+        ]
+        latent_nodes = worlds[0].latent_nodes
+        if any(world.latent_nodes != latent_nodes for world in worlds):
+            raise ValueError(
+                "Vectorized chains require every chain to have the same random"
+                " variables."
+            )
+        # start inference with a copy of self to ensure that multiple inference runs
+        # all start with the same pristine state
+        kernel = copy.deepcopy(self)
+        proposer = kernel.get_batched_proposer(
+            worlds, latent_nodes, num_adaptive_samples
+        )
+
+        num_retained = _num_retained(num_samples, num_adaptive_samples, thin)
+        writers = [
+            sink.writer(chain_id, num_chains, num_retained)
+            for chain_id in range(num_chains)
+        ]
+        num_adaptive_sample_remaining = num_adaptive_samples
+        num_written = 0
+        for iteration in tqdm(
+            range(num_samples + num_adaptive_samples),
             desc="Samples collected",
             disable=not show_progress_bar,
-            position=chain_id,
         ):
-            for idx, obs in enumerate(observations):
-                log_likelihoods[idx].append(world.log_prob([obs]))
-            # Extract samples
-            for idx, query in enumerate(queries):
-                raw_val = world.call(query)
-                if not isinstance(raw_val, torch.Tensor):
-                    raise TypeError(
-                        "The value returned by a queried function must be a tensor."
-                    )
-                samples[idx].append(raw_val)
+            world, accept_log_prob = proposer.propose(worlds[0])
+            if num_adaptive_sample_remaining > 0:
+                proposer.do_adaptation(world=world, accept_log_prob=accept_log_prob)
+                if num_adaptive_sample_remaining == 1:
+                    proposer.finish_adaptation()
+                num_adaptive_sample_remaining -= 1
+            if _is_retained(iteration, num_adaptive_samples, thin):
+                values = proposer.call(
+                    partial(_extract_values, queries=queries, observations=observations)
+                )
+                for chain_id, writer in enumerate(writers):
+                    writer.write([value[chain_id] for value in values])
+                num_written += 1
+                if diagnostics is not None and iteration >= num_adaptive_samples:
+                    diagnostics.update(values[: len(queries)])
+                    if diagnostics.converged():
+                        break
 
-        samples = [torch.stack(val) for val in samples]
-        log_likelihoods = [torch.stack(val) for val in log_likelihoods]
-        return samples, log_likelihoods
+        return [writer.close() for writer in writers], num_written
+
+    def _lockstep_infer(
+        self,
+        queries: List[RVIdentifier],
+        observations: RVDict,
+        num_samples: int,
+        num_chains: int,
+        num_adaptive_samples: int,
+        show_progress_bar: bool,
+        initialize_fn: InitializeFn,
+        max_init_retries: int,
+        sink: SampleSink,
+        thin: int,
+        diagnostics: OnlineDiagnostics,
+    ) -> Tuple[List[Any], int]:
+        """
+        Run all chains of inference in the current process, advancing every chain by
+        one iteration at a time, so that the online diagnostics can compare the
+        chains as they go. Stops early once the diagnostics have converged. Returns
+        the results of the writers of all chains, and the number of samples each of
+        them retained.
+        """
+        samplers = [
+            self.sampler(
+                queries,
+                observations,
+                num_samples,
+                num_adaptive_samples,
+                initialize_fn,
+                max_init_retries,
+            )
+            for _ in range(num_chains)
+        ]
+        num_retained = _num_retained(num_samples, num_adaptive_samples, thin)
+        writers = [
+            sink.writer(chain_id, num_chains, num_retained)
+            for chain_id in range(num_chains)
+        ]
+        num_written = 0
+        for iteration in tqdm(
+            range(num_samples + num_adaptive_samples),
+            desc="Samples collected",
+            disable=not show_progress_bar,
+        ):
+            worlds = [next(sampler) for sampler in samplers]
+            if _is_retained(iteration, num_adaptive_samples, thin):
+                values = [
+                    _extract_values(world, queries, observations) for world in worlds
+                ]
+                for writer, chain_values in zip(writers, values):
+                    writer.write(chain_values)
+                num_written += 1
+                if iteration >= num_adaptive_samples:
+                    # the queries of all chains, without the log likelihoods
+                    columns = list(zip(*values))[: len(queries)]
+                    diagnostics.update([torch.stack(column) for column in columns])
+                    if diagnostics.converged():
+                        break
+
+        return [writer.close() for writer in writers], num_written
 
     def infer(
         self,
@@ -138,6 +409,11 @@ class BaseInference(metaclass=ABCMeta):
         run_in_parallel: bool = False,
         mp_context: Optional[Literal["fork", "spawn", "forkserver"]] = None,
         verbose: Optional[VerboseLevel] = None,
+        vectorize_chains: bool = False,
+        sink: Optional[SampleSink] = None,
+        thin: int = 1,
+        diagnostics: Optional[OnlineDiagnostics] = None,
+        parallel_backend: Literal["process", "thread"] = "process",
     ) -> MonteCarloSamples:
         """
         Performs inference and returns a ``MonteCarloSamples`` object with samples from the posterior.
@@ -156,11 +432,35 @@ class BaseInference(metaclass=ABCMeta):
             max_init_retries: The number of attempts to make to initialize values for an
                 inference before throwing an error (default to 100).
             run_in_parallel: Whether to run multiple chains in parallel (with multiple
-                processes).
+                processes, or threads, see ``parallel_backend``).
             mp_context: The `multiprocessing context <https://docs.python.org/3.8/library/multiprocessing.html#contexts-and-start-methods>`_
                 to used for parallel inference.
             verbose: (Deprecated) Whether to display the progress bar. This option
                 is deprecated, please use ``show_progress_bar`` instead.
+            vectorize_chains: Whether to run all chains together in the current
+                process, evaluating the model for all chains in a single vectorized
+                call. Only supported by some algorithms, and cannot be combined with
+                ``run_in_parallel``.
+            sink: Where to write the samples, in chunks, as they are drawn. Defaults
+                to an ``InMemorySink``, or a ``SharedMemorySink`` when running in
+                parallel; use e.g. a ``NumpyMemmapSink`` for runs whose samples do
+                not fit in memory.
+            thin: Only retain every ``thin``-th sample (and adaptive sample),
+                defaults to 1.
+            diagnostics: ``OnlineDiagnostics`` to update with every retained sample
+                after adaptation, which report the running R-hat and effective
+                sample sizes of the queries, and may stop inference early once the
+                chains have converged. The chains then run in lockstep in the
+                current process, so this cannot be combined with
+                ``run_in_parallel``.
+            parallel_backend: How to run the chains when ``run_in_parallel`` is set.
+                ``"process"`` (the default) runs each chain in a subprocess.
+                ``"thread"`` runs each chain in a thread of the current process,
+                which avoids starting processes and pickling the model, and pays off
+                when the chains spend their time in torch ops, which release the
+                GIL. The threads share torch's global random number generator, so
+                the chains draw independent random numbers but, unlike with
+                processes, a seeded run is not reproducible.
         """
         if verbose is not None:
             warnings.warn(
@@ -171,12 +471,93 @@ class BaseInference(metaclass=ABCMeta):
                 stacklevel=2,  # show the caller rather than this line
             )
             show_progress_bar = bool(verbose)
+        if parallel_backend not in ("process", "thread"):
+            raise ValueError(
+                f"parallel_backend must be 'process' or 'thread', but is "
+                f"{parallel_backend!r}."
+            )
 
         _verify_queries_and_observations(
             queries, observations, observations_must_be_rv=True
         )
         if num_adaptive_samples is None:
             num_adaptive_samples = self._get_default_num_adaptive_samples(num_samples)
+        if thin < 1:
+            raise ValueError("thin must be positive.")
+        if diagnostics is not None:
+            if run_in_parallel:
+                raise ValueError(
+                    "diagnostics and run_in_parallel cannot be used together."
+                )
+            diagnostics.begin(queries, num_chains)
+        if sink is None:
+            # chains running in threads write to the memory of the current process
+            if run_in_parallel and parallel_backend == "process":
+                sink = SharedMemorySink()
+            else:
+                sink = InMemorySink()
+        sink.begin(num_chains, _num_retained(num_samples, num_adaptive_samples, thin))
+        sink.allocate(
+            partial(
+                self._example_values,
+                queries,
+                observations,
+                initialize_fn,
+                max_init_retries,
+            )
+        )
+
+        if vectorize_chains:
+            if run_in_parallel:
+                raise ValueError(
+                    "vectorize_chains and run_in_parallel cannot be used together."
+                )
+            chain_results, num_written = self._vectorized_infer(
+                queries,
+                observations,
+                num_samples,
+                num_chains,
+                num_adaptive_samples,
+                show_progress_bar,
+                initialize_fn,
+                max_init_retries,
+                sink,
+                thin,
+                diagnostics,
+            )
+            return self._load_samples(
+                sink,
+                chain_results,
+                queries,
+                observations,
+                num_adaptive_samples,
+                thin,
+                num_written,
+            )
+
+        if diagnostics is not None:
+            chain_results, num_written = self._lockstep_infer(
+                queries,
+                observations,
+                num_samples,
+                num_chains,
+                num_adaptive_samples,
+                show_progress_bar,
+                initialize_fn,
+                max_init_retries,
+                sink,
+                thin,
+                diagnostics,
+            )
+            return self._load_samples(
+                sink,
+                chain_results,
+                queries,
+                observations,
+                num_adaptive_samples,
+                thin,
+                num_written,
+            )
 
         single_chain_infer = partial(
             self._single_chain_infer,
@@ -187,9 +568,36 @@ class BaseInference(metaclass=ABCMeta):
             show_progress_bar,
             initialize_fn,
             max_init_retries,
+            sink,
+            thin,
+            num_chains,
         )
+        chain_results = self._run_chains(
+            single_chain_infer,
+            num_chains,
+            run_in_parallel,
+            parallel_backend,
+            mp_context,
+        )
+        return self._load_samples(
+            sink, chain_results, queries, observations, num_adaptive_samples, thin
+        )
+
+    def _run_chains(
+        self,
+        single_chain_infer: Callable[..., Any],
+        num_chains: int,
+        run_in_parallel: bool,
+        parallel_backend: Literal["process", "thread"],
+        mp_context: Optional[Literal["fork", "spawn", "forkserver"]],
+    ) -> List[Any]:
+        """Runs every chain, with the given backend, and returns their results"""
         if not run_in_parallel:
-            chain_results = map(single_chain_infer, range(num_chains))
+            return list(map(single_chain_infer, range(num_chains)))
+        elif parallel_backend == "thread":
+            # Seeding a chain would reset the generator shared by all threads, so
+            # the chains draw from the current state of the global generator instead
+            return _run_chains_in_threads(single_chain_infer, num_chains)
         else:
             ctx = mp.get_context(mp_context)
             # We'd like to explicitly set a different seed for each process to avoid
@@ -199,31 +607,51 @@ class BaseInference(metaclass=ABCMeta):
                 (first_seed + 31 * chain_id) % self._MAX_SEED_VAL
                 for chain_id in range(num_chains)
             ]
-            # run single chain inference in a new thread in subprocesses to avoid
-            # forking corrupted internal states
-            # (https://github.com/pytorch/pytorch/issues/17199)
-            single_chain_infer = partial(_execute_in_new_thread, single_chain_infer)
+            return _run_chains_in_parallel(single_chain_infer, seeds, ctx)
 
-            with ctx.Pool(
-                processes=num_chains, initializer=tqdm.set_lock, initargs=(ctx.Lock(),)
-            ) as p:
-                chain_results = p.starmap(single_chain_infer, enumerate(seeds))
+    def _example_values(
+        self,
+        queries: List[RVIdentifier],
+        observations: RVDict,
+        initialize_fn: InitializeFn,
+        max_init_retries: int,
+    ) -> List[torch.Tensor]:
+        """Returns the values of the queries followed by the log likelihoods of the
+        observations in a newly initialized world, for sinks which need to know the
+        shapes and types of the samples before the chains start"""
+        # don't disturb the random numbers drawn by the chains
+        with torch.random.fork_rng():
+            world = World.initialize_world(
+                queries, observations, initialize_fn, max_init_retries
+            )
+            values = _extract_values(world, queries, observations)
+        return [value.detach() for value in values]
 
-        all_samples, all_log_liklihoods = zip(*chain_results)
+    def _load_samples(
+        self,
+        sink: SampleSink,
+        chain_results: List[Any],
+        queries: List[RVIdentifier],
+        observations: RVDict,
+        num_adaptive_samples: int,
+        thin: int,
+        num_written: Optional[int] = None,
+    ) -> MonteCarloSamples:
+        columns = sink.load(chain_results)
+        if num_written is not None:
+            # inference stopped early, before the storage of the sink was filled
+            columns = [column[:, :num_written] for column in columns]
         # the hash of RVIdentifier can change when it is being sent to another process,
-        # so we have to rely on the order of the returned list to determine which samples
+        # so we have to rely on the order of the columns to determine which samples
         # correspond to which RVIdentifier
-        all_samples = [dict(zip(queries, samples)) for samples in all_samples]
+        samples = dict(zip(queries, columns[: len(queries)]))
         # in python the order of keys in a dict is fixed, so we can rely on it
-        all_log_liklihoods = [
-            dict(zip(observations.keys(), log_likelihoods))
-            for log_likelihoods in all_log_liklihoods
-        ]
-
+        log_likelihoods = dict(zip(observations.keys(), columns[len(queries) :]))
         return MonteCarloSamples(
-            all_samples,
-            num_adaptive_samples,
-            all_log_liklihoods,
+            # MonteCarloSamples can't tell the number of chains from an empty dict
+            samples if len(samples) > 0 else [{} for _ in chain_results],
+            _num_retained(0, num_adaptive_samples, thin),
+            log_likelihoods,
             observations,
         )
 
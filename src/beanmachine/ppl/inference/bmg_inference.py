@@ -15,6 +15,7 @@ import torch
 from beanmachine.graph import Graph, InferConfig, InferenceType
 
 from beanmachine.ppl.compiler.bm_graph_builder import rv_to_query
+from beanmachine.ppl.compiler.compilation_cache import CompilationCache
 from beanmachine.ppl.compiler.fix_problems import default_skip_optimizations
 from beanmachine.ppl.compiler.gen_bm_python import to_bm_python
 from beanmachine.ppl.compiler.gen_bmg_cpp import to_bmg_cpp
@@ -47,13 +48,20 @@ class BMGInference:
     include that the runtime graph should be static (meaning, it does not change
     during inference), and that the types of primitive distributions supported
     is currently limited.
+
+    Args:
+        compilation_cache: Optional cache of compiled graphs. When inference is
+            run repeatedly on the same model with the same queries and the same
+            observed random variables, the cached graph is reused and only the
+            observed values are updated.
     """
 
     _fix_observe_true: bool = False
     _pd: Optional[prof.ProfilerData] = None
+    _compilation_cache: Optional[CompilationCache] = None
 
-    def __init__(self):
-        pass
+    def __init__(self, compilation_cache: Optional[CompilationCache] = None):
+        self._compilation_cache = compilation_cache
 
     def _begin(self, s: str) -> None:
         pd = self._pd
@@ -78,104 +86,50 @@ class BMGInference:
         bmg._fix_observe_true = self._fix_observe_true
         return rt
 
-    def _transpose_samples(self, raw):
+    def _samples_to_tensors(self, arrays) -> List[torch.Tensor]:
         self._begin(prof.transpose_samples)
-        samples = []
-        num_samples = len(raw)
-        bmg_query_count = len(raw[0])
 
-        # Suppose we have two queries and three samples;
-        # the shape we get from BMG is:
-        #
-        # [
-        #   [s00, s01],
-        #   [s10, s11],
-        #   [s20, s21]
-        # ]
+        # BMG writes the samples of each query from all chains into a single
+        # contiguous array of shape (num_chains, num_samples, ...). Matrix
+        # samples are in columns in BMG but we need them in rows; BMG has
+        # already reshaped a (rows x 1) sample to (rows) and transposed a
+        # (rows x columns) sample to (columns x rows). We can therefore wrap
+        # the arrays in tensors without copying them.
         #
-        # That is, each entry in the list has values from both queries.
-        # But what we need in the final dictionary is:
-        #
-        # {
-        #   RV0: tensor([[s00, s10, s20]]),
-        #   RV1: tensor([[s01, s11, s21]])
-        # }
-
-        transposed = [torch.tensor([x]) for x in zip(*raw)]
-        assert len(transposed) == bmg_query_count
-        assert len(transposed[0]) == 1
-        assert len(transposed[0][0]) == num_samples
+        # Scalar real samples have always been returned with the default dtype,
+        # so those are the only samples which we convert.
 
-        # We now have
-        #
-        # [
-        #   tensor([[s00, s10, s20]]),
-        #   tensor([[s01, s11, s21]])
-        # ]
-        #
-        # which looks like what we need. But we have an additional problem:
-        # if the the sample is a matrix then it is in columns but we need it in rows.
-        #
-        # If an element of transposed is (1 x num_samples x rows x 1) then we
-        # will just reshape it to (1 x num_samples x rows).
-        #
-        # If it is (1 x num_samples x rows x columns) for columns > 1 then
-        # we transpose it to (1 x num_samples x columns x rows)
-        #
-        # If it is any other shape we leave it alone.
-
-        for i in range(len(transposed)):
-            t = transposed[i]
-            if len(t.shape) == 4:
-                if t.shape[3] == 1:
-                    assert t.shape[0] == 1
-                    assert t.shape[1] == num_samples
-                    samples.append(t.reshape(1, num_samples, t.shape[2]))
-                else:
-                    samples.append(t.transpose(2, 3))
-            else:
-                samples.append(t)
-
-        assert len(samples) == bmg_query_count
-        assert len(samples[0]) == 1
-        assert len(samples[0][0]) == num_samples
+        samples = []
+        for a in arrays:
+            t = torch.from_numpy(a)
+            if t.dim() == 2 and t.is_floating_point():
+                t = t.to(torch.get_default_dtype())
+            samples.append(t)
 
         self._finish(prof.transpose_samples)
         return samples
 
     def _build_mcsamples(
         self,
-        rv_to_query,
-        samples,
-        query_to_query_id,
-        num_samples: int,
+        rv_to_query_id: Dict[RVIdentifier, int],
+        samples: List[torch.Tensor],
         num_chains: int,
         num_adaptive_samples: int,
     ) -> MonteCarloSamples:
         self._begin(prof.build_mcsamples)
 
-        assert len(samples) == num_chains
-
-        results = []
-        for chain_num in range(num_chains):
-            result: Dict[RVIdentifier, torch.Tensor] = {}
-            for (rv, query) in rv_to_query.items():
-                query_id = query_to_query_id[query]
-                result[rv] = samples[chain_num][query_id]
-            results.append(result)
-        # MonteCarloSamples almost provides just what we need here,
-        # but it requires the input to be of a different type in the
-        # cases of num_chains==1 and !=1 respectively. Furthermore,
-        # we had to tweak it to support the right operator for merging
-        # saumple values when num_chains!=1.
-        if num_chains == 1:
+        result: Dict[RVIdentifier, torch.Tensor] = {
+            rv: samples[query_id] for rv, query_id in rv_to_query_id.items()
+        }
+        # The samples are already laid out as (num_chains, num_samples, ...)
+        # so MonteCarloSamples can use them as they are, without merging the
+        # results of separate chains.
+        if len(result) == 0:
             mcsamples = MonteCarloSamples(
-                results[0], num_adaptive_samples, stack_not_cat=True
+                [result] * num_chains, num_adaptive_samples, stack_not_cat=False
             )
         else:
-            mcsamples = MonteCarloSamples(
-                results, num_adaptive_samples, stack_not_cat=False
-            )
+            mcsamples = MonteCarloSamples(result, num_adaptive_samples)
 
         self._finish(prof.build_mcsamples)
 
@@ -195,20 +149,46 @@ class BMGInference:
         if produce_report:
             self._pd = prof.ProfilerData()
 
-        rt = self._accumulate_graph(queries, observations)
-        bmg = rt._bmg
-        report = pr.PerformanceReport()
+        cache = self._compilation_cache
+        compiled = None
+        if cache is not None:
+            _verify_queries_and_observations(queries, observations, True)
+            key = cache.make_key(
+                queries, observations, skip_optimizations, self._fix_observe_true
+            )
+            compiled = cache.get(key)
+            if compiled is not None and not compiled.observe(observations):
+                # An observed value is impossible; compile the model again so
+                # that the problem is reported.
+                compiled = None
 
-        self._begin(prof.infer)
+        report = pr.PerformanceReport()
 
-        generated_graph = to_bmg_graph(bmg, skip_optimizations)
-        g = generated_graph.graph
-        query_to_query_id = generated_graph.query_to_query_id
+        if compiled is None:
+            rt = self._accumulate_graph(queries, observations)
+            bmg = rt._bmg
+
+            self._begin(prof.infer)
+
+            generated_graph = to_bmg_graph(bmg, skip_optimizations)
+            g = generated_graph.graph
+            query_to_query_id = generated_graph.query_to_query_id
+            # TODO: Make _rv_to_query public. Add it to BMGraphBuilder?
+            rv_to_query_id = {
+                rv: query_to_query_id[query]
+                for rv, query in rv_to_query(generated_graph.bmg).items()
+            }
+            if cache is not None:
+                cache.put(key, generated_graph, queries, observations)
+        else:
+            self._begin(prof.infer)
+            g = compiled.graph
+            rv_to_query_id = compiled.rv_to_query_id(queries)
 
         samples = []
 
         # BMG requires that we have at least one query.
-        if len(query_to_query_id) != 0:
+        if len(rv_to_query_id) != 0:
             g.collect_performance_data(produce_report)
             self._begin(prof.graph_infer)
             default_config = InferConfig()
@@ -220,7 +200,7 @@ class BMGInference:
             # code we are explicitly passing in the same default value used in that file (5123401).
             # We really need a way to defer to the value defined in pybindings.py here.
             try:
-                raw = g.infer(
+                arrays = g.infer_to_numpy(
                     num_samples, inference_type, 5123401, num_chains, default_config
                 )
             except RuntimeError as e:
@@ -235,16 +215,12 @@ class BMGInference:
                 js = g.performance_report()
                 report = pr.json_to_perf_report(js)
                 self._finish(prof.deserialize_perf_report)
-            assert len(raw) == num_chains
-            assert all([len(r) == num_samples for r in raw])
-            samples = [self._transpose_samples(r) for r in raw]
+            assert all(a.shape[:2] == (num_chains, num_samples) for a in arrays)
+            samples = self._samples_to_tensors(arrays)
 
-        # TODO: Make _rv_to_query public. Add it to BMGraphBuilder?
         mcsamples = self._build_mcsamples(
-            rv_to_query(generated_graph.bmg),
+            rv_to_query_id,
             samples,
-            query_to_query_id,
-            num_samples,
             num_chains,
             num_adaptive_samples,
         )
@@ -113,6 +113,9 @@ def _get_nodes_for_rv_family(
     return nodes
 
 
+_ConfigKey = Union[Callable, Tuple[Callable, ...]]
+
+
 class CompositionalInference(BaseInference):
     """
     The ``CompositionalInference`` class enables combining multiple inference algorithms
@@ -157,7 +160,7 @@ class CompositionalInference(BaseInference):
         ] = None,
         nnc_compile: bool = True,
     ):
-        self.config: Dict[Union[Callable, Tuple[Callable, ...]], BaseInference] = {}
+        self.config: Dict[_ConfigKey, BaseInference] = {}
         # create a set for the RV families that are being covered in the config; this is
         # useful in get_proposers to determine which RV needs to be handle by the
         # default inference method
@@ -202,6 +205,16 @@ class CompositionalInference(BaseInference):
 
         self._default_inference = default_inference
 
+        # the proposer plan for the latent nodes of the last call to get_proposers,
+        # which is updated incrementally as nodes are added or removed. Each block
+        # of the plan is a key of the config, or None for the default inference.
+        self._planned_rvs: Set[RVIdentifier] = set()
+        self._rv_family_to_node: Dict[Callable, Set[RVIdentifier]] = defaultdict(set)
+        self._default_nodes: Set[RVIdentifier] = set()
+        self._blocks_of_family: Dict[Callable, List[Optional[_ConfigKey]]] = {}
+        self._block_proposers: Dict[Optional[_ConfigKey], List[BaseProposer]] = {}
+        self._proposers: Optional[List[BaseProposer]] = None
+
     def _get_default_num_adaptive_samples(self, num_samples: int) -> int:
         """Returns the default number of adaptive samples for CompositionalInference,
         which equals to the maximum number of adaptive samples recommended by each
@@ -215,37 +228,82 @@ class CompositionalInference(BaseInference):
             )
         return max(num_adaptive_per_algorithm)
 
+    def _get_blocks_of_family(self, family: Callable) -> List[Optional[_ConfigKey]]:
+        """Returns the keys of the config which cover a RV family, or [None] if the
+        family is handled by the default inference"""
+        if family not in self._blocks_of_family:
+            if family in self._covered_rv_families:
+                self._blocks_of_family[family] = [
+                    config_key
+                    for config_key in self.config
+                    if config_key == family
+                    or (isinstance(config_key, tuple) and family in config_key)
+                ]
+            else:
+                self._blocks_of_family[family] = [None]
+        return self._blocks_of_family[family]
+
+    def _plan_block(
+        self,
+        world: World,
+        block: Optional[_ConfigKey],
+        num_adaptive_sample: int,
+    ) -> List[BaseProposer]:
+        if block is None:
+            # apply default proposers on nodes whose family are not covered by any
+            # of the proposers listed in the config
+            if len(self._default_nodes) == 0:
+                return []
+            return self._default_inference.get_proposers(
+                world, set(self._default_nodes), num_adaptive_sample
+            )
+        nodes = _get_nodes_for_rv_family(block, self._rv_family_to_node)
+        if len(nodes) == 0:
+            return []
+        proposers = self.config[block].get_proposers(world, nodes, num_adaptive_sample)
+        if isinstance(block, tuple):
+            # tuple of RVs == block into a single accept/reject step
+            proposers = [SequentialProposer(proposers)]
+        return proposers
+
     def get_proposers(
         self,
         world: World,
         target_rvs: Set[RVIdentifier],
         num_adaptive_sample: int,
     ) -> List[BaseProposer]:
-        # create a RV family to RVIdentifier lookup map
-        rv_family_to_node = defaultdict(set)
-        for node in target_rvs:
-            rv_family_to_node[node.wrapper].add(node)
-
-        all_proposers = []
-        for target_families, inference in self.config.items():
-            nodes = _get_nodes_for_rv_family(target_families, rv_family_to_node)
-            if len(nodes) > 0:
-                proposers = inference.get_proposers(world, nodes, num_adaptive_sample)
-                if isinstance(target_families, tuple):
-                    # tuple of RVs == block into a single accept/reject step
-                    proposers = [SequentialProposer(proposers)]
-                all_proposers.extend(proposers)
-
-        # apply default proposers on nodes whose family are not covered by any of the
-        # proposers listed in the config
-        remaining_families = rv_family_to_node.keys() - self._covered_rv_families
-        remaining_nodes = _get_nodes_for_rv_family(
-            tuple(remaining_families), rv_family_to_node
-        )
-        if len(remaining_nodes) > 0:
-            proposers = self._default_inference.get_proposers(
-                world, remaining_nodes, num_adaptive_sample
+        # Resolving the RV families against the config and grouping the nodes into
+        # blocks is only redone for the blocks whose nodes have changed since the
+        # last call, so open-universe models are supported, while static models are
+        # only planned once.
+        added = target_rvs - self._planned_rvs
+        removed = self._planned_rvs - target_rvs
+        if self._proposers is not None and not added and not removed:
+            # the sampler shuffles the list in place
+            return list(self._proposers)
+
+        changed_blocks = set()
+        for node in removed:
+            self._rv_family_to_node[node.wrapper].discard(node)
+            self._default_nodes.discard(node)
+            changed_blocks.update(self._get_blocks_of_family(node.wrapper))
+        for node in added:
+            self._rv_family_to_node[node.wrapper].add(node)
+            blocks = self._get_blocks_of_family(node.wrapper)
+            if blocks == [None]:
+                self._default_nodes.add(node)
+            changed_blocks.update(blocks)
+
+        for block in changed_blocks:
+            self._block_proposers[block] = self._plan_block(
+                world, block, num_adaptive_sample
             )
-            all_proposers.extend(proposers)
-
-        return all_proposers
+        # only set once every block is planned, so that the blocks are planned again
+        # by the next call if planning fails
+        self._planned_rvs = set(target_rvs)
+        self._proposers = [
+            proposer
+            for block in [*self.config, None]
+            for proposer in self._block_proposers.get(block, [])
+        ]
+        return list(self._proposers)
@@ -9,6 +9,7 @@ from beanmachine.ppl.experimental.torch_jit_backend import get_backend
 
 from beanmachine.ppl.inference.base_inference import BaseInference
 from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
+from beanmachine.ppl.inference.proposer.batched_hmc_proposer import BatchedHMCProposer
 from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
 from beanmachine.ppl.world import World
@@ -19,6 +20,10 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
     Global (multi-site) Hamiltonian Monte Carlo [1] sampler. This global sampler blocks
     all of the target random_variables in the World together and proposes them jointly.
 
+    This sampler supports vectorized chains: with ``infer(..., vectorize_chains=True)``
+    all chains are advanced together and the model is evaluated for every chain in a
+    single vectorized call.
+
     [1] Neal, Radford. `MCMC Using Hamiltonian Dynamics`.
 
     Args:
@@ -32,6 +37,9 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
             inference.
         experimental_inductor_compile: If True, TorchInductor will be used to
             accelerate the inference.
+        trace_potential: If True, and neither compiler is used, the potential energy
+            of a model with a static structure is traced once into a TorchScript
+            function, instead of re-running the model at every leapfrog step.
     """
 
     def __init__(
@@ -44,6 +52,7 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
         target_accept_prob: float = 0.8,
         nnc_compile: bool = False,
         experimental_inductor_compile: bool = False,
+        trace_potential: bool = False,
     ):
         self.trajectory_length = trajectory_length
         self.initial_step_size = initial_step_size
@@ -52,6 +61,7 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
         self.full_mass_matrix = full_mass_matrix
         self.target_accept_prob = target_accept_prob
         self.jit_backend = get_backend(nnc_compile, experimental_inductor_compile)
+        self.trace_potential = trace_potential
         self._proposer = None
 
     def _get_default_num_adaptive_samples(self, num_samples: int) -> int:
@@ -75,9 +85,28 @@ class GlobalHamiltonianMonteCarlo(BaseInference):
                 self.full_mass_matrix,
                 self.target_accept_prob,
                 self.jit_backend,
+                trace_potential=self.trace_potential,
             )
         return [self._proposer]
 
+    def get_batched_proposer(
+        self,
+        worlds: List[World],
+        target_rvs: Set[RVIdentifier],
+        num_adaptive_sample: int,
+    ) -> BatchedHMCProposer:
+        return BatchedHMCProposer(
+            worlds,
+            target_rvs,
+            num_adaptive_sample,
+            self.trajectory_length,
+            self.initial_step_size,
+            self.adapt_step_size,
+            self.adapt_mass_matrix,
+            self.full_mass_matrix,
+            self.target_accept_prob,
+        )
+
 
 class SingleSiteHamiltonianMonteCarlo(BaseInference):
     """
@@ -0,0 +1,120 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Plates of observations which are subsampled at every step of inference.
+
+A ``Minibatch`` holds a family of conditionally independent observations, e.g.
+``y(i)`` for every data point ``i``, and hands out a batch of them at a time. The
+log likelihood of a batch is scaled by ``Minibatch.scale``, the number of
+observations in the plate divided by the size of the batch, which makes it an
+unbiased estimate of the log likelihood of the whole plate. Pass one to
+``VariationalInfer`` or ``StochasticGradientLangevinDynamics`` with
+``minibatch=``."""
+
+from abc import ABCMeta, abstractmethod
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import torch
+from beanmachine.ppl.world import RVDict
+
+
+class Minibatch(metaclass=ABCMeta):
+    """
+    A plate of observations of which only a batch is evaluated at every step.
+    """
+
+    @property
+    @abstractmethod
+    def size(self) -> int:
+        """The number of observations in the plate"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def next_batch(self) -> RVDict:
+        """Returns the observations of the next batch"""
+        raise NotImplementedError
+
+    def scale(self, batch: RVDict) -> float:
+        """The factor which scales the log likelihood of the batch to an estimate of
+        the log likelihood of the whole plate"""
+        return self.size / len(batch)
+
+
+class RandomMinibatch(Minibatch):
+    """
+    Draws every batch uniformly at random, without replacement, from observations
+    which are all held in memory.
+
+    Args:
+        observations: The observations of the plate.
+        batch_size: The number of observations in each batch.
+    """
+
+    def __init__(self, observations: RVDict, batch_size: int):
+        if not 0 < batch_size <= len(observations):
+            raise ValueError(
+                f"batch_size must be between 1 and the number of observations "
+                f"({len(observations)}), but is {batch_size}."
+            )
+        self.observations = observations
+        self.batch_size = batch_size
+        self._nodes = list(observations)
+
+    @property
+    def size(self) -> int:
+        return len(self._nodes)
+
+    def next_batch(self) -> RVDict:
+        indices = torch.randperm(len(self._nodes))[: self.batch_size]
+        return {
+            self._nodes[i]: self.observations[self._nodes[i]] for i in indices.tolist()
+        }
+
+
+class StreamingMinibatch(Minibatch):
+    """
+    Reads the batches from a data loader, e.g. a ``torch.utils.data.DataLoader``, so
+    that the observations never need to be in memory together. The loader is
+    iterated over again whenever it is exhausted.
+
+    Args:
+        loader: An iterable of batches.
+        size: The total number of observations in the plate, across all batches.
+        to_observations: Converts a batch of the loader into the observations of the
+            batch. Defaults to ``dict``, i.e. the loader yields observations.
+    """
+
+    def __init__(
+        self,
+        loader: Iterable[Any],
+        size: int,
+        to_observations: Callable[[Any], RVDict] = dict,
+    ):
+        if size < 1:
+            raise ValueError(f"size must be positive, but is {size}.")
+        self.loader = loader
+        self._size = size
+        self.to_observations = to_observations
+        self._iterator: Optional[Iterator[Any]] = None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def next_batch(self) -> RVDict:
+        if self._iterator is not None:
+            batch = next(self._iterator, None)
+        else:
+            batch = None
+        if batch is None:
+            # start a new pass over the data
+            self._iterator = iter(self.loader)
+            batch = next(self._iterator, None)
+        if batch is None:
+            raise ValueError("The data loader has no batches.")
+        observations = self.to_observations(batch)
+        if len(observations) == 0:
+            raise ValueError("The data loader returned an empty batch.")
+        return observations
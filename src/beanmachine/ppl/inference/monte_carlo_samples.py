@@ -3,9 +3,12 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
+import pickle
 from typing import Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Union
 
 import arviz as az
+import numpy as np
 import torch
 import xarray as xr
 from beanmachine.ppl.inference.utils import detach_samples, merge_dicts
@@ -14,6 +17,12 @@ from beanmachine.ppl.model.rv_identifier import RVIdentifier
 
 RVDict = Dict[RVIdentifier, torch.Tensor]
 
+# the file in a directory written by MonteCarloSamples.save which holds the random
+# variables and everything else which is not a column of samples
+_INDEX_FILE = "index.pkl"
+_SAMPLES_DIR = "samples"
+_LOG_LIKELIHOODS_DIR = "log_likelihoods"
+
 
 class Samples(NamedTuple):
     samples: RVDict
@@ -113,14 +122,20 @@ class MonteCarloSamples(Mapping[RVIdentifier, torch.Tensor]):
         elif chain < 0 or chain >= self.num_chains:
             raise IndexError("Please specify a valid chain")
 
-        samples = {rv: self.get_variable(rv, True)[[chain]] for rv in self}
+        # slice the chain out of the adaptive and the retained samples before
+        # joining them, so that only the samples of that chain are read
+        samples = {
+            rv: _join_chain(self.adaptive_samples[rv], self.samples[rv], chain)
+            for rv in self
+        }
 
         if self.log_likelihoods is None:
             logll = None
         else:
+            assert self.adaptive_log_likelihoods is not None
             logll = {
-                rv: self.get_log_likelihoods(rv, True)[[chain]]
-                for rv in self.log_likelihoods
+                rv: _join_chain(self.adaptive_log_likelihoods[rv], val, chain)
+                for rv, val in self.log_likelihoods.items()
             }
 
         new_mcs = MonteCarloSamples(
@@ -171,12 +186,15 @@ class MonteCarloSamples(Mapping[RVIdentifier, torch.Tensor]):
         samples = self.namespaces[namespace].samples[rv]
 
         if include_adapt_steps:
+            adaptive_samples = self.namespaces[namespace].adaptive_samples[rv]
+            # thin both parts before joining them, so that only the retained
+            # samples are read, e.g. from samples loaded by MonteCarloSamples.load
+            start = -adaptive_samples.shape[1] % thinning
             samples = torch.cat(
-                [self.namespaces[namespace].adaptive_samples[rv], samples],
+                [adaptive_samples[:, ::thinning], samples[:, start::thinning]],
                 dim=1,
             )
-
-        if thinning > 1:
+        elif thinning > 1:
             samples = samples[:, ::thinning]
         if self.single_chain_view:
             samples = samples.squeeze(0)
@@ -239,6 +257,113 @@ class MonteCarloSamples(Mapping[RVIdentifier, torch.Tensor]):
             return num_samples + self.num_adaptive_samples
         return num_samples
 
+    def save(self, directory: str) -> None:
+        """
+        Writes the samples to a directory which ``MonteCarloSamples.load`` reopens.
+        The samples of each random variable, and the log likelihoods of each
+        observation, are written to their own ``.npy`` file, of shape
+        (num_chains, num_adaptive_samples + num_samples, ...). The random
+        variables, the observations and the remaining attributes are pickled
+        together, so that they refer to the same model after loading.
+
+        :param directory: The directory to write to. It is created if it does not
+            exist, and must not already contain samples.
+        """
+        index_path = os.path.join(directory, _INDEX_FILE)
+        if os.path.exists(index_path):
+            raise ValueError(f"{directory} already contains samples.")
+        os.makedirs(directory, exist_ok=True)
+        namespaces = {}
+        for name, samples in self.namespaces.items():
+            rvs = list(samples.samples)
+            for i, rv in enumerate(rvs):
+                _save_column(
+                    os.path.join(directory, _SAMPLES_DIR, name, f"{i}.npy"),
+                    samples.adaptive_samples[rv],
+                    samples.samples[rv],
+                )
+            num_adaptive_samples = (
+                next(iter(samples.adaptive_samples.values())).shape[1]
+                if len(rvs) > 0
+                else 0
+            )
+            namespaces[name] = (rvs, num_adaptive_samples)
+        if self.log_likelihoods is None:
+            observed_rvs = None
+        else:
+            assert self.adaptive_log_likelihoods is not None
+            observed_rvs = list(self.log_likelihoods)
+            for i, rv in enumerate(observed_rvs):
+                _save_column(
+                    os.path.join(directory, _LOG_LIKELIHOODS_DIR, f"{i}.npy"),
+                    self.adaptive_log_likelihoods[rv],
+                    self.log_likelihoods[rv],
+                )
+        index = {
+            "num_adaptive_samples": self.num_adaptive_samples,
+            "default_namespace": self.default_namespace,
+            "single_chain_view": self.single_chain_view,
+            "namespaces": namespaces,
+            "log_likelihoods": observed_rvs,
+            "observations": self.observations,
+        }
+        # write the index last, so that only complete directories can be loaded
+        with open(index_path, "wb") as f:
+            pickle.dump(index, f)
+
+    @classmethod
+    def load(cls, directory: str) -> "MonteCarloSamples":
+        """
+        Reopens samples written by ``MonteCarloSamples.save``. The samples are
+        memory-mapped rather than read into memory: each file is only read as the
+        tensors are accessed, so ``get_variable``, ``get_chain`` and thinning only
+        read the samples they return. The files are opened copy-on-write, so the
+        tensors can be modified without modifying the saved samples.
+
+        :param directory: The directory written by ``MonteCarloSamples.save``.
+        :returns: The saved samples. Their random variables are unpickled together
+            with the observations, so e.g. ``next(iter(samples)).arguments``
+            holds the model the random variables of a model class belong to.
+        """
+        with open(os.path.join(directory, _INDEX_FILE), "rb") as f:
+            index = pickle.load(f)
+
+        def _load_columns(column_dir: str, rvs: List[RVIdentifier]) -> RVDict:
+            return {
+                rv: torch.from_numpy(
+                    np.load(os.path.join(column_dir, f"{i}.npy"), mmap_mode="c")
+                )
+                for i, rv in enumerate(rvs)
+            }
+
+        default_namespace = index["default_namespace"]
+        if index["log_likelihoods"] is None:
+            logll = None
+        else:
+            logll = _load_columns(
+                os.path.join(directory, _LOG_LIKELIHOODS_DIR), index["log_likelihoods"]
+            )
+        default_rvs, _ = index["namespaces"][default_namespace]
+        mcs = cls(
+            _load_columns(
+                os.path.join(directory, _SAMPLES_DIR, default_namespace), default_rvs
+            ),
+            num_adaptive_samples=index["num_adaptive_samples"],
+            logll_results=logll,
+            observations=index["observations"],
+            default_namespace=default_namespace,
+        )
+        for name, (rvs, num_adaptive_samples) in index["namespaces"].items():
+            if name == default_namespace:
+                continue
+            columns = _load_columns(os.path.join(directory, _SAMPLES_DIR, name), rvs)
+            mcs.namespaces[name] = Samples(
+                {rv: val[:, num_adaptive_samples:] for rv, val in columns.items()},
+                {rv: val[:, :num_adaptive_samples] for rv, val in columns.items()},
+            )
+        mcs.single_chain_view = index["single_chain_view"]
+        return mcs
+
     def to_xarray(self, include_adapt_steps: bool = False) -> xr.Dataset:
         """
         Return an xarray.Dataset from MonteCarloSamples.
@@ -331,3 +456,33 @@ class MonteCarloSamples(Mapping[RVIdentifier, torch.Tensor]):
             log_likelihood=log_likelihoods,
             observed_data=observed_data,
         )
+
+
+def _join_chain(
+    adaptive_samples: torch.Tensor, samples: torch.Tensor, chain: int
+) -> torch.Tensor:
+    """The adaptive and retained samples of one chain, keeping the chain dimension"""
+    return torch.cat(
+        [adaptive_samples[chain : chain + 1], samples[chain : chain + 1]], dim=1
+    )
+
+
+def _save_column(
+    path: str, adaptive_samples: torch.Tensor, samples: torch.Tensor
+) -> None:
+    """Writes the adaptive samples followed by the retained samples to a ``.npy``
+    file, one chain at a time, so that the samples need not fit in memory"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    num_adaptive_samples = adaptive_samples.shape[1]
+    shape = (
+        samples.shape[0],
+        num_adaptive_samples + samples.shape[1],
+        *samples.shape[2:],
+    )
+    dtype = samples.detach().cpu()[:0].numpy().dtype
+    array = np.lib.format.open_memmap(path, "w+", dtype, shape)
+    for chain in range(shape[0]):
+        for start, values in [(0, adaptive_samples), (num_adaptive_samples, samples)]:
+            value = values[chain].detach().cpu().numpy()
+            array[chain, start : start + len(value)] = value
+    array.flush()
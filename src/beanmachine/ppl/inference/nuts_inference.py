@@ -40,6 +40,9 @@ class GlobalNoUTurnSampler(BaseInference):
             inference.
         experimental_inductor_compile: If True, TorchInductor will be used to
             accelerate the inference.
+        trace_potential: If True, and neither compiler is used, the potential energy
+            of a model with a static structure is traced once into a TorchScript
+            function, instead of re-running the model at every leapfrog step.
     """
 
     def __init__(
@@ -54,6 +57,7 @@ class GlobalNoUTurnSampler(BaseInference):
         target_accept_prob: float = 0.8,
         nnc_compile: bool = True,
         experimental_inductor_compile: bool = False,
+        trace_potential: bool = False,
     ):
         self.max_tree_depth = max_tree_depth
         self.max_delta_energy = max_delta_energy
@@ -64,6 +68,7 @@ class GlobalNoUTurnSampler(BaseInference):
         self.multinomial_sampling = multinomial_sampling
         self.target_accept_prob = target_accept_prob
         self.jit_backend = get_backend(nnc_compile, experimental_inductor_compile)
+        self.trace_potential = trace_potential
         self._proposer = None
 
     def _get_default_num_adaptive_samples(self, num_samples: int) -> int:
@@ -89,6 +94,7 @@ class GlobalNoUTurnSampler(BaseInference):
                 self.multinomial_sampling,
                 self.target_accept_prob,
                 self.jit_backend,
+                trace_potential=self.trace_potential,
             )
         return [self._proposer]
 
@@ -0,0 +1,225 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Convergence diagnostics which are updated as the samples are drawn.
+
+``OnlineDiagnostics`` keeps running statistics of every chain, rather than the
+samples themselves, so that R-hat and the effective sample size of the queries can
+be reported while inference runs, and inference can stop as soon as the chains have
+converged. Pass it to ``BaseInference.infer`` with ``diagnostics=``."""
+
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from torch import Tensor
+
+
+LOGGER = logging.getLogger("beanmachine")
+
+
+class _RunningStatistics:
+    """
+    Running statistics of the samples of one query in every chain: the mean and the
+    sum of squared deviations from the mean of each chain (using Welford's
+    algorithm), and the means of consecutive batches of samples. Whenever there are
+    ``2 * num_batches`` batch means, adjacent pairs of them are merged and the
+    batch size is doubled, so that the number of batches stays bounded while the
+    batches grow with the number of samples.
+
+    Args:
+        num_batches: The minimum number of batches once there are enough samples.
+    """
+
+    def __init__(self, num_batches: int):
+        self.num_batches = num_batches
+        self.count = 0
+        self.mean: Optional[Tensor] = None
+        self.m2: Optional[Tensor] = None
+        self.batch_size = 1
+        self._batch_sum: Optional[Tensor] = None
+        self._batch_count = 0
+        self._batch_means: List[Tensor] = []
+
+    def update(self, value: Tensor) -> None:
+        """Adds one sample of every chain, with a leading chain dimension"""
+        if value.dtype not in [torch.float32, torch.float64]:
+            value = value.float()
+        self.count += 1
+        if self.mean is None or self.m2 is None or self._batch_sum is None:
+            self.mean = torch.zeros_like(value)
+            self.m2 = torch.zeros_like(value)
+            self._batch_sum = torch.zeros_like(value)
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        self._batch_sum += value
+        self._batch_count += 1
+        if self._batch_count == self.batch_size:
+            self._batch_means.append(self._batch_sum / self.batch_size)
+            self._batch_sum = torch.zeros_like(value)
+            self._batch_count = 0
+            if len(self._batch_means) == 2 * self.num_batches:
+                self._batch_means = [
+                    (first + second) / 2
+                    for first, second in zip(
+                        self._batch_means[::2], self._batch_means[1::2]
+                    )
+                ]
+                self.batch_size *= 2
+
+    def _within_and_pooled_var(self) -> Tuple[Tensor, Tensor]:
+        """The within-chain and the pooled variance, as in ``r_hat``"""
+        assert self.mean is not None and self.m2 is not None
+        n = self.count
+        w = (self.m2 / (n - 1)).mean(dim=0)
+        if self.mean.shape[0] > 1:
+            b = n * self.mean.var(dim=0)
+        else:
+            b = torch.zeros_like(w)
+        var_hat = (n - 1) / n * w + b / n
+        return w, var_hat.clamp(min=1e-10)
+
+    def r_hat(self) -> Optional[Tensor]:
+        if self.mean is None or self.mean.shape[0] < 2 or self.count < 2:
+            return None
+        w, var_hat = self._within_and_pooled_var()
+        return torch.sqrt(var_hat / w)
+
+    def effective_sample_size(self) -> Optional[Tensor]:
+        """The batch means estimate of the effective sample size of all chains,
+        which compares the pooled variance to the variance of the batch means"""
+        if len(self._batch_means) < 2:
+            return None
+        batch_means = torch.stack(self._batch_means, dim=1)
+        # the variance of the mean of a batch is the asymptotic variance divided by
+        # the batch size
+        asymptotic_var = (self.batch_size * batch_means.var(dim=1)).mean(dim=0)
+        _, var_hat = self._within_and_pooled_var()
+        num_chains = batch_means.shape[0]
+        return num_chains * self.count * var_hat / asymptotic_var.clamp(min=1e-10)
+
+
+class OnlineDiagnostics:
+    """
+    Running R-hat and effective sample sizes of the queries, computed from the
+    samples which are retained after adaptation as they are drawn. The diagnostics
+    are reported every ``report_every`` samples, and if ``max_r_hat`` or
+    ``min_ess`` are given, inference stops early once every query meets them.
+
+    R-hat compares the means and variances of the chains, and therefore needs all
+    chains to advance together: with these diagnostics, ``infer`` runs the chains
+    in lockstep in the current process (or together, with ``vectorize_chains``),
+    and cannot run them in parallel.
+
+    Args:
+        report_every: How many samples (of every chain) to draw between reports.
+        max_r_hat: If given, R-hat of every query must be below it to stop early.
+            Requires at least two chains.
+        min_ess: If given, the effective sample size of every query must be above
+            it to stop early.
+        min_samples: The minimum number of samples of every chain before stopping
+            early, defaults to 100.
+        num_batches: The minimum number of batches used to estimate the effective
+            sample size, defaults to 20.
+        callback: Called with the diagnostics at every report. Defaults to logging
+            the R-hat and effective sample size of every query.
+    """
+
+    def __init__(
+        self,
+        report_every: int = 100,
+        max_r_hat: Optional[float] = None,
+        min_ess: Optional[float] = None,
+        min_samples: int = 100,
+        num_batches: int = 20,
+        callback: Optional[Callable[["OnlineDiagnostics"], None]] = None,
+    ):
+        if report_every < 1:
+            raise ValueError("report_every must be positive.")
+        if num_batches < 2:
+            raise ValueError("num_batches must be at least 2.")
+        self.report_every = report_every
+        self.max_r_hat = max_r_hat
+        self.min_ess = min_ess
+        self.min_samples = min_samples
+        self.num_batches = num_batches
+        self.callback = callback or _log_diagnostics
+        self.queries: List[RVIdentifier] = []
+        self._statistics: List[_RunningStatistics] = []
+
+    def begin(self, queries: List[RVIdentifier], num_chains: int) -> None:
+        """Called by ``infer`` before the chains start, and resets the statistics"""
+        if self.max_r_hat is not None and num_chains < 2:
+            raise ValueError("Stopping on R-hat requires at least two chains.")
+        self.queries = list(queries)
+        self._statistics = [_RunningStatistics(self.num_batches) for _ in queries]
+
+    @property
+    def num_samples(self) -> int:
+        """The number of samples of every chain seen so far"""
+        return self._statistics[0].count if len(self._statistics) > 0 else 0
+
+    def update(self, values: List[Tensor]) -> None:
+        """
+        Adds one sample of every chain.
+
+        Args:
+            values: The values of the queries, in order, each with a leading chain
+                dimension.
+        """
+        for statistics, value in zip(self._statistics, values):
+            statistics.update(value.detach())
+        if self.num_samples % self.report_every == 0:
+            self.callback(self)
+
+    def r_hat(self) -> Dict[RVIdentifier, Optional[Tensor]]:
+        """R-hat of every query, or None with fewer than two chains"""
+        return {
+            query: statistics.r_hat()
+            for query, statistics in zip(self.queries, self._statistics)
+        }
+
+    def effective_sample_size(self) -> Dict[RVIdentifier, Optional[Tensor]]:
+        """The effective sample size of every query, or None while there are too
+        few samples to estimate it"""
+        return {
+            query: statistics.effective_sample_size()
+            for query, statistics in zip(self.queries, self._statistics)
+        }
+
+    def converged(self) -> bool:
+        """Whether inference can stop early, i.e. whether a stopping criterion was
+        given and every query meets all of the given criteria"""
+        if self.max_r_hat is None and self.min_ess is None:
+            return False
+        if self.num_samples < self.min_samples:
+            return False
+        if self.max_r_hat is not None:
+            for r_hat in self.r_hat().values():
+                if r_hat is None or not bool((r_hat < self.max_r_hat).all()):
+                    return False
+        if self.min_ess is not None:
+            for ess in self.effective_sample_size().values():
+                if ess is None or not bool((ess > self.min_ess).all()):
+                    return False
+        return True
+
+
+def _log_diagnostics(diagnostics: OnlineDiagnostics) -> None:
+    r_hats = diagnostics.r_hat()
+    effective_sample_sizes = diagnostics.effective_sample_size()
+    for query in diagnostics.queries:
+        r_hat = r_hats[query]
+        ess = effective_sample_sizes[query]
+        # report the worst dimension of each query
+        r_hat_str = "n/a" if r_hat is None else f"{r_hat.max().item():.4f}"
+        ess_str = "n/a" if ess is None else f"{ess.min().item():.1f}"
+        LOGGER.info(
+            f"{diagnostics.num_samples} samples: {query} has R-hat {r_hat_str} and "
+            f"effective sample size {ess_str}"
+        )
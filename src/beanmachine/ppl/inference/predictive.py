@@ -3,7 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Set, Union
 
 import torch
 from beanmachine.ppl.inference.monte_carlo_samples import MonteCarloSamples
@@ -17,15 +17,155 @@ from torch.distributions import Categorical
 from tqdm.auto import trange
 
 
-def _concat_rv_dicts(rvdict: List) -> Dict:
-    out_dict = {}
-    keys = list(rvdict[0].keys())
-    for k in keys:
-        t = []
-        for x in rvdict:
-            t.append(x[k])
-        out_dict[k] = torch.cat(t, -1).squeeze(0)
-    return out_dict
+def _call_queries(world: World, queries: List[RVIdentifier]) -> List[Tensor]:
+    values = []
+    for query in queries:
+        value = world.call(query)
+        if not isinstance(value, torch.Tensor):
+            raise TypeError(
+                "The value returned by a queried function must be a tensor."
+            )
+        values.append(value)
+    return values
+
+
+def _latent_ancestors(world: World, query: RVIdentifier) -> Set[RVIdentifier]:
+    """Returns the query and its ancestors in the world, up to the observed nodes"""
+    ancestors = set()
+    stack = [query]
+    while stack:
+        node = stack.pop()
+        if node in ancestors or node in world.observations:
+            continue
+        ancestors.add(node)
+        stack.extend(world.get_variable(node).parents)
+    return ancestors
+
+
+def _independent_groups(
+    queries: List[RVIdentifier], draws: RVDict
+) -> List[List[RVIdentifier]]:
+    """
+    Groups the queries which share latent ancestors, and hence have to be simulated
+    together, given the first draw. Queries in different groups are conditionally
+    independent given the draws.
+    """
+    world = World({node: value[0] for node, value in draws.items()}, init_from_prior)
+    _call_queries(world, queries)
+    groups: List[List[RVIdentifier]] = []
+    group_ancestors: List[Set[RVIdentifier]] = []
+    for query in queries:
+        ancestors = _latent_ancestors(world, query)
+        group = [query]
+        # merge the groups this query is connected to
+        for i in reversed(range(len(groups))):
+            if not ancestors.isdisjoint(group_ancestors[i]):
+                group = groups.pop(i) + group
+                ancestors |= group_ancestors.pop(i)
+        groups.append(group)
+        group_ancestors.append(ancestors)
+    return groups
+
+
+def _simulate_vmapped(
+    queries: List[RVIdentifier], draws: RVDict, num_draws: int, chunk_size: int
+) -> List[Tensor]:
+    """
+    Simulates the queries once for each draw, by vmapping the model over chunks of
+    ``chunk_size`` draws. Raises a RuntimeError if the model cannot be vmapped.
+    """
+    # Lazily import torch.func (PyTorch >= 2.0), so that the rest of Bean Machine
+    # can still be used with older versions
+    from torch.func import vmap
+
+    def simulate_draw(values: RVDict, draw_id: Tensor) -> List[Tensor]:
+        # draw_id only batches the call when the model does not depend on any
+        # draw, e.g. for prior predictives
+        return _call_queries(World(values, init_from_prior), queries)
+
+    chunks = []
+    for start in range(0, num_draws, chunk_size):
+        end = min(start + chunk_size, num_draws)
+        chunk = {node: value[start:end] for node, value in draws.items()}
+        chunks.append(
+            vmap(simulate_draw, randomness="different")(chunk, torch.arange(start, end))
+        )
+    return [torch.cat(values) for values in zip(*chunks)]
+
+
+def _simulate_sequentially(
+    queries: List[RVIdentifier], draws: RVDict, num_draws: int, progress_bar: bool
+) -> List[Tensor]:
+    """Simulates the queries once for each draw, one draw at a time."""
+    results = []
+    for i in trange(num_draws, desc="Samples collected", disable=not progress_bar):
+        values = {node: value[i] for node, value in draws.items()}
+        results.append(_call_queries(World(values, init_from_prior), queries))
+    return [torch.stack(values) for values in zip(*results)]
+
+
+def _simulate_draws(
+    queries: List[RVIdentifier],
+    draws: RVDict,
+    num_draws: int,
+    chunk_size: int,
+    progress_bar: bool,
+) -> Dict[RVIdentifier, Tensor]:
+    """
+    Simulates the queries once for each draw of the conditioned variables, stacking
+    the values along a leading draw dimension. The model is executed under vmap over
+    chunks of ``chunk_size`` draws. If the model cannot be vmapped (e.g. because it
+    branches on the values of its variables), the queries are split into groups of
+    conditionally independent queries, and only the groups which fail are simulated
+    one draw at a time, as are all of the queries if vmap is not available (it needs
+    PyTorch 2.0 or later).
+
+    Args:
+        queries: The random variables to simulate.
+        draws: Values of the variables to condition on, with a leading draw dimension.
+        num_draws: The number of draws.
+        chunk_size: The maximum number of draws simulated in a single vmapped call.
+        progress_bar: Whether to show a progress bar when simulating draw by draw.
+    """
+    try:
+        return dict(
+            zip(queries, _simulate_vmapped(queries, draws, num_draws, chunk_size))
+        )
+    except ImportError:
+        values = _simulate_sequentially(queries, draws, num_draws, progress_bar)
+        return dict(zip(queries, values))
+    except RuntimeError:
+        pass
+    samples = {}
+    for group in _independent_groups(queries, draws):
+        try:
+            values = _simulate_vmapped(group, draws, num_draws, chunk_size)
+        except RuntimeError:
+            values = _simulate_sequentially(group, draws, num_draws, progress_bar)
+        samples.update(zip(group, values))
+    return {query: samples[query] for query in queries}
+
+
+def _posterior_layout(values: Tensor) -> Tensor:
+    """
+    Given the values of a query of shape (chains, samples, *value_shape), returns
+    them with the samples of every chain concatenated along the last dimension of
+    the value, as posterior predictives which are not vectorized always have been.
+    """
+    if values.dim() == 2:
+        return values
+    return values.movedim(1, -2).flatten(-2)
+
+
+def _prior_layout(values: Tensor) -> Tensor:
+    """
+    Given the values of a query of shape (samples, *value_shape), returns them in a
+    single chain, with the samples concatenated along the first dimension of the
+    value, as prior predictives always have been.
+    """
+    if values.dim() == 1:
+        return values.unsqueeze(0)
+    return values.flatten(0, 1).unsqueeze(0)
 
 
 class Predictive(object):
@@ -56,6 +196,7 @@ class Predictive(object):
         num_samples: Optional[int] = None,
         vectorized: Optional[bool] = False,
         progress_bar: Optional[bool] = True,
+        chunk_size: int = 1024,
     ) -> MonteCarloSamples:
         """
         Generates predictives from a generative model.
@@ -77,18 +218,25 @@ class Predictive(object):
         :param posterior: Optional `MonteCarloSamples` or `RVDict` of the latent variables.
         :param num_samples: Number of prior predictive samples, defaults to 1. Should
             not be specified if `posterior` is specified.
+        :param vectorized: If True, the whole `posterior` is passed to a model which
+            broadcasts over the leading (chain, sample) dimensions. Otherwise, the
+            model is simulated once per draw, by vmapping it over chunks of draws,
+            and falling back to simulating draw by draw for the queries it cannot
+            be vmapped for.
+        :param chunk_size: The maximum number of draws simulated in a single
+            vmapped call, which bounds the memory used.
         :returns: `MonteCarloSamples` of the generated predictives.
         """
         assert (
             (posterior is not None) + (num_samples is not None)
         ) == 1, "Only one of posterior or num_samples should be set."
-        inference = SingleSiteAncestralMetropolisHastings()
         if posterior is not None:
             if isinstance(posterior, dict):
                 posterior = MonteCarloSamples([posterior])
 
             obs = dict(posterior)
             if vectorized:
+                inference = SingleSiteAncestralMetropolisHastings()
                 sampler = inference.sampler(
                     queries, obs, num_samples, initialize_fn=init_from_prior
                 )
@@ -106,62 +254,34 @@ class Predictive(object):
                 post_pred.add_groups(posterior)
                 return post_pred
             else:
-                # predictives are sequentially sampled
-                preds = []
-
-                for c in range(posterior.num_chains):
-                    rv_dicts = []
-                    for i in trange(
-                        posterior.get_num_samples(),
-                        desc="Samples collected",
-                        disable=not progress_bar,
-                    ):
-                        obs = {rv: posterior.get_chain(c)[rv][i] for rv in posterior}
-                        sampler = inference.sampler(
-                            queries, obs, num_samples, initialize_fn=init_from_prior
-                        )
-                        rv_dicts.append(
-                            Predictive._extract_values_from_world(
-                                next(sampler), queries
-                            )
-                        )
-                    preds.append(_concat_rv_dicts(rv_dicts))
+                # one predictive per posterior draw, simulated in vmapped chunks
+                num_chains = posterior.num_chains
+                num_draws = num_chains * posterior.get_num_samples()
+                draws = {
+                    rv: value.reshape((num_draws,) + value.shape[2:])
+                    for rv, value in obs.items()
+                }
+                query_dict = _simulate_draws(
+                    queries, draws, num_draws, chunk_size, bool(progress_bar)
+                )
                 post_pred = MonteCarloSamples(
-                    preds,
+                    {
+                        rvid: _posterior_layout(
+                            rv.reshape((num_chains, -1) + rv.shape[1:])
+                        )
+                        for rvid, rv in query_dict.items()
+                    },
                     default_namespace="posterior_predictive",
                 )
                 post_pred.add_groups(posterior)
                 return post_pred
         else:
-            obs = {}
-            predictives = []
-
-            for _ in trange(
-                # pyre-fixme[6]: For 1st param expected `int` but got `Optional[int]`.
-                num_samples,
-                desc="Samples collected",
-                disable=not progress_bar,
-            ):
-                sampler = inference.sampler(
-                    queries, obs, num_samples, initialize_fn=init_from_prior
-                )
-                query_dict = Predictive._extract_values_from_world(
-                    next(sampler), queries
-                )
-                predictives.append(query_dict)
-
-            rv_dict = {}
-            for k in predictives:
-                for rvid, rv in k.items():
-                    if rvid not in rv_dict:
-                        rv_dict[rvid] = []
-                    if rv.dim() < 2:
-                        rv = rv.unsqueeze(0)
-                    rv_dict[rvid].append(rv)
-            for k, v in rv_dict.items():
-                rv_dict[k] = torch.cat(v, dim=1)
+            assert num_samples is not None
+            query_dict = _simulate_draws(
+                queries, {}, num_samples, chunk_size, bool(progress_bar)
+            )
             prior_pred = MonteCarloSamples(
-                rv_dict,
+                {rvid: _prior_layout(rv) for rvid, rv in query_dict.items()},
                 default_namespace="prior_predictive",
             )
             return prior_pred
@@ -5,6 +5,7 @@
 
 import math
 from abc import abstractmethod
+from typing import Tuple
 
 import torch
 import torch.distributions as dist
@@ -15,8 +16,20 @@ from beanmachine.ppl.world import World
 
 
 class BaseSingleSiteMHProposer(BaseProposer):
-    def __init__(self, target_rv: RVIdentifier):
+    """
+    Base class for single site Metropolis-Hastings proposers.
+
+    Args:
+        target_rv: The random variable to propose a new value for.
+        use_markov_blanket: Whether to compute the acceptance ratio using only
+            the log prob of the target node, its children, and any node created
+            while updating them. If False, the log prob of the entire world is
+            used instead. Defaults to True.
+    """
+
+    def __init__(self, target_rv: RVIdentifier, use_markov_blanket: bool = True):
         self.node = target_rv
+        self.use_markov_blanket = use_markov_blanket
 
     def propose(self, world: World):
         """
@@ -35,10 +48,15 @@ class BaseSingleSiteMHProposer(BaseProposer):
         backward_dist = self.get_proposal_distribution(new_world)
 
         # calculate MH acceptance probability
-        # log P(x, y)
-        old_log_prob = world.log_prob()
-        # log P(x', y)
-        new_log_prob = new_world.log_prob()
+        if self.use_markov_blanket:
+            old_log_prob, new_log_prob = self._markov_blanket_log_probs(
+                world, new_world
+            )
+        else:
+            # log P(x, y)
+            old_log_prob = world.log_prob()
+            # log P(x', y)
+            new_log_prob = new_world.log_prob()
         # log g(x'|x)
         forward_log_prob = forward_dist.log_prob(proposed_value).sum()
         # log g(x|x')
@@ -63,6 +81,34 @@ class BaseSingleSiteMHProposer(BaseProposer):
 
         return new_world, accept_log_prob
 
+    def _markov_blanket_log_probs(
+        self, world: World, new_world: World
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Compute the terms of log P(x, y) and log P(x', y) that can differ between
+        the two worlds. Since ``World.replace`` only re-evaluates the children of
+        the replaced node, every other variable contributes the same log prob to
+        both worlds and cancels out of the acceptance ratio.
+
+        Args:
+            world: World before the proposal.
+            new_world: World after the proposal.
+
+        Returns:
+            A tuple of the local log prob of the old world and the new world.
+        """
+        markov_blanket = (
+            world.get_variable(self.node).children
+            | new_world.get_variable(self.node).children
+        )
+        markov_blanket.add(self.node)
+        old_nodes = [node for node in markov_blanket if node in world]
+        new_nodes = [node for node in markov_blanket if node in new_world]
+        if len(new_world) != len(world):
+            # nodes that are instantiated while re-evaluating the children
+            new_nodes.extend(new_world.keys() - world.keys() - markov_blanket)
+        return world.log_prob(old_nodes), new_world.log_prob(new_nodes)
+
     @abstractmethod
     def get_proposal_distribution(self, world: World) -> dist.Distribution:
         """Return a probability distribution of moving self.node to a new value
@@ -0,0 +1,298 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import math
+import warnings
+from typing import Callable, List, Optional, Set, Tuple
+
+import torch
+from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+from beanmachine.ppl.inference.proposer.hmc_utils import (
+    DualAverageAdapter,
+    MassMatrixAdapter,
+    RealSpaceTransform,
+    WindowScheme,
+)
+from beanmachine.ppl.inference.proposer.utils import DictToVecConverter
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.utils.validation import argument_validation_disabled
+from beanmachine.ppl.world import World
+
+
+def _is_cholesky_error(e: RuntimeError) -> bool:
+    err_msg = str(e)
+    return "singular U" in err_msg or "input is not positive-definite" in err_msg
+
+
+class BatchedHMCProposer(HMCProposer):
+    """
+    A Hamiltonian Monte Carlo proposer which advances several chains at once. The
+    positions of all chains are stored in a single (num_chains x D) tensor, and the
+    potential energy and its gradient are evaluated for every chain in a single
+    vectorized call by mapping the model over the chain dimension with
+    ``torch.func.vmap``, which requires PyTorch 2.0 or later. As a result the model
+    is still written for a single chain.
+
+    Every chain has its own step size, mass matrix and accept/reject decision. Chains
+    with a larger step size take fewer leapfrog steps; they simply stop moving once
+    they have reached the end of their trajectory.
+
+    The structure of the model (i.e. which random variables exist and how they depend
+    on each other) must be the same for all chains. If the model cannot be evaluated
+    under ``vmap``, e.g. because it contains data-dependent control flow, then the
+    chains are evaluated one at a time instead.
+
+    Args:
+        initial_worlds: Initial worlds to propose from, one per chain.
+        target_rvs: Set of RVIdentifiers to indicate which variables to propose.
+        num_adaptive_samples: Number of adaptive samples to run.
+        trajectory_length: Length of single trajectory.
+        initial_step_size: Initial step size.
+        adapt_step_size: Flag whether to adapt step size, defaults to True.
+        adapt_mass_matrix: Flat whether to adapt mass matrix, defaults to True.
+        full_mass_matrix: Flag whether to use a dense mass matrix, defaults to False.
+        target_accept_prob: Target accept prob, defaults to 0.8.
+    """
+
+    def __init__(
+        self,
+        initial_worlds: List[World],
+        target_rvs: Set[RVIdentifier],
+        num_adaptive_samples: int,
+        trajectory_length: float,
+        initial_step_size: float = 1.0,
+        adapt_step_size: bool = True,
+        adapt_mass_matrix: bool = True,
+        full_mass_matrix: bool = False,
+        target_accept_prob: float = 0.8,
+    ):
+        # the first world is used as a template of the model structure; the values
+        # of every chain are stored in the position tensor
+        self.world = initial_worlds[0]
+        self._target_rvs = target_rvs
+        self._to_unconstrained = RealSpaceTransform(self.world, target_rvs)
+        positions_dicts = [
+            self._to_unconstrained({node: world[node] for node in self._target_rvs})
+            for world in initial_worlds
+        ]
+        self._dict2vec = DictToVecConverter(positions_dicts[0])
+        self._positions = torch.stack(
+            [self._dict2vec.to_vec(positions) for positions in positions_dicts]
+        )
+        self._use_vmap = True
+        # the potential energy is vmapped over the chains, so it is not traced
+        self._traced_potential = None
+        # cache pe and pe_grad to prevent re-computation
+        self._pe, self._pe_grad = self._potential_grads(self._positions)
+        # initialize parameters
+        self.trajectory_length = trajectory_length
+        # initialize adapters
+        self.adapt_step_size = adapt_step_size
+        self.adapt_mass_matrix = adapt_mass_matrix
+        self._mass_matrix_adapter = MassMatrixAdapter(self._positions, full_mass_matrix)
+        initial_step_sizes = torch.full(
+            (len(initial_worlds),), initial_step_size, dtype=self._positions.dtype
+        )
+        if self.adapt_step_size:
+            self.step_size = self._find_reasonable_step_size(
+                initial_step_sizes,
+                self._positions,
+                self._pe,
+                self._pe_grad,
+            )
+            self._step_size_adapter = DualAverageAdapter(
+                self.step_size, target_accept_prob
+            )
+        else:
+            self.step_size = initial_step_sizes
+        if self.adapt_mass_matrix:
+            self._window_scheme = WindowScheme(num_adaptive_samples)
+        else:
+            self._window_scheme = None
+        # alpha will store the accept probs and will be used to adapt step sizes
+        self._alpha = None
+
+    @property
+    def num_chains(self) -> int:
+        return self._positions.shape[0]
+
+    def _world_at(self, positions: torch.Tensor) -> World:
+        """Returns the world of a single chain at the given (unconstrained) positions"""
+        positions_dict = self._dict2vec.to_dict(positions)
+        return self.world.replace(self._to_unconstrained.inv(positions_dict))
+
+    def _vmap_failed(self, e: RuntimeError) -> None:
+        if not _is_cholesky_error(e):
+            warnings.warn(
+                f"Unable to vectorize the model over chains ({e}). The chains will be"
+                " evaluated one at a time."
+            )
+            self._use_vmap = False
+
+    def call(self, f: Callable[[World], List[torch.Tensor]]) -> List[torch.Tensor]:
+        """
+        Evaluates a function on the world of every chain. The function takes a World
+        and returns a list of Tensors; the result is the list of the corresponding
+        Tensors of all chains, stacked along a leading chain dimension.
+        """
+
+        def call_at(positions: torch.Tensor) -> List[torch.Tensor]:
+            return f(self._world_at(positions))
+
+        if self._use_vmap:
+            # Lazily import torch.func (PyTorch >= 2.0), so that only vectorized
+            # chains need it
+            from torch.func import vmap
+
+            with argument_validation_disabled():
+                try:
+                    return vmap(call_at)(self._positions)
+                except RuntimeError as e:
+                    self._vmap_failed(e)
+        results = [call_at(positions) for positions in self._positions]
+        return [torch.stack(values) for values in zip(*results)]
+
+    def _scale_r(self, momentums: torch.Tensor, mass_inv: torch.Tensor) -> torch.Tensor:
+        """Return the momentums (r) scaled by M^{-1} @ r for each chain"""
+        if self._mass_matrix_adapter.diagonal:
+            return mass_inv * momentums
+        else:
+            return (mass_inv @ momentums.unsqueeze(-1)).squeeze(-1)
+
+    def _kinetic_energy(
+        self, momentums: torch.Tensor, mass_inv: torch.Tensor
+    ) -> torch.Tensor:
+        """Returns the kinetic energy KE = 1/2 * p^T @ M^{-1} @ p of each chain"""
+        r_scale = self._scale_r(momentums, mass_inv)
+        return (momentums * r_scale).sum(-1) / 2
+
+    def _potential_grads(
+        self, positions: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Returns the potential energy of each chain as well as its gradient with
+        respect to the positions of that chain."""
+        if self._use_vmap:
+            from torch.func import grad_and_value, vmap
+
+            with argument_validation_disabled():
+                try:
+                    grads, pe = vmap(grad_and_value(self._potential_energy))(positions)
+                    return pe.detach(), grads.detach()
+                except RuntimeError as e:
+                    # on Cholesky errors fall through so that only the chains which
+                    # failed get NaN
+                    self._vmap_failed(e)
+        pes, grads = zip(
+            *(
+                super(BatchedHMCProposer, self)._potential_grads(p.clone())
+                for p in positions
+            )
+        )
+        return torch.stack(pes), torch.stack(grads)
+
+    def _leapfrog_updates(
+        self,
+        positions: torch.Tensor,
+        momentums: torch.Tensor,
+        trajectory_length: float,
+        step_size: torch.Tensor,
+        mass_inv: torch.Tensor,
+        pe_grad: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Run leapfrog integration for every chain until the length of its trajectory
+        is greater than the specified trajectory_length. All chains are updated
+        together; a chain which has finished its trajectory is left unchanged."""
+        # we should run at least 1 step
+        num_steps = torch.ceil(trajectory_length / step_size).clamp(min=1)
+        pe = None
+        for i in range(int(num_steps.max().item())):
+            new_positions, new_momentums, new_pe, new_pe_grad = self._leapfrog_step(
+                positions, momentums, step_size.unsqueeze(-1), mass_inv, pe_grad
+            )
+            if i == 0:
+                positions, momentums = new_positions, new_momentums
+                pe, pe_grad = new_pe, new_pe_grad
+                continue
+            is_active = i < num_steps
+            positions = torch.where(is_active.unsqueeze(-1), new_positions, positions)
+            momentums = torch.where(is_active.unsqueeze(-1), new_momentums, momentums)
+            pe = torch.where(is_active, new_pe, pe)
+            pe_grad = torch.where(is_active.unsqueeze(-1), new_pe_grad, pe_grad)
+        # pyre-ignore[7]: `pe` and `pe_grad` are set since we run at least 1 step
+        return positions, momentums, pe, pe_grad
+
+    def _find_reasonable_step_size(
+        self,
+        initial_step_size: torch.Tensor,
+        positions: torch.Tensor,
+        pe: torch.Tensor,
+        pe_grad: torch.Tensor,
+    ) -> torch.Tensor:
+        """A heuristic of finding a reasonable initial step size (epsilon) as introduced
+        in Algorithm 4 of [2], run for all chains at once. Each chain stops doubling
+        (or halving) its step size as soon as the direction changes for that chain."""
+        step_size = initial_step_size.clone()
+        target = math.log(0.8)
+
+        def direction_at(step_size: torch.Tensor) -> torch.Tensor:
+            momentums = self._initialize_momentums(positions)
+            energy = self._hamiltonian(positions, momentums, self._mass_inv, pe)
+            new_positions, new_momentums, new_pe, _ = self._leapfrog_step(
+                positions, momentums, step_size.unsqueeze(-1), self._mass_inv, pe_grad
+            )
+            new_energy = self._hamiltonian(
+                new_positions, new_momentums, self._mass_inv, new_pe
+            )
+            # NaN will evaluate to False and set direction to -1
+            return torch.where(energy - new_energy > target, 1.0, -1.0)
+
+        direction = direction_at(step_size)
+        is_searching = torch.ones_like(direction, dtype=torch.bool)
+        while is_searching.any():
+            step_size = torch.where(
+                is_searching, step_size * 2.0**direction, step_size
+            )
+            if (step_size[is_searching] == 0).any():
+                raise ValueError(
+                    f"Current step sizes are {step_size}. No acceptably small step size"
+                    " could be found. Perhaps the posterior is not continuous?"
+                )
+            if (step_size[is_searching] > 1e7).any():
+                raise ValueError(
+                    f"Current step sizes are {step_size}. Posterior is improper. Please"
+                    " check your model"
+                )
+            is_searching = is_searching & (direction_at(step_size) == direction)
+        return step_size
+
+    def propose(self, world: World) -> Tuple[World, torch.Tensor]:
+        """Advances every chain by one HMC iteration. The state of the chains is kept
+        by the proposer, so the template world is returned unchanged."""
+        momentums = self._initialize_momentums(self._positions)
+        current_energy = self._hamiltonian(
+            self._positions, momentums, self._mass_inv, self._pe
+        )
+        positions, momentums, pe, pe_grad = self._leapfrog_updates(
+            self._positions,
+            momentums,
+            self.trajectory_length,
+            self.step_size,
+            self._mass_inv,
+            self._pe_grad,
+        )
+        new_energy = torch.nan_to_num(
+            self._hamiltonian(positions, momentums, self._mass_inv, pe),
+            float("inf"),
+        )
+        delta_energy = new_energy - current_energy
+        self._alpha = torch.clamp(torch.exp(-delta_energy), max=1.0)
+        # accept/reject the new positions of each chain
+        is_accepted = torch.bernoulli(self._alpha).bool()
+        self._positions = torch.where(
+            is_accepted.unsqueeze(-1), positions, self._positions
+        )
+        self._pe = torch.where(is_accepted, pe, self._pe)
+        self._pe_grad = torch.where(is_accepted.unsqueeze(-1), pe_grad, self._pe_grad)
+        return self.world, torch.zeros_like(self._alpha)
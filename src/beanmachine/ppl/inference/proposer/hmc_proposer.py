@@ -14,6 +14,7 @@ from beanmachine.ppl.inference.proposer.hmc_utils import (
     DualAverageAdapter,
     MassMatrixAdapter,
     RealSpaceTransform,
+    TracedPotential,
     WindowScheme,
 )
 from beanmachine.ppl.inference.proposer.utils import DictToVecConverter
@@ -48,6 +49,11 @@ class HMCProposer(BaseProposer):
         target_accept_prob: Target accept prob, defaults to 0.8.
         nnc_compile: If True, NNC compiler will be used to accelerate the
             inference.
+        trace_potential: If True, and no JIT backend is used, the potential energy
+            is traced once into a TorchScript function of the positions (see
+            `TracedPotential`), instead of re-running the model in a copy of the
+            world at every leapfrog step. Falls back to the latter if the model
+            cannot be traced or if the structure of the world changes.
     """
 
     def __init__(
@@ -62,6 +68,7 @@ class HMCProposer(BaseProposer):
         full_mass_matrix: bool = False,
         target_accept_prob: float = 0.8,
         jit_backend: TorchJITBackend = TorchJITBackend.NNC,
+        trace_potential: bool = False,
     ):
         self.world = initial_world
         self._target_rvs = target_rvs
@@ -72,6 +79,14 @@ class HMCProposer(BaseProposer):
         )
         self._dict2vec = DictToVecConverter(positions_dict)
         self._positions = self._dict2vec.to_vec(positions_dict)
+        self._traced_potential = None
+        if trace_potential and jit_backend is TorchJITBackend.NONE:
+            self._traced_potential = TracedPotential.trace(
+                self._world_potential_energy,
+                initial_world,
+                target_rvs,
+                self._positions,
+            )
         # cache pe and pe_grad to prevent re-computation
         self._pe, self._pe_grad = self._potential_grads(self._positions)
         # initialize parameters
@@ -135,6 +150,13 @@ class HMCProposer(BaseProposer):
     def _potential_energy(self, positions: torch.Tensor) -> torch.Tensor:
         """Returns the potential energy PE = - L(world) (the joint log likelihood of the
         current values)"""
+        if self._traced_potential is not None:
+            return self._traced_potential(positions)
+        return self._world_potential_energy(positions)
+
+    def _world_potential_energy(self, positions: torch.Tensor) -> torch.Tensor:
+        """Computes the potential energy by re-running the model in a copy of the
+        world with the given positions"""
         positions_dict = self._dict2vec.to_dict(positions)
         constrained_vals = self._to_unconstrained.inv(positions_dict)
         log_joint = self.world.replace(constrained_vals).log_prob()
@@ -283,10 +305,19 @@ class HMCProposer(BaseProposer):
             new_direction = 1 if energy - new_energy > target else -1
         return step_size
 
+    def _update_world(self, world: World) -> None:
+        """Sets the current world, and stops using the traced potential energy if it
+        is not valid for the new world"""
+        self.world = world
+        if self._traced_potential is not None and not self._traced_potential.matches(
+            world
+        ):
+            self._traced_potential = None
+
     def propose(self, world: World) -> Tuple[World, torch.Tensor]:
         if world is not self.world:
             # re-compute cached values since world was modified by other sources
-            self.world = world
+            self._update_world(world)
             self._positions = self._dict2vec.to_vec(
                 self._to_unconstrained({node: world[node] for node in self._target_rvs})
             )
@@ -312,7 +343,9 @@ class HMCProposer(BaseProposer):
         # accept/reject new world
         if torch.bernoulli(self._alpha):
             positions_dict = self._dict2vec.to_dict(positions)
-            self.world = self.world.replace(self._to_unconstrained.inv(positions_dict))
+            self._update_world(
+                self.world.replace(self._to_unconstrained.inv(positions_dict))
+            )
             # update cache
             self._positions, self._pe, self._pe_grad = positions, pe, pe_grad
         return self.world, torch.zeros_like(self._alpha)
@@ -5,7 +5,7 @@
 
 import math
 import warnings
-from typing import cast, Dict, Set, Union
+from typing import Callable, cast, Dict, FrozenSet, Optional, Set, Union
 
 import torch
 import torch.distributions as dist
@@ -106,7 +106,8 @@ class DualAverageAdapter:
 class MassMatrixAdapter:
     """
     Adapts the mass matrix. The (inverse) mass matrix is initialized to identity
-    and will be updated during adaptation windows.
+    and will be updated during adaptation windows. If the positions have a leading
+    batch dimension (e.g. one row per chain) then every row gets its own mass matrix.
 
     Args:
         matrix_size: The size of the mass matrix. This value should be the same
@@ -123,7 +124,7 @@ class MassMatrixAdapter:
         # distribution objects for generating momentums
         self.momentum_dist: dist.Distribution = dist.Normal(0.0, self.mass_inv)
         if full_mass_matrix:
-            self.mass_inv = torch.diag(self.mass_inv)
+            self.mass_inv = torch.diag_embed(self.mass_inv)
         self.diagonal = not full_mass_matrix
         self._adapter = WelfordCovariance(diagonal=self.diagonal)
 
@@ -149,7 +150,8 @@ class MassMatrixAdapter:
                 )
             else:
                 self.momentum_dist = dist.MultivariateNormal(
-                    torch.zeros_like(mass_inv.diag()), precision_matrix=mass_inv
+                    torch.zeros_like(mass_inv.diagonal(dim1=-2, dim2=-1)),
+                    precision_matrix=mass_inv,
                 )
             self.mass_inv = mass_inv
         except RuntimeError as e:
@@ -182,7 +184,8 @@ class WelfordCovariance:
         if self._diagonal:
             self._M2 += delta * delta2
         else:
-            self._M2 += torch.outer(delta, delta2)
+            # outer product, batched over any leading dimensions
+            self._M2 += delta.unsqueeze(-1) * delta2.unsqueeze(-2)
 
     def finalize(self, regularize: bool = True) -> torch.Tensor:
         if self._count < 2:
@@ -200,7 +203,7 @@ class WelfordCovariance:
         if self._diagonal:
             covariance += padding
         else:
-            covariance += padding * torch.eye(covariance.shape[0])
+            covariance += padding * torch.eye(covariance.shape[-1])
 
         return covariance
 
@@ -259,3 +262,89 @@ class RealSpaceTransform(DictTransform):
                 )
             transforms[node] = get_default_transforms(node_distribution)
         super().__init__(transforms)
+
+
+class TracedPotential:
+    """
+    The potential energy of a world, traced once with ``torch.jit.trace`` into a
+    TorchScript function of the flattened positions of the target variables. Calling
+    it neither copies the world nor re-runs the random variable functions, and the
+    TorchScript executor fuses the potential and its gradient.
+
+    The values of all of the other variables are baked into the trace as constants,
+    and so is whatever control flow the model took while it was traced. A trace is
+    therefore only valid for worlds with the same structure (the same variables,
+    with the same parents) and the same values of the non-target variables, which
+    ``matches`` checks.
+
+    Use ``TracedPotential.trace`` to construct one.
+
+    Args:
+        traced_fn: The traced potential energy function.
+        world: The world the potential energy was traced in.
+        target_rvs: Set of RVIdentifiers whose values are the inputs of the function.
+    """
+
+    def __init__(
+        self,
+        traced_fn: Callable[[torch.Tensor], torch.Tensor],
+        world: World,
+        target_rvs: Set[RVIdentifier],
+    ):
+        self._traced_fn = traced_fn
+        self._structure = _structure_of(world)
+        self._constants: Dict[RVIdentifier, torch.Tensor] = {
+            node: world[node] for node in world if node not in target_rvs
+        }
+
+    @classmethod
+    def trace(
+        cls,
+        potential_energy: Callable[[torch.Tensor], torch.Tensor],
+        world: World,
+        target_rvs: Set[RVIdentifier],
+        positions: torch.Tensor,
+    ) -> Optional["TracedPotential"]:
+        """
+        Traces the potential energy at the given positions, or returns None if the
+        potential energy of the world cannot be traced, e.g. because the model
+        branches on the values of the target variables.
+
+        Args:
+            potential_energy: The potential energy as a function of the positions,
+                which is evaluated in ``world``.
+            world: The world to trace the potential energy in.
+            target_rvs: Set of RVIdentifiers whose values are the positions.
+            positions: The flattened positions to trace at.
+        """
+        positions = positions.detach()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", torch.jit.TracerWarning)
+            try:
+                traced_fn = torch.jit.trace(
+                    potential_energy, (positions,), check_trace=False
+                )
+                traced_pe = traced_fn(positions)
+            except RuntimeError:
+                return None
+        # the tracer warns whenever the result might depend on the values of the
+        # inputs in ways the trace does not capture, e.g. through Python control flow
+        if any(issubclass(w.category, torch.jit.TracerWarning) for w in caught):
+            return None
+        if not torch.allclose(traced_pe, potential_energy(positions), equal_nan=True):
+            return None
+        return cls(traced_fn, world, target_rvs)
+
+    def matches(self, world: World) -> bool:
+        """Returns whether the trace is valid for the given world."""
+        if _structure_of(world) != self._structure:
+            return False
+        return all(world[node] is value for node, value in self._constants.items())
+
+    def __call__(self, positions: torch.Tensor) -> torch.Tensor:
+        return self._traced_fn(positions)
+
+
+def _structure_of(world: World) -> Dict[RVIdentifier, FrozenSet[RVIdentifier]]:
+    """Returns the parents of every variable in the world."""
+    return {node: frozenset(world.get_variable(node).parents) for node in world}
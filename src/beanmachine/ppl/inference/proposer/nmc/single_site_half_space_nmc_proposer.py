@@ -4,6 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import logging
+from functools import partial
 from typing import Tuple
 
 import torch
@@ -29,12 +30,46 @@ class SingleSiteHalfSpaceNMCProposer(SingleSiteAncestralProposer):
     See sec. 3.2 of [1]
 
     [1] Arora, Nim, et al. `Newtonian Monte Carlo: single-site MCMC meets second-order gradient methods`
+
+    Args:
+        node: The random variable to propose values for.
+        hessian: How to compute the diagonal of the Hessian, one of
+            ``tensorops.HESSIAN_ESTIMATORS``. Defaults to "dense"; "separable" or
+            "hutchinson" avoid the quadratic cost for large vector-valued nodes.
+        num_probes: The number of random vectors used by the "hutchinson" estimator.
+            Each proposal draws new vectors, and uses the same ones for the forward
+            and the reverse proposal densities, so that the Metropolis-Hastings
+            correction is exact.
     """
 
-    def __init__(self, node: RVIdentifier):
+    def __init__(
+        self, node: RVIdentifier, hessian: str = "dense", num_probes: int = 16
+    ):
         super().__init__(node)
+        if hessian not in tensorops.HESSIAN_ESTIMATORS:
+            raise ValueError(
+                f"Unknown Hessian estimator {hessian}; expected one of "
+                f"{tensorops.HESSIAN_ESTIMATORS}."
+            )
+        self._hessian = hessian
+        self._num_probes = num_probes
+        self._probes = None
         self._proposal_distribution = None
 
+    def propose(self, world: World):
+        """Like the base proposer, but draws the random vectors of the "hutchinson"
+        estimator once for both the forward and the reverse proposal densities."""
+        if self._hessian != "hutchinson":
+            return super().propose(world)
+        node_val = world[self.node]
+        self._probes = tensorops.rademacher_probes(
+            self._num_probes, node_val.numel(), node_val.dtype, node_val.device
+        )
+        try:
+            return super().propose(world)
+        finally:
+            self._probes = None
+
     def compute_alpha_beta(
         self, world: World
     ) -> Tuple[bool, torch.Tensor, torch.Tensor]:
@@ -45,7 +80,15 @@ class SingleSiteHalfSpaceNMCProposer(SingleSiteAncestralProposer):
         """
         node_val = world[self.node]
         first_gradient, hessian_diag = hessian_of_log_prob(
-            world, self.node, node_val, tensorops.halfspace_gradients
+            world,
+            self.node,
+            node_val,
+            partial(
+                tensorops.halfspace_gradients,
+                hessian=self._hessian,
+                num_probes=self._num_probes,
+                probes=self._probes,
+            ),
         )
         if not is_valid(first_gradient) or not is_valid(hessian_diag):
             LOGGER.warning(
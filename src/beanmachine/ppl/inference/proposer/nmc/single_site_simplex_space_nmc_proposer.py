@@ -4,6 +4,7 @@
 # LICENSE file in the root directory of this source tree.
 
 import logging
+from functools import partial
 from typing import Tuple
 
 import torch
@@ -29,13 +30,32 @@ class SingleSiteSimplexSpaceNMCProposer(SingleSiteAncestralProposer):
     See sec. 3.2 of [1]
 
     [1] Arora, Nim, et al. `Newtonian Monte Carlo: single-site MCMC meets second-order gradient methods`
+
+    Args:
+        node: The random variable to propose values for.
+        transform: Transforms the value of the node onto the simplex.
+        hessian: How to compute the diagonal of the Hessian and the maximum
+            off-diagonal entry of each column, one of "dense" (the default),
+            "blocked" or "separable"; see ``tensorops.HESSIAN_ESTIMATORS``.
+            "separable" assumes that the off-diagonal entries of the Hessian are
+            all zero, as they are when the log prob is a sum of functions of the
+            individual entries of the node; otherwise the proposal is skewed.
     """
 
     def __init__(
-        self, node: RVIdentifier, transform: dist.Transform = dist.identity_transform
+        self,
+        node: RVIdentifier,
+        transform: dist.Transform = dist.identity_transform,
+        hessian: str = "dense",
     ):
         super().__init__(node)
+        if hessian not in ("dense", "blocked", "separable"):
+            raise ValueError(
+                f"Unknown Hessian estimator {hessian} for a simplex; expected one of "
+                "('dense', 'blocked', 'separable')."
+            )
         self._transform = transform
+        self._hessian_fn = partial(tensorops.simplex_gradients, hessian=hessian)
         self._proposal_distribution = None
 
     def compute_alpha(
@@ -52,7 +72,7 @@ class SingleSiteSimplexSpaceNMCProposer(SingleSiteAncestralProposer):
         """
         node_val = self._transform(world[self.node])
         first_gradient, hessian_diag_minus_max = hessian_of_log_prob(
-            world, self.node, node_val, tensorops.simplex_gradients, self._transform
+            world, self.node, node_val, self._hessian_fn, self._transform
         )
         if not is_valid(first_gradient) or not is_valid(hessian_diag_minus_max):
             LOGGER.warning(
@@ -43,9 +43,10 @@ class NUTSProposer(HMCProposer):
     """
     The No-U-Turn Sampler (NUTS) as described in [1]. Unlike vanilla HMC, it does not
     require users to specify a trajectory length. The current implementation roughly
-    follows Algorithm 6 of [1]. If multinomial_sampling is True, then the next state
-    will be drawn from a multinomial distribution (weighted by acceptance probability,
-    as introduced in Appendix 2 of [2]) instead of drawn uniformly.
+    follows Algorithm 6 of [1], with the subtrees built iteratively. If
+    multinomial_sampling is True, then the next state will be drawn from a
+    multinomial distribution (weighted by acceptance probability, as introduced in
+    Appendix 2 of [2]) instead of drawn uniformly.
 
     Reference:
         [1] Matthew Hoffman and Andrew Gelman. "The No-U-Turn Sampler: Adaptively
@@ -68,6 +69,8 @@ class NUTSProposer(HMCProposer):
         target_accept_prob: Target accept probability. Increasing this would lead to smaller step size. Defaults to 0.8.
         nnc_compile: If True, NNC compiler will be used to accelerate the
             inference.
+        trace_potential: If True, and no JIT backend is used, the potential energy
+            is traced into a TorchScript function of the positions, see `HMCProposer`.
     """
 
     def __init__(
@@ -84,6 +87,7 @@ class NUTSProposer(HMCProposer):
         multinomial_sampling: bool = True,
         target_accept_prob: float = 0.8,
         jit_backend: TorchJITBackend = TorchJITBackend.NNC,
+        trace_potential: bool = False,
     ):
         # note that trajectory_length is not used in NUTS
         super().__init__(
@@ -97,10 +101,16 @@ class NUTSProposer(HMCProposer):
             full_mass_matrix=full_mass_matrix,
             target_accept_prob=target_accept_prob,
             jit_backend=TorchJITBackend.NONE,  # we will use NNC at NUTS level, not at HMC level
+            trace_potential=trace_potential and jit_backend is TorchJITBackend.NONE,
         )
         self._max_tree_depth = max_tree_depth
         self._max_delta_energy = max_delta_energy
         self._multinomial_sampling = multinomial_sampling
+        # checkpoints of the subtrees which are being built, see _build_tree
+        self._checkpoint_momentums = self._positions.new_empty(
+            (2, max_tree_depth, len(self._positions))
+        )
+        self._checkpoint_sums = torch.empty_like(self._checkpoint_momentums[0])
         # pyre-ignore[8]
         self._build_tree_base_case = jit_compile(
             self._build_tree_base_case, jit_backend
@@ -120,8 +130,8 @@ class NUTSProposer(HMCProposer):
         )
 
     def _build_tree_base_case(self, root: _TreeNode, args: _TreeArgs) -> _Tree:
-        """Base case of the recursive tree building algorithm: take a single leapfrog
-        step in the specified direction and return a subtree."""
+        """Base case of the tree building algorithm: take a single leapfrog step in
+        the specified direction and return a subtree."""
         positions, momentums, pe, pe_grad = self._leapfrog_step(
             root.positions,
             root.momentums,
@@ -156,18 +166,113 @@ class NUTSProposer(HMCProposer):
         )
 
     def _build_tree(self, root: _TreeNode, tree_depth: int, args: _TreeArgs) -> _Tree:
+        """Build the binary tree of 2^tree_depth leapfrog steps from root one leaf at
+        a time, as in the iterative NUTS of Stan and NumPyro, rather than recursively.
+
+        The result is distributed as the result of ``_build_tree_recursively``. The
+        proposal is drawn by sequential uniform progressive sampling, which selects
+        every leaf with the same probability as combining the subtrees pairwise. The
+        U-turn criterion of every balanced subtree is checked once its last leaf is
+        built, from the momentums at the boundaries of the subtree and the sums of
+        the momentums before them, which are checkpointed in preallocated buffers:
+        row k holds those of the last subtree of 2^k leaves."""
+        start_momentums, end_momentums = self._checkpoint_momentums
+        start_sums = self._checkpoint_sums
+        sum_momentums = torch.zeros_like(root.momentums)
+        node = root
+        for leaf_idx in range(2**tree_depth):
+            leaf = self._build_tree_base_case(node, args)
+            node = leaf.left
+            if leaf_idx == 0:
+                first_node, selected_leaf = node, leaf
+                log_weight = leaf.log_weight
+                sum_accept_prob = leaf.sum_accept_prob
+            else:
+                log_weight = torch.logaddexp(log_weight, leaf.log_weight)
+                sum_accept_prob = sum_accept_prob + leaf.sum_accept_prob
+                if torch.rand_like(log_weight).log() < leaf.log_weight - log_weight:
+                    selected_leaf = leaf
+
+            # the leaf starts a subtree of 2^k leaves for every 2^k dividing its index
+            k = 1
+            while k <= tree_depth and leaf_idx % 2**k == 0:
+                start_momentums[k] = node.momentums
+                start_sums[k] = sum_momentums
+                k += 1
+            sum_momentums = sum_momentums + node.momentums
+            turned_or_diverged = bool(leaf.turned_or_diverged)
+            if turned_or_diverged:
+                break
+            # and ends one for every 2^k dividing the number of leaves so far
+            k = 1
+            while k <= tree_depth and (leaf_idx + 1) % 2**k == 0:
+                turned_or_diverged = bool(
+                    self._is_u_turning(
+                        args.mass_inv,
+                        start_momentums[k],
+                        node.momentums,
+                        sum_momentums - start_sums[k],
+                    )
+                )
+                # More robust U-turn condition across the two halves of the subtree,
+                # as in _combine_tree
+                if not turned_or_diverged and k > 1:
+                    turned_or_diverged = bool(
+                        self._is_u_turning(
+                            args.mass_inv,
+                            start_momentums[k],
+                            start_momentums[k - 1],
+                            start_sums[k - 1] - start_sums[k] + start_momentums[k - 1],
+                        )
+                        or self._is_u_turning(
+                            args.mass_inv,
+                            end_momentums[k - 1],
+                            node.momentums,
+                            sum_momentums - start_sums[k - 1] + end_momentums[k - 1],
+                        )
+                    )
+                if turned_or_diverged:
+                    break
+                k += 1
+            if turned_or_diverged:
+                break
+            # the subtrees the leaf ends are the first halves of the next larger ones
+            for j in range(1, min(k, tree_depth)):
+                end_momentums[j] = node.momentums
+
+        if args.direction == -1:
+            left, right = node, first_node
+        else:
+            left, right = first_node, node
+        return _Tree(
+            left=left,
+            right=right,
+            proposal=selected_leaf.proposal,
+            pe=selected_leaf.pe,
+            pe_grad=selected_leaf.pe_grad,
+            log_weight=log_weight,
+            sum_momentums=sum_momentums,
+            sum_accept_prob=sum_accept_prob,
+            num_proposals=torch.tensor(leaf_idx + 1),
+            turned_or_diverged=torch.tensor(turned_or_diverged),
+        )
+
+    def _build_tree_recursively(
+        self, root: _TreeNode, tree_depth: int, args: _TreeArgs
+    ) -> _Tree:
         """Build the binary tree by recursively build the left and right subtrees and
-        combine the two."""
+        combine the two. This is the reference implementation of ``_build_tree``,
+        which follows Algorithm 6 of [1] more literally."""
         if tree_depth == 0:
             return self._build_tree_base_case(root, args)
 
         # build the first half of the tree
-        sub_tree = self._build_tree(root, tree_depth - 1, args)
+        sub_tree = self._build_tree_recursively(root, tree_depth - 1, args)
         if sub_tree.turned_or_diverged:
             return sub_tree
 
         # build the other half of the tree
-        other_sub_tree = self._build_tree(
+        other_sub_tree = self._build_tree_recursively(
             root=sub_tree.left if args.direction == -1 else sub_tree.right,
             tree_depth=tree_depth - 1,
             args=args,
@@ -263,7 +368,7 @@ class NUTSProposer(HMCProposer):
     def propose(self, world: World) -> Tuple[World, torch.Tensor]:
         if world is not self.world:
             # re-compute cached values since world was modified by other sources
-            self.world = world
+            self._update_world(world)
             self._positions = self._dict2vec.to_vec(
                 self._to_unconstrained({node: world[node] for node in self._target_rvs})
             )
@@ -294,8 +399,10 @@ class NUTSProposer(HMCProposer):
             turned_or_diverged=torch.tensor(False),
         )
 
+        # the directions of all of the doublings are drawn at once
+        directions = (torch.rand(self._max_tree_depth) > 0.5).long() * 2 - 1
         for j in range(self._max_tree_depth):
-            direction = torch.tensor(1 if torch.rand(()) > 0.5 else -1)
+            direction = directions[j]
             tree_args = _TreeArgs(
                 log_slice,
                 direction,
@@ -316,7 +423,9 @@ class NUTSProposer(HMCProposer):
 
         if tree.proposal is not self._positions:
             positions_dict = self._dict2vec.to_dict(tree.proposal)
-            self.world = self.world.replace(self._to_unconstrained.inv(positions_dict))
+            self._update_world(
+                self.world.replace(self._to_unconstrained.inv(positions_dict))
+            )
             self._positions, self._pe, self._pe_grad = (
                 tree.proposal,
                 tree.pe,
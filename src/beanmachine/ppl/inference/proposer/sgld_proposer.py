@@ -0,0 +1,97 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import Optional, Set, Tuple
+
+import torch
+from beanmachine.ppl.inference.minibatch import Minibatch
+from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
+from beanmachine.ppl.inference.proposer.hmc_utils import RealSpaceTransform
+from beanmachine.ppl.inference.proposer.utils import DictToVecConverter
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.world import World
+
+
+class SGLDProposer(BaseProposer):
+    """
+    Stochastic Gradient Langevin Dynamics (SGLD) [1]. Every step moves the target
+    variables, in the unconstrained space, along the gradient of the log joint plus
+    Gaussian noise:
+
+        positions += step_size / 2 * grad(log p) + Normal(0, step_size)
+
+    where the log likelihood of the observations in a ``Minibatch`` is estimated from
+    a batch of them, drawn at every step. There is no accept/reject step, so with a
+    constant step size the samples are only approximately distributed according to
+    the posterior, with an error which shrinks with the step size.
+
+    Reference:
+        [1] Max Welling and Yee Whye Teh. "Bayesian Learning via Stochastic
+            Gradient Langevin Dynamics" (2011).
+
+    Args:
+        initial_world: Initial world to propose from.
+        target_rvs: Set of RVIdentifiers to indicate which variables to propose.
+        step_size: The step size.
+        minibatch: The plate of observations to subsample at every step. If None,
+            only the observations of the world are used, so the gradient is exact.
+    """
+
+    def __init__(
+        self,
+        initial_world: World,
+        target_rvs: Set[RVIdentifier],
+        step_size: float,
+        minibatch: Optional[Minibatch] = None,
+    ):
+        self.world = initial_world
+        self._target_rvs = target_rvs
+        self.step_size = step_size
+        self.minibatch = minibatch
+        self._to_unconstrained = RealSpaceTransform(initial_world, target_rvs)
+        self._dict2vec = DictToVecConverter(
+            self._to_unconstrained(
+                {node: initial_world[node] for node in self._target_rvs}
+            )
+        )
+
+    def _log_joint(self, positions: torch.Tensor) -> torch.Tensor:
+        """Returns the log joint of the world at the given (unconstrained) positions,
+        with the log likelihood of the minibatch estimated from a batch"""
+        positions_dict = self._dict2vec.to_dict(positions)
+        constrained_vals = self._to_unconstrained.inv(positions_dict)
+        log_joint = self.world.replace(constrained_vals).log_prob()
+        log_joint = log_joint - self._to_unconstrained.log_abs_det_jacobian(
+            constrained_vals, positions_dict
+        )
+        if self.minibatch is not None:
+            batch = self.minibatch.next_batch()
+            # the batch is evaluated in a world in which the current values of all
+            # of the variables are observed, as in the VI gradient estimators
+            values = {node: self.world[node] for node in self.world}
+            values.update(constrained_vals)
+            batch_world = World({**values, **batch})
+            for node in batch:
+                batch_world.call(node)
+            log_joint = log_joint + self.minibatch.scale(batch) * batch_world.log_prob(
+                batch.keys()
+            )
+        return log_joint
+
+    def propose(self, world: World) -> Tuple[World, torch.Tensor]:
+        self.world = world
+        positions = self._dict2vec.to_vec(
+            self._to_unconstrained({node: world[node] for node in self._target_rvs})
+        )
+        positions.requires_grad = True
+        grad = torch.autograd.grad(self._log_joint(positions), positions)[0]
+        positions = positions.detach()
+        noise = torch.randn_like(positions) * self.step_size**0.5
+        new_positions = positions + self.step_size / 2 * grad + noise
+        self.world = world.replace(
+            self._to_unconstrained.inv(self._dict2vec.to_dict(new_positions))
+        )
+        # the new world is always accepted
+        return self.world, torch.zeros(())
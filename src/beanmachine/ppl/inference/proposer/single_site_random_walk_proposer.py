@@ -17,11 +17,12 @@ class SingleSiteRandomWalkProposer(SingleSiteAncestralProposer):
         self,
         node,
         step_size: float,
+        use_markov_blanket: bool = True,
     ):
         self.step_size = step_size
         self.target_acc_rate = {False: torch.tensor(0.44), True: torch.tensor(0.234)}
         self._iter = 0
-        super().__init__(node)
+        super().__init__(node, use_markov_blanket)
 
     def do_adaptation(self, world, accept_log_prob, *args, **kwargs) -> None:
         if torch.isnan(accept_log_prob):
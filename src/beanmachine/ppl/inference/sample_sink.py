@@ -0,0 +1,452 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Sinks which receive the samples drawn by ``BaseInference.infer``.
+
+During inference every chain writes the values it retains (the queries followed by
+the log likelihoods of the observations) to a ``ChainWriter``, which passes them on
+to its storage in fixed-size chunks. Once all chains are done, ``SampleSink.load``
+turns the results of the writers into one tensor per column, of shape
+(num_chains, num_samples, ...).
+
+Writers may run in subprocesses (see ``run_in_parallel``), so sinks must be
+picklable and the results of ``ChainWriter.close`` are sent back to the main
+process. Sinks which write to shared storage, such as ``SharedMemorySink``, keep
+these results small, so that nothing but a handle is sent back."""
+
+import os
+from abc import ABCMeta, abstractmethod
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+import torch
+
+
+class ChainWriter(metaclass=ABCMeta):
+    """
+    Writes the samples of a single chain, buffering them into chunks.
+
+    Args:
+        chain: The index of the chain.
+        num_chains: The total number of chains.
+        num_samples: The number of samples which will be written.
+        chunk_size: The number of samples to buffer before they are written.
+    """
+
+    def __init__(self, chain: int, num_chains: int, num_samples: int, chunk_size: int):
+        self.chain = chain
+        self.num_chains = num_chains
+        self.num_samples = num_samples
+        self.chunk_size = chunk_size
+        self._buffer: List[List[torch.Tensor]] = []
+        self._num_written = 0
+
+    def write(self, values: List[torch.Tensor]) -> None:
+        """Writes the values of all columns for one sample"""
+        if self._num_written + len(self._buffer) >= self.num_samples:
+            raise ValueError(f"Cannot write more than {self.num_samples} samples.")
+        self._buffer.append([value.detach() for value in values])
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes any buffered samples to the underlying storage"""
+        if len(self._buffer) == 0:
+            return
+        columns = [torch.stack(column) for column in zip(*self._buffer)]
+        self._write_chunk(self._num_written, columns)
+        self._num_written += len(self._buffer)
+        self._buffer = []
+
+    def close(self) -> Any:
+        """Flushes the remaining samples and returns the result of this chain, which
+        will be passed to ``SampleSink.load``"""
+        self.flush()
+        return self._result()
+
+    @abstractmethod
+    def _write_chunk(self, start: int, columns: List[torch.Tensor]) -> None:
+        """Writes a chunk of samples. Each column has a leading dimension which
+        indexes the samples, starting with sample number ``start``."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _result(self) -> Any:
+        raise NotImplementedError
+
+
+class SampleSink(metaclass=ABCMeta):
+    """
+    The destination of the samples drawn during inference.
+
+    Args:
+        chunk_size: The number of samples each chain buffers before writing them.
+    """
+
+    def __init__(self, chunk_size: int = 100):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive.")
+        self.chunk_size = chunk_size
+
+    def begin(self, num_chains: int, num_samples: int) -> None:
+        """Called once, in the main process, before any chain starts"""
+        ...
+
+    def allocate(self, example: Callable[[], List[torch.Tensor]]) -> None:
+        """Called once, in the main process, after ``begin`` and before any chain
+        starts. Sinks which preallocate their storage may call ``example`` to get
+        the values of all columns for one sample; other sinks ignore it."""
+        ...
+
+    @abstractmethod
+    def writer(self, chain: int, num_chains: int, num_samples: int) -> ChainWriter:
+        """Returns the writer for the given chain"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def load(self, chain_results: List[Any]) -> List[torch.Tensor]:
+        """Given the results of the writers of all chains, in order, returns one
+        tensor of shape (num_chains, num_samples, ...) per column"""
+        raise NotImplementedError
+
+
+class _InMemoryChainWriter(ChainWriter):
+    def __init__(
+        self,
+        columns: List[torch.Tensor],
+        pid: int,
+        chain: int,
+        num_chains: int,
+        num_samples: int,
+        chunk_size: int,
+    ):
+        super().__init__(chain, num_chains, num_samples, chunk_size)
+        self._columns = columns
+        self._pid = pid
+
+    def _write_chunk(self, start: int, columns: List[torch.Tensor]) -> None:
+        if len(columns) != len(self._columns):
+            raise ValueError(
+                f"Expected {len(self._columns)} columns but got {len(columns)}."
+            )
+        for storage, column in zip(self._columns, columns):
+            storage[self.chain, start : start + len(column)] = column
+
+    def _result(self) -> Optional[List[torch.Tensor]]:
+        if os.getpid() == self._pid:
+            # the samples are already in the storage of the sink
+            return None
+        # The chain ran in a subprocess, which wrote to its own copy of the
+        # storage, so send the samples of this chain (only) back
+        return [storage[self.chain].clone() for storage in self._columns]
+
+
+class InMemorySink(SampleSink):
+    """
+    Keeps all of the samples in memory. This is the default sink.
+
+    The tensors holding the samples of all chains, one per column, are allocated
+    before the chains start, and every chain writes its samples directly into them,
+    so the samples are never copied to stack the chains together.
+    """
+
+    columns: Optional[List[torch.Tensor]]
+
+    def __init__(self, chunk_size: int = 100):
+        super().__init__(chunk_size)
+        self.columns = None
+
+    def begin(self, num_chains: int, num_samples: int) -> None:
+        self._num_chains = num_chains
+        self._num_samples = num_samples
+        self._pid = os.getpid()
+        self.columns = None
+
+    def allocate(self, example: Callable[[], List[torch.Tensor]]) -> None:
+        self.columns = [
+            value.new_empty((self._num_chains, self._num_samples) + value.shape)
+            for value in example()
+        ]
+
+    def writer(self, chain: int, num_chains: int, num_samples: int) -> ChainWriter:
+        if self.columns is None:
+            raise ValueError("InMemorySink must be allocated before writing.")
+        return _InMemoryChainWriter(
+            self.columns,
+            self._pid,
+            chain,
+            num_chains,
+            num_samples,
+            self.chunk_size,
+        )
+
+    def load(
+        self, chain_results: List[Optional[List[torch.Tensor]]]
+    ) -> List[torch.Tensor]:
+        columns = self.columns or []
+        for chain, result in enumerate(chain_results):
+            if result is not None:
+                for storage, values in zip(columns, result):
+                    storage[chain] = values
+        return columns
+
+
+class _SharedMemoryChainWriter(ChainWriter):
+    def __init__(
+        self,
+        columns: List[torch.Tensor],
+        num_written: torch.Tensor,
+        chain: int,
+        num_chains: int,
+        num_samples: int,
+        chunk_size: int,
+    ):
+        super().__init__(chain, num_chains, num_samples, chunk_size)
+        self._columns = columns
+        self._num_written_by_chain = num_written
+
+    def _write_chunk(self, start: int, columns: List[torch.Tensor]) -> None:
+        if len(columns) != len(self._columns):
+            raise ValueError(
+                f"Expected {len(self._columns)} columns but got {len(columns)}."
+            )
+        for storage, column in zip(self._columns, columns):
+            storage[self.chain, start : start + len(column)] = column
+        self._num_written_by_chain[self.chain] = start + len(columns[0])
+
+    def _result(self) -> int:
+        # the number of columns written
+        return len(self._columns)
+
+
+class SharedMemorySink(SampleSink):
+    """
+    Writes the samples to tensors in shared memory, one per column, each holding the
+    samples of all chains. The tensors are allocated by the main process before the
+    chains start, so chains running in subprocesses write their samples directly
+    into them and nothing needs to be copied back when they finish. This is the
+    default sink when running chains in parallel.
+
+    While inference runs, another thread of the main process may read ``columns``
+    and ``num_written``, e.g. to monitor the convergence of the chains so far.
+
+    Args:
+        chunk_size: The number of samples each chain buffers before writing them.
+    """
+
+    columns: Optional[List[torch.Tensor]]
+    num_written: torch.Tensor
+
+    def __init__(self, chunk_size: int = 100):
+        super().__init__(chunk_size)
+        self.columns = None
+        self.num_written = torch.zeros(0, dtype=torch.long)
+
+    def begin(self, num_chains: int, num_samples: int) -> None:
+        self._num_chains = num_chains
+        self._num_samples = num_samples
+        self.columns = None
+        # the number of samples written by each chain so far
+        self.num_written = torch.zeros(num_chains, dtype=torch.long).share_memory_()
+
+    def allocate(self, example: Callable[[], List[torch.Tensor]]) -> None:
+        self.columns = [
+            torch.empty(
+                (self._num_chains, self._num_samples) + value.shape,
+                dtype=value.dtype,
+            ).share_memory_()
+            for value in example()
+        ]
+
+    def writer(self, chain: int, num_chains: int, num_samples: int) -> ChainWriter:
+        if self.columns is None:
+            raise ValueError("SharedMemorySink must be allocated before writing.")
+        return _SharedMemoryChainWriter(
+            self.columns,
+            self.num_written,
+            chain,
+            num_chains,
+            num_samples,
+            self.chunk_size,
+        )
+
+    def load(self, chain_results: List[int]) -> List[torch.Tensor]:
+        # zero-copy: the samples are already where the chains wrote them
+        return self.columns or []
+
+
+class _NumpyMemmapChainWriter(ChainWriter):
+    def __init__(
+        self,
+        directory: str,
+        chain: int,
+        num_chains: int,
+        num_samples: int,
+        chunk_size: int,
+    ):
+        super().__init__(chain, num_chains, num_samples, chunk_size)
+        self.directory = directory
+        self._arrays: Optional[List[np.ndarray]] = None
+
+    def _open(self, index: int, column: np.ndarray) -> np.ndarray:
+        path = _column_path(self.directory, index)
+        shape = (self.num_chains, self.num_samples) + column.shape[1:]
+        if not os.path.exists(path):
+            # All chains share one file per column, and the chains may run in
+            # different processes. Create the file under a temporary name and
+            # link it into place, which fails if another chain got there first.
+            tmp_path = f"{path}.{os.getpid()}.{self.chain}.tmp"
+            np.lib.format.open_memmap(tmp_path, "w+", column.dtype, shape).flush()
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+        array = np.load(path, mmap_mode="r+")
+        if array.shape != shape or array.dtype != column.dtype:
+            raise ValueError(
+                f"Samples of shape {shape} and type {column.dtype} do not match "
+                f"{path}, which holds samples of shape {array.shape} and type "
+                f"{array.dtype}."
+            )
+        return array
+
+    def _write_chunk(self, start: int, columns: List[torch.Tensor]) -> None:
+        values = [column.cpu().numpy() for column in columns]
+        if self._arrays is None:
+            self._arrays = [self._open(i, value) for i, value in enumerate(values)]
+        for array, value in zip(self._arrays, values):
+            array[self.chain, start : start + len(value)] = value
+            array.flush()
+
+    def _result(self) -> int:
+        # the number of columns written
+        return 0 if self._arrays is None else len(self._arrays)
+
+
+def _column_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"{index}.npy")
+
+
+class NumpyMemmapSink(SampleSink):
+    """
+    Writes the samples to memory-mapped ``.npy`` files, one per column, each holding
+    the samples of all chains. The loaded tensors are backed by the files, which are
+    only read as they are accessed, so the samples never need to fit in memory.
+
+    Args:
+        directory: The directory in which to store the files. It is created if it
+            does not exist, and must not already contain samples.
+        chunk_size: The number of samples each chain buffers before writing them.
+    """
+
+    def __init__(self, directory: str, chunk_size: int = 100):
+        super().__init__(chunk_size)
+        self.directory = directory
+
+    def begin(self, num_chains: int, num_samples: int) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(_column_path(self.directory, 0)):
+            raise ValueError(f"{self.directory} already contains samples.")
+
+    def writer(self, chain: int, num_chains: int, num_samples: int) -> ChainWriter:
+        return _NumpyMemmapChainWriter(
+            self.directory, chain, num_chains, num_samples, self.chunk_size
+        )
+
+    def load(self, chain_results: List[int]) -> List[torch.Tensor]:
+        num_columns = max(chain_results, default=0)
+        # Open the files copy-on-write, so that the tensors are writable without
+        # modifying the samples on disk.
+        return [
+            torch.from_numpy(np.load(_column_path(self.directory, i), mmap_mode="c"))
+            for i in range(num_columns)
+        ]
+
+
+class _NetCDFChainWriter(ChainWriter):
+    def __init__(
+        self,
+        path: str,
+        chain: int,
+        num_chains: int,
+        num_samples: int,
+        chunk_size: int,
+    ):
+        super().__init__(chain, num_chains, num_samples, chunk_size)
+        self.path = path
+        self._num_columns = 0
+
+    def _write_chunk(self, start: int, columns: List[torch.Tensor]) -> None:
+        import netCDF4
+
+        with netCDF4.Dataset(self.path, "w" if start == 0 else "a") as dataset:
+            if start == 0:
+                dataset.createDimension("draw", None)
+            for i, column in enumerate(columns):
+                value = column.cpu().numpy()
+                name = f"column_{i}"
+                if start == 0:
+                    dims = [f"{name}_dim_{d}" for d in range(value.ndim - 1)]
+                    for dim, size in zip(dims, value.shape[1:]):
+                        dataset.createDimension(dim, size)
+                    # NetCDF has no boolean type
+                    dtype = np.uint8 if value.dtype == np.bool_ else value.dtype
+                    variable = dataset.createVariable(name, dtype, ["draw"] + dims)
+                    variable.is_bool = int(value.dtype == np.bool_)
+                dataset[name][start : start + len(value)] = value
+        self._num_columns = len(columns)
+
+    def _result(self) -> int:
+        return self._num_columns
+
+
+class NetCDFSink(SampleSink):
+    """
+    Appends the samples of each chain, chunk by chunk, to a NetCDF file
+    ``chain_<i>.nc`` in the given directory. Requires the ``netCDF4`` package.
+    The samples are read back into memory when inference finishes.
+
+    Args:
+        directory: The directory in which to store the files. It is created if it
+            does not exist.
+        chunk_size: The number of samples each chain buffers before writing them.
+    """
+
+    def __init__(self, directory: str, chunk_size: int = 100):
+        super().__init__(chunk_size)
+        self.directory = directory
+
+    def _path(self, chain: int) -> str:
+        return os.path.join(self.directory, f"chain_{chain}.nc")
+
+    def begin(self, num_chains: int, num_samples: int) -> None:
+        import netCDF4  # noqa: F401  # fail early if netCDF4 is not installed
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def writer(self, chain: int, num_chains: int, num_samples: int) -> ChainWriter:
+        return _NetCDFChainWriter(
+            self._path(chain), chain, num_chains, num_samples, self.chunk_size
+        )
+
+    def load(self, chain_results: List[int]) -> List[torch.Tensor]:
+        import netCDF4
+
+        num_columns = max(chain_results, default=0)
+        chains = []
+        for chain in range(len(chain_results)):
+            with netCDF4.Dataset(self._path(chain), "r") as dataset:
+                dataset.set_auto_mask(False)
+                columns = []
+                for i in range(num_columns):
+                    variable = dataset[f"column_{i}"]
+                    value = variable[:]
+                    if variable.is_bool:
+                        value = value.astype(np.bool_)
+                    columns.append(torch.from_numpy(value))
+                chains.append(columns)
+        return [torch.stack(column) for column in zip(*chains)]
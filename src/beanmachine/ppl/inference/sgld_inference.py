@@ -0,0 +1,48 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import List, Optional, Set
+
+from beanmachine.ppl.inference.base_inference import BaseInference
+from beanmachine.ppl.inference.minibatch import Minibatch
+from beanmachine.ppl.inference.proposer.base_proposer import BaseProposer
+from beanmachine.ppl.inference.proposer.sgld_proposer import SGLDProposer
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.world import World
+
+
+class StochasticGradientLangevinDynamics(BaseInference):
+    """
+    Global (multi-site) Stochastic Gradient Langevin Dynamics [1] sampler, which
+    scales to large data sets by estimating the log likelihood of a plate of
+    observations from a batch of them at every step. The observations of the plate
+    are given by ``minibatch`` rather than by the observations passed to ``infer``,
+    which are evaluated in full at every step. All of the latent variables the plate
+    depends on must be among the queries.
+
+    [1] Max Welling and Yee Whye Teh. `Bayesian Learning via Stochastic Gradient
+    Langevin Dynamics`.
+
+    Args:
+        step_size (float): The step size of the Langevin dynamics.
+        minibatch (Minibatch, Optional): The plate of observations to subsample.
+    """
+
+    def __init__(self, step_size: float, minibatch: Optional[Minibatch] = None):
+        self.step_size = step_size
+        self.minibatch = minibatch
+        self._proposer = None
+
+    def get_proposers(
+        self,
+        world: World,
+        target_rvs: Set[RVIdentifier],
+        num_adaptive_sample: int,
+    ) -> List[BaseProposer]:
+        if self._proposer is None:
+            self._proposer = SGLDProposer(
+                world, target_rvs, self.step_size, self.minibatch
+            )
+        return [self._proposer]
@@ -10,5 +10,17 @@ from beanmachine.ppl.inference.single_site_inference import SingleSiteInference
 
 
 class SingleSiteAncestralMetropolisHastings(SingleSiteInference):
-    def __init__(self):
-        super().__init__(SingleSiteAncestralProposer)
+    """
+    Single site ancestral Metropolis-Hastings. This single site algorithm proposes
+    from the prior distribution of each random variable.
+
+    Args:
+        use_markov_blanket: Whether to compute the acceptance ratio over the
+            Markov blanket of the proposed node only, defaults to True. Set it
+            to False to evaluate the log prob of the entire world instead.
+    """
+
+    def __init__(self, use_markov_blanket: bool = True):
+        super().__init__(
+            SingleSiteAncestralProposer, use_markov_blanket=use_markov_blanket
+        )
@@ -35,16 +35,27 @@ class SingleSiteNewtonianMonteCarlo(BaseInference):
     Args:
         real_space_alpha: alpha value for real space as specified in [1], defaults to 10.0
         real_space_beta: beta value for real space  as specified in [1], defaults to 1.0
+        half_space_hessian: how half space proposers compute the diagonal of the
+            Hessian, one of "dense" (the default), "blocked", "separable" or
+            "hutchinson"; see ``SingleSiteHalfSpaceNMCProposer``
+        simplex_hessian: how simplex proposers compute the Hessian, one of "dense"
+            (the default), "blocked" or "separable"; "separable" assumes that the
+            off-diagonal entries of the Hessian are zero. See
+            ``SingleSiteSimplexSpaceNMCProposer``
     """
 
     def __init__(
         self,
         real_space_alpha: float = 10.0,
         real_space_beta: float = 1.0,
+        half_space_hessian: str = "dense",
+        simplex_hessian: str = "dense",
     ):
         self._proposers = {}
         self.alpha = real_space_alpha
         self.beta = real_space_beta
+        self.half_space_hessian = half_space_hessian
+        self.simplex_hessian = simplex_hessian
 
     def get_proposers(
         self,
@@ -74,15 +85,15 @@ class SingleSiteNewtonianMonteCarlo(BaseInference):
                 (dist.constraints.greater_than, dist.constraints.greater_than_eq),
             )
         ):
-            return SingleSiteHalfSpaceNMCProposer(node)
+            return SingleSiteHalfSpaceNMCProposer(node, self.half_space_hessian)
         elif is_constraint_eq(support, dist.constraints.simplex) or (
             isinstance(support, dist.constraints.independent)
             and (support.base_constraint == dist.constraints.unit_interval)
         ):
-            return SingleSiteSimplexSpaceNMCProposer(node)
+            return SingleSiteSimplexSpaceNMCProposer(node, hessian=self.simplex_hessian)
         elif isinstance(distribution, dist.Beta):
             return SingleSiteSimplexSpaceNMCProposer(
-                node, transform=BetaDimensionTransform()
+                node, transform=BetaDimensionTransform(), hessian=self.simplex_hessian
             )
         else:
             LOGGER.warning(
@@ -21,10 +21,14 @@ class SingleSiteRandomWalk(BaseInference):
 
     Args:
         step_size: Step size, defaults to 1.0
+        use_markov_blanket: Whether to compute the acceptance ratio over the
+            Markov blanket of the proposed node only, defaults to True. Set it
+            to False to evaluate the log prob of the entire world instead.
     """
 
-    def __init__(self, step_size: float = 1.0):
+    def __init__(self, step_size: float = 1.0, use_markov_blanket: bool = True):
         self.step_size = step_size
+        self.use_markov_blanket = use_markov_blanket
         self._proposers = {}
 
     def get_proposers(
@@ -37,7 +41,7 @@ class SingleSiteRandomWalk(BaseInference):
         for node in target_rvs:
             if node not in self._proposers:
                 self._proposers[node] = SingleSiteRandomWalkProposer(
-                    node, self.step_size
+                    node, self.step_size, self.use_markov_blanket
                 )
             proposers.append(self._proposers[node])
         return proposers
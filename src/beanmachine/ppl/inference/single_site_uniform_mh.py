@@ -13,7 +13,14 @@ class SingleSiteUniformMetropolisHastings(SingleSiteInference):
     """
     Single site uniform Metropolis-Hastings. This single site algorithm proposes
     from a uniform distribution (uniform Categorical for discrete variables).
+
+    Args:
+        use_markov_blanket: Whether to compute the acceptance ratio over the
+            Markov blanket of the proposed node only, defaults to True. Set it
+            to False to evaluate the log prob of the entire world instead.
     """
 
-    def __init__(self):
-        super().__init__(SingleSiteUniformProposer)
+    def __init__(self, use_markov_blanket: bool = True):
+        super().__init__(
+            SingleSiteUniformProposer, use_markov_blanket=use_markov_blanket
+        )
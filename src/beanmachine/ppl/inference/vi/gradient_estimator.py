@@ -5,16 +5,134 @@
 
 "Gradient estimators of f-divergences."
 
-from typing import Callable, Mapping
+import logging
+from typing import Callable, Mapping, Optional, Tuple
 
 import torch
+import torch.distributions as dist
 from beanmachine.ppl.inference.vi.variational_world import VariationalWorld
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.utils.validation import argument_validation_disabled
 from beanmachine.ppl.world import RVDict, World
 
 
+LOGGER = logging.getLogger("beanmachine")
+
 _CPU_DEVICE = torch.device("cpu")
 DiscrepancyFn = Callable[[torch.Tensor], torch.Tensor]
+VmapFailureFn = Callable[[RuntimeError], None]
+
+
+def _model_observations(
+    variational_world: VariationalWorld,
+    observations: RVDict,
+    queries_to_guides: Mapping[RVIdentifier, RVIdentifier],
+    batch_observations: RVDict,
+) -> RVDict:
+    """The guide values of the queries, along with the observations and the batch,
+    which are the observations of the model world"""
+    return {
+        **{
+            query: variational_world[guide]
+            for query, guide in queries_to_guides.items()
+        },
+        **observations,
+        **batch_observations,
+    }
+
+
+def _model_log_prob(
+    world: World,
+    queries_to_guides: Mapping[RVIdentifier, RVIdentifier],
+    observations: RVDict,
+    subsample_factor: float,
+    batch_observations: RVDict,
+    batch_scale: float,
+) -> torch.Tensor:
+    """The log prob of the model world, with the log likelihood of the observations
+    scaled by 1 / subsample_factor and that of the batch by batch_scale"""
+    # We want to avoid using world.latent_nodes/world.observations.
+    # The model world has everything in observations, which results in latent_nodes being empty.
+    # That results in everything being scaled by the scaling factor (we don't want that)
+    return (
+        world.log_prob(queries_to_guides.keys())
+        + (1.0 / subsample_factor) * world.log_prob(observations.keys())
+        + batch_scale * world.log_prob(batch_observations.keys())
+    )
+
+
+def _particle_log_density_ratios(
+    observations: RVDict,
+    num_samples: int,
+    params: Mapping[RVIdentifier, torch.Tensor],
+    queries_to_guides: Mapping[RVIdentifier, RVIdentifier],
+    subsample_factor: float,
+    batch_observations: RVDict,
+    batch_scale: float,
+    initialize_fn: Callable[[dist.Distribution], torch.Tensor],
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Draws ``num_samples`` particles from the guides and evaluates the log density
+    ratio logu = logp - logq and logq of each of them, as tensors of shape
+    (num_samples,). Rather than executing the guides and the model once per
+    particle, they are executed once, mapped over the particles with
+    ``torch.func.vmap``, so each guide draws the values of all particles at once.
+
+    Raises a RuntimeError if the guides or the model cannot be vmapped, e.g.
+    because they branch on the values of their variables, or if vmap is not
+    available (it needs PyTorch 2.0 or later).
+    """
+    try:
+        from torch.func import vmap
+    except ImportError as e:
+        raise RuntimeError("torch.func.vmap requires PyTorch 2.0 or later") from e
+
+    def log_density_ratio(particle_id: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        # particle_id only batches the call; unlike World.initialize_world, the
+        # particles are not redrawn when their log prob is not finite, as that
+        # would require data-dependent control flow
+        variational_world = VariationalWorld(
+            observations=observations,
+            initialize_fn=initialize_fn,
+            params=params,
+            queries_to_guides=queries_to_guides,
+        )
+        for guide in queries_to_guides.values():
+            variational_world.call(guide)
+        world = World(
+            observations=_model_observations(
+                variational_world, observations, queries_to_guides, batch_observations
+            )
+        )
+        for node in world.observations:
+            world.call(node)
+        logq = variational_world.log_prob(queries_to_guides.values())
+        logu = (
+            _model_log_prob(
+                world,
+                queries_to_guides,
+                observations,
+                subsample_factor,
+                batch_observations,
+                batch_scale,
+            )
+            - logq
+        )
+        return logu, logq
+
+    with argument_validation_disabled():
+        logu, logq = vmap(log_density_ratio, randomness="different")(
+            torch.arange(num_samples)
+        )
+    return logu, logq
+
+
+def log_vmap_failure(e: RuntimeError) -> None:
+    """Warns that the particles are evaluated one at a time, as vmap failed"""
+    LOGGER.warning(
+        "Falling back to evaluating one particle at a time, as the guides or the "
+        f"model could not be vmapped: {e}"
+    )
 
 
 # NOTE: right now it is either all reparameterizable
@@ -28,11 +146,37 @@ def monte_carlo_approximate_reparam(
     queries_to_guides: Mapping[RVIdentifier, RVIdentifier],
     subsample_factor: float = 1.0,
     device: torch.device = _CPU_DEVICE,
+    vectorized: bool = False,
+    batch_observations: Optional[RVDict] = None,
+    batch_scale: float = 1.0,
+    on_vmap_failure: VmapFailureFn = log_vmap_failure,
 ) -> torch.Tensor:
     """The pathwise derivative / reparameterization trick
-    (https://arxiv.org/abs/1312.6114) gradient estimator."""
+    (https://arxiv.org/abs/1312.6114) gradient estimator.
 
+    If ``vectorized``, all of the particles are drawn and evaluated in a single
+    vmapped execution of the guides and the model, falling back to one execution
+    per particle if they cannot be vmapped, after calling ``on_vmap_failure`` with
+    the error. The log likelihood of ``batch_observations``, a batch drawn from a
+    ``Minibatch``, is scaled by ``batch_scale``."""
+
+    batch_observations = batch_observations or {}
     loss = torch.zeros(1).to(device)
+    if vectorized:
+        try:
+            logu, _ = _particle_log_density_ratios(
+                observations,
+                num_samples,
+                params,
+                queries_to_guides,
+                subsample_factor,
+                batch_observations,
+                batch_scale,
+                initialize_fn=lambda d: d.rsample(),
+            )
+            return loss + discrepancy_fn(logu).mean()
+        except RuntimeError as e:
+            on_vmap_failure(e)
     for _ in range(num_samples):
         variational_world = VariationalWorld.initialize_world(
             queries=queries_to_guides.values(),
@@ -43,24 +187,20 @@ def monte_carlo_approximate_reparam(
         )
         world = World.initialize_world(
             queries=[],
-            observations={
-                **{
-                    query: variational_world[guide]
-                    for query, guide in queries_to_guides.items()
-                },
-                **observations,
-            },
+            observations=_model_observations(
+                variational_world, observations, queries_to_guides, batch_observations
+            ),
         )
 
         # form log density ratio logu = logp - logq
-        # We want to avoid using world.latent_nodes/world.observations.
-        # The preceding World.initialize_world puts everything into observations, which results in latent_nodes being empty.
-        # That results in everything being scaled by the scaling factor (we don't want that)
-        logu = (
-            world.log_prob(queries_to_guides.keys())
-            + (1.0 / subsample_factor) * world.log_prob(observations.keys())
-            - variational_world.log_prob(queries_to_guides.values())
-        )
+        logu = _model_log_prob(
+            world,
+            queries_to_guides,
+            observations,
+            subsample_factor,
+            batch_observations,
+            batch_scale,
+        ) - variational_world.log_prob(queries_to_guides.values())
 
         loss += discrepancy_fn(logu)  # reparameterized estimator
     return loss / num_samples
@@ -74,11 +214,38 @@ def monte_carlo_approximate_sf(
     queries_to_guides: Mapping[RVIdentifier, RVIdentifier],
     subsample_factor: float = 1,
     device: torch.device = _CPU_DEVICE,
+    vectorized: bool = False,
+    batch_observations: Optional[RVDict] = None,
+    batch_scale: float = 1.0,
+    on_vmap_failure: VmapFailureFn = log_vmap_failure,
 ) -> torch.Tensor:
     """The score function / log derivative trick surrogate loss
-    (https://arxiv.org/pdf/1506.05254) gradient estimator."""
+    (https://arxiv.org/pdf/1506.05254) gradient estimator.
+
+    If ``vectorized``, all of the particles are drawn and evaluated in a single
+    vmapped execution of the guides and the model, falling back to one execution
+    per particle if they cannot be vmapped, after calling ``on_vmap_failure`` with
+    the error. The log likelihood of ``batch_observations``, a batch drawn from a
+    ``Minibatch``, is scaled by ``batch_scale``."""
 
+    batch_observations = batch_observations or {}
     loss = torch.zeros(1).to(device)
+    if vectorized:
+        try:
+            logu, logq = _particle_log_density_ratios(
+                observations,
+                num_samples,
+                params,
+                queries_to_guides,
+                subsample_factor,
+                batch_observations,
+                batch_scale,
+                initialize_fn=lambda d: d.sample(),
+            )
+            f = discrepancy_fn(logu)
+            return loss + (f.detach().clone() * logq + f).mean()
+        except RuntimeError as e:
+            on_vmap_failure(e)
     for _ in range(num_samples):
         variational_world = VariationalWorld.initialize_world(
             queries=queries_to_guides.values(),
@@ -89,23 +256,22 @@ def monte_carlo_approximate_sf(
         )
         world = World.initialize_world(
             queries=[],
-            observations={
-                **{
-                    query: variational_world[guide]
-                    for query, guide in queries_to_guides.items()
-                },
-                **observations,
-            },
+            observations=_model_observations(
+                variational_world, observations, queries_to_guides, batch_observations
+            ),
         )
 
         # form log density ratio logu = logp - logq
-        # We want to avoid using world.latent_nodes/world.observations.
-        # The preceding World.initialize_world puts everything into observations, which results in latent_nodes being empty.
-        # That results in everything being scaled by the scaling factor (we don't want that)
         logq = variational_world.log_prob(queries_to_guides.values())
         logu = (
-            world.log_prob(queries_to_guides.keys())
-            + (1.0 / subsample_factor) * world.log_prob(observations.keys())
+            _model_log_prob(
+                world,
+                queries_to_guides,
+                observations,
+                subsample_factor,
+                batch_observations,
+                batch_scale,
+            )
             - logq
         )
 
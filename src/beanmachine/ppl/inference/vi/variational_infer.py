@@ -6,12 +6,14 @@
 from __future__ import annotations
 
 import logging
-from typing import Callable, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 import torch
 import torch.optim as optim
+from beanmachine.ppl.inference.minibatch import Minibatch
 from beanmachine.ppl.inference.vi.discrepancy import kl_reverse
 from beanmachine.ppl.inference.vi.gradient_estimator import (
+    log_vmap_failure,
     monte_carlo_approximate_reparam,
 )
 from beanmachine.ppl.inference.vi.variational_world import VariationalWorld
@@ -32,6 +34,7 @@ class VariationalInfer:
             [torch.Tensor], optim.Optimizer
         ] = lambda params: optim.Adam(params, lr=1e-2),
         device: torch.device = _CPU_DEVICE,
+        minibatch: Optional[Minibatch] = None,
     ):
         """
         Performs variational inference using reparameterizable guides.
@@ -41,11 +44,13 @@ class VariationalInfer:
             observations: Observations as an RVDict keyed by RVIdentifier
             optimizer: A function returning a ``torch.Optimizer`` to use for optimizing variational parameters.
             device: a ``torch.device`` to use for pytorch tensors
+            minibatch: A plate of observations in addition to ``observations``, of which a batch is drawn at every step, with its log likelihood scaled to the size of the plate
         """
         super().__init__()
 
         self.observations = observations
         self.queries_to_guides = queries_to_guides
+        self.minibatch = minibatch
 
         # runs all guides to reify `param`s for `optimizer`
         # NOTE: assumes `params` is static and same across all worlds, consider MultiOptimizer (see Pyro)
@@ -61,6 +66,8 @@ class VariationalInfer:
         self.params = world._params
         self._optimizer = optimizer(self.params.values())
         self._device = device
+        # whether vectorized steps still try to vmap the guides and the model
+        self._use_vmap = True
 
     def infer(
         self,
@@ -72,6 +79,7 @@ class VariationalInfer:
             Callable[[int, torch.Tensor, VariationalInfer], None]
         ] = None,
         subsample_factor: float = 1,
+        vectorized: bool = False,
     ) -> VariationalWorld:
         """
         Perform variatonal inference.
@@ -83,6 +91,7 @@ class VariationalInfer:
             mc_approx: Monte-Carlo gradient estimator to use
             step_callback: callback function invoked each optimizer step
             subsample_factor: subsampling factor used for subsampling, helps scale the observations to avoid overshrinking towards the prior
+            vectorized: whether to draw and evaluate all samples of a gradient estimate in a single execution of the guides and the model, vmapped over the samples
 
         Returns:
             VariationalWorld: A world with variational guide distributions
@@ -90,7 +99,9 @@ class VariationalInfer:
         """
         assert subsample_factor > 0 and subsample_factor <= 1
         for it in tqdm(range(num_steps)):
-            loss = self.step(num_samples, discrepancy_fn, mc_approx, subsample_factor)
+            loss = self.step(
+                num_samples, discrepancy_fn, mc_approx, subsample_factor, vectorized
+            )
             if step_callback:
                 step_callback(it, loss, self)
 
@@ -102,6 +113,7 @@ class VariationalInfer:
         discrepancy_fn=kl_reverse,
         mc_approx=monte_carlo_approximate_reparam,  # TODO: support both reparam and SF in same guide
         subsample_factor: float = 1,
+        vectorized: bool = False,
     ) -> torch.Tensor:
         """
         Perform one step of variatonal inference.
@@ -111,11 +123,22 @@ class VariationalInfer:
             discrepancy_fn: discrepancy function f, use ``kl_reverse`` to minimize negative ELBO
             mc_approx: Monte-Carlo gradient estimator to use
             subsample_factor: subsampling factor used for subsampling, helps scale the observations to avoid overshrinking towards the prior
+            vectorized: whether to draw and evaluate all samples of a gradient estimate in a single execution of the guides and the model, vmapped over the samples
 
         Returns:
             torch.Tensor: the loss value (before the step)
         """
         self._optimizer.zero_grad()
+        # only pass vectorized and the batch when they are used, so that custom
+        # estimators which do not support them keep working
+        kwargs: Dict[str, Any] = {}
+        if vectorized and self._use_vmap:
+            kwargs["vectorized"] = True
+            kwargs["on_vmap_failure"] = self._vmap_failed
+        if self.minibatch is not None:
+            batch = self.minibatch.next_batch()
+            kwargs["batch_observations"] = batch
+            kwargs["batch_scale"] = self.minibatch.scale(batch)
         loss = mc_approx(
             self.observations,
             num_samples,
@@ -124,6 +147,7 @@ class VariationalInfer:
             self.queries_to_guides,
             subsample_factor=subsample_factor,
             device=self._device,
+            **kwargs,
         )
         if not torch.isnan(loss) and not torch.isinf(loss):
             loss.backward()
@@ -132,6 +156,12 @@ class VariationalInfer:
             logging.warn("Encountered NaN/inf loss, skipping step.")
         return loss
 
+    def _vmap_failed(self, e: RuntimeError) -> None:
+        # the model does not change between steps, so the later steps would fail
+        # in the same way; warn only once and stop trying
+        self._use_vmap = False
+        log_vmap_failure(e)
+
     def initialize_world(self) -> VariationalWorld:
         """
         Initializes a `VariationalWorld` using samples from guide distributions
@@ -37,6 +37,7 @@ class VariationalWorld(World):
             queries_to_guides=self._queries_to_guides.copy(),
         )
         world_copy._variables = self._variables.copy()
+        world_copy._log_prob_plan = self._log_prob_plan
         return world_copy
 
     # TODO: distinguish params vs random_variables at the type-level
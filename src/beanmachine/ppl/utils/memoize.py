@@ -3,10 +3,13 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import hashlib
 import inspect
+from collections import OrderedDict
 from functools import wraps
-from typing import Any, Callable, Dict, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 
+import torch
 from beanmachine.ppl.utils.item_counter import ItemCounter
 from torch import Tensor
 
@@ -32,14 +35,61 @@ def tensor_to_tuple(t: Tensor) -> Any:
     return result
 
 
+def _storage_digest(t: Tensor) -> bytes:
+    # The raw bytes of the values of the tensor, in row-major order, digested
+    # without converting them to Python objects.
+    data = t.detach().cpu().contiguous().reshape(-1).view(torch.uint8)
+    return hashlib.blake2b(memoryview(data.numpy()), digest_size=16).digest()
+
+
+class TensorKey:
+    # Stands in for a tensor in a memoization key. Two tensor keys are equal if
+    # their tensors have the same dtype, shape and values; their hash is computed
+    # from the dtype, the shape and a digest of the raw bytes of the tensor, so
+    # the values of the tensor are only compared when two keys have the same hash.
+
+    tensor: Tensor
+    hashcode: int
+
+    def __init__(self, t: Tensor) -> None:
+        self.tensor = t.detach()
+        self._digest = _storage_digest(t)
+        self.hashcode = hash((t.dtype, tuple(t.shape), self._digest))
+
+    def __hash__(self) -> int:
+        return self.hashcode
+
+    def __eq__(self, o) -> bool:
+        return (
+            isinstance(o, TensorKey)
+            and self.hashcode == o.hashcode
+            and self.tensor.dtype == o.tensor.dtype
+            and self.tensor.shape == o.tensor.shape
+            and self._digest == o._digest
+            and torch.equal(self.tensor, o.tensor)
+        )
+
+
+def tensor_key(t: Tensor) -> Any:
+    """Returns a hashable value which identifies a tensor by its values."""
+    if t.dim() == 0:
+        # Scalars are keyed by their value, like the Python numbers they stand for,
+        # e.g. tensor(2.0) and 2.0 are the same key.
+        return t.item()
+    if t.layout != torch.strided:
+        # e.g. sparse tensors, which have no raw storage to digest
+        return tensor_to_tuple(t)
+    return TensorKey(t)
+
+
 class MemoizationKey:
     # It would be nice to just use a tuple (wrapper, args) for the memoization
     # key, but tensors can only be compared for equality with torch.equal(t1, t2),
     # and tensors do not hash via value equality.
     #
-    # We therefore replace tensors with tuples that contain all the values of the
-    # tensor.  For example, if our arguments are (1, tensor([2, 3]), 4) then our
-    # new arguments are (1, (2, 3), 4)
+    # We therefore replace tensors with keys which hash and compare by value; see
+    # tensor_key. For example, if our arguments are (1, tensor(2), tensor([3, 4]))
+    # then our new arguments are (1, 2, TensorKey(tensor([3, 4]))).
 
     wrapper: Callable
     arguments: Tuple
@@ -48,9 +98,7 @@ class MemoizationKey:
     def __init__(self, wrapper: Callable, arguments: Tuple) -> None:
         self.arguments = (
             wrapper,
-            tuple(
-                tensor_to_tuple(a) if isinstance(a, Tensor) else a for a in arguments
-            ),
+            tuple(tensor_key(a) if isinstance(a, Tensor) else a for a in arguments),
         )
         self.wrapper = wrapper
         self.hashcode = hash(self.arguments)
@@ -69,48 +117,79 @@ class MemoizationKey:
 
 total_memoized_functions = 0
 total_memoized_calls = 0
+total_cache_hits = 0
 total_cache_misses = 0
+total_cache_evictions = 0
 count_calls = False
 function_calls = ItemCounter()
+function_hits = ItemCounter()
+function_misses = ItemCounter()
 
 
 def memoizer_report() -> str:
     call_report = [
-        f"{item.__name__}: {count}\n" for (item, count) in function_calls.items.items()
+        f"{item.__name__}: {count} "
+        + f"(hits: {function_hits.items.get(item, 0)} "
+        + f"misses: {function_misses.items.get(item, 0)})\n"
+        for (item, count) in function_calls.items.items()
     ]
     return (
         f"funcs: {total_memoized_functions} "
         + f"calls: {total_memoized_calls} "
-        + f"misses: {total_cache_misses}\n"
+        + f"hits: {total_cache_hits} "
+        + f"misses: {total_cache_misses} "
+        + f"evictions: {total_cache_evictions}\n"
         + "".join(call_report)
     )
 
 
-def memoize(f):
+def memoize(f: Optional[Callable] = None, *, max_size: Optional[int] = None):
     """
     Decorator to be used to memoize arbitrary functions.
+
+    By default the cache is unbounded, which callers that rely on memoization for
+    identity (e.g. the graph builder, which must return the same node for the same
+    arguments) require. Use @memoize(max_size=n) to only keep the n most recently
+    used results.
     """
 
+    if f is None:
+        return lambda g: memoize(g, max_size=max_size)
+    if max_size is not None and max_size < 1:
+        raise ValueError("max_size must be positive")
+
     global total_memoized_functions
     total_memoized_functions += 1
 
-    cache: Dict[Any, Any] = {}
+    cache: "OrderedDict[Any, Any]" = OrderedDict()
 
     @wraps(f)
     def wrapper(*args):
+        global total_cache_hits
+        global total_cache_misses
+        global total_cache_evictions
         if count_calls:
             global total_memoized_calls
             total_memoized_calls += 1
             function_calls.add_item(f)
 
         key = MemoizationKey(wrapper, args)
-        if key not in cache:
-            global total_cache_misses
-            total_cache_misses += 1
-            result = f(*args)
-            cache[key] = result
-            return result
-        return cache[key]
+        if key in cache:
+            total_cache_hits += 1
+            if count_calls:
+                function_hits.add_item(f)
+            if max_size is not None:
+                cache.move_to_end(key)
+            return cache[key]
+        total_cache_misses += 1
+        if count_calls:
+            function_misses.add_item(f)
+        result = f(*args)
+        cache[key] = result
+        if max_size is not None and len(cache) > max_size:
+            cache.popitem(last=False)
+            total_cache_evictions += 1
+        return result
 
     if inspect.ismethod(f):
         meth_name = f.__name__ + "_wrapper"
@@ -0,0 +1,333 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""A mutable mapping with constant-time copies.
+
+PersistentMap is a hash array mapped trie (HAMT). Nodes are shared between a map
+and its copies, and are never modified once they are shared: an update copies
+only the nodes on the path from the root to the updated entry. Copying a map is
+therefore O(1) and an update is O(log N), rather than O(N) for a dict.
+
+Each map owns the nodes it created since it was last copied, and updates those
+in place, so that building a map one entry at a time does not copy the path on
+every insertion."""
+
+from typing import Any, Dict, Iterable, Iterator, List, MutableMapping, Optional, Tuple
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+# Python hashes have 64 bits; once they are used up, keys whose hashes are equal
+# are kept in a collision node.
+_MAX_SHIFT = 64
+# Maps with at most this many entries are stored as a dict
+_MAX_SMALL_SIZE = 64
+
+
+class _Child:
+    # Marks an entry of a node whose value is a child node
+    pass
+
+
+_CHILD = _Child()
+_MISSING = object()
+
+
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+else:  # Python < 3.10
+
+    def _popcount(x: int) -> int:
+        return bin(x).count("1")
+
+
+class _CollisionNode:
+    __slots__ = ("keys", "values", "owner")
+
+    def __init__(self, keys: List[Any], values: List[Any], owner: object) -> None:
+        self.keys = keys
+        self.values = values
+        self.owner = owner
+
+    def _index(self, key: Any) -> int:
+        for i, k in enumerate(self.keys):
+            if k is key or k == key:
+                return i
+        return -1
+
+    def _editable(self, owner: object) -> "_CollisionNode":
+        if self.owner is owner:
+            return self
+        return _CollisionNode(list(self.keys), list(self.values), owner)
+
+    def find(self, key: Any, h: int, shift: int) -> Any:
+        i = self._index(key)
+        return _MISSING if i < 0 else self.values[i]
+
+    def assoc(
+        self, key: Any, h: int, shift: int, value: Any, owner: object
+    ) -> Tuple["_CollisionNode", bool]:
+        i = self._index(key)
+        if i >= 0 and self.values[i] is value:
+            return self, False
+        node = self._editable(owner)
+        if i >= 0:
+            node.values[i] = value
+            return node, False
+        node.keys.append(key)
+        node.values.append(value)
+        return node, True
+
+    def dissoc(
+        self, key: Any, h: int, shift: int, owner: object
+    ) -> Tuple[Optional["_CollisionNode"], bool]:
+        i = self._index(key)
+        if i < 0:
+            return self, False
+        if len(self.keys) == 1:
+            return None, True
+        node = self._editable(owner)
+        del node.keys[i]
+        del node.values[i]
+        return node, True
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        return zip(self.keys, self.values)
+
+
+class _Node:
+    # An entry whose key is _CHILD holds a child node (or collision node) as its
+    # value; the others hold a key and its value. The entries are ordered by the
+    # position of their bit in the bitmap.
+    __slots__ = ("bitmap", "keys", "values", "owner")
+
+    def __init__(
+        self, bitmap: int, keys: List[Any], values: List[Any], owner: object
+    ) -> None:
+        self.bitmap = bitmap
+        self.keys = keys
+        self.values = values
+        self.owner = owner
+
+    def _editable(self, owner: object) -> "_Node":
+        if self.owner is owner:
+            return self
+        return _Node(self.bitmap, list(self.keys), list(self.values), owner)
+
+    def find(self, key: Any, h: int, shift: int) -> Any:
+        node = self
+        while True:
+            bit = 1 << ((h >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return _MISSING
+            i = _popcount(node.bitmap & (bit - 1))
+            k = node.keys[i]
+            if k is _CHILD:
+                child = node.values[i]
+                if not isinstance(child, _Node):
+                    return child.find(key, h, shift + _BITS)
+                node = child
+                shift += _BITS
+            elif k is key or k == key:
+                return node.values[i]
+            else:
+                return _MISSING
+
+    def assoc(
+        self, key: Any, h: int, shift: int, value: Any, owner: object
+    ) -> Tuple["_Node", bool]:
+        bit = 1 << ((h >> shift) & _MASK)
+        i = _popcount(self.bitmap & (bit - 1))
+        if not self.bitmap & bit:
+            node = self._editable(owner)
+            node.bitmap |= bit
+            node.keys.insert(i, key)
+            node.values.insert(i, value)
+            return node, True
+        k = self.keys[i]
+        if k is _CHILD:
+            child = self.values[i]
+            new_child, added = child.assoc(key, h, shift + _BITS, value, owner)
+            if new_child is child:
+                return self, added
+            node = self._editable(owner)
+            node.values[i] = new_child
+            return node, added
+        if k is key or k == key:
+            if self.values[i] is value:
+                return self, False
+            node = self._editable(owner)
+            node.values[i] = value
+            return node, False
+        child = _make_child(
+            k, hash(k), self.values[i], key, h, value, shift + _BITS, owner
+        )
+        node = self._editable(owner)
+        node.keys[i] = _CHILD
+        node.values[i] = child
+        return node, True
+
+    def dissoc(
+        self, key: Any, h: int, shift: int, owner: object
+    ) -> Tuple[Optional["_Node"], bool]:
+        bit = 1 << ((h >> shift) & _MASK)
+        if not self.bitmap & bit:
+            return self, False
+        i = _popcount(self.bitmap & (bit - 1))
+        k = self.keys[i]
+        if k is _CHILD:
+            child = self.values[i]
+            new_child, removed = child.dissoc(key, h, shift + _BITS, owner)
+            if not removed:
+                return self, False
+            if new_child is not None:
+                node = self._editable(owner)
+                node.values[i] = new_child
+                return node, True
+        elif not (k is key or k == key):
+            return self, False
+        if self.bitmap == bit and shift > 0:
+            return None, True
+        node = self._editable(owner)
+        node.bitmap &= ~bit
+        del node.keys[i]
+        del node.values[i]
+        return node, True
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        for k, v in zip(self.keys, self.values):
+            if k is _CHILD:
+                yield from v.items()
+            else:
+                yield k, v
+
+
+def _make_child(
+    k1: Any, h1: int, v1: Any, k2: Any, h2: int, v2: Any, shift: int, owner: object
+) -> Any:
+    # Returns a node holding two keys whose hashes agree on the bits before shift
+    if shift >= _MAX_SHIFT:
+        return _CollisionNode([k1, k2], [v1, v2], owner)
+    i1 = (h1 >> shift) & _MASK
+    i2 = (h2 >> shift) & _MASK
+    if i1 == i2:
+        child = _make_child(k1, h1, v1, k2, h2, v2, shift + _BITS, owner)
+        return _Node(1 << i1, [_CHILD], [child], owner)
+    if i1 < i2:
+        return _Node((1 << i1) | (1 << i2), [k1, k2], [v1, v2], owner)
+    return _Node((1 << i1) | (1 << i2), [k2, k1], [v2, v1], owner)
+
+
+class PersistentMap(MutableMapping):
+    """
+    A mutable mapping whose ``copy`` is O(1). Modifying a copy never affects the
+    original, or vice versa; only the O(log N) nodes on the path to a modified
+    entry are copied.
+
+    Small maps, for which copying a dict is cheaper than looking entries up in a
+    trie, are stored as a dict instead, and are copied eagerly.
+
+    Args:
+        items: Optional initial contents, either a mapping or an iterable of
+            key-value pairs.
+    """
+
+    __slots__ = ("_small", "_root", "_len", "_owner")
+
+    def __init__(self, items: Optional[Iterable[Any]] = None) -> None:
+        # Either _small holds the entries, or _root and _len do
+        self._small: Optional[Dict[Any, Any]] = {}
+        self._owner = object()
+        self._root = _Node(0, [], [], self._owner)
+        self._len = 0
+        if items is not None:
+            self.update(items)
+
+    def __getitem__(self, key: Any) -> Any:
+        if self._small is not None:
+            return self._small[key]
+        value = self._root.find(key, hash(key), 0)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if self._small is not None:
+            return self._small.get(key, default)
+        value = self._root.find(key, hash(key), 0)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key: Any) -> bool:
+        if self._small is not None:
+            return key in self._small
+        return self._root.find(key, hash(key), 0) is not _MISSING
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        small = self._small
+        if small is not None:
+            if len(small) < _MAX_SMALL_SIZE or key in small:
+                small[key] = value
+                return
+            # the map has outgrown a dict; move its entries into the trie
+            self._small = None
+            for k, v in small.items():
+                self._assoc(k, v)
+        self._assoc(key, value)
+
+    def _assoc(self, key: Any, value: Any) -> None:
+        self._root, added = self._root.assoc(key, hash(key), 0, value, self._owner)
+        if added:
+            self._len += 1
+
+    def __delitem__(self, key: Any) -> None:
+        if self._small is not None:
+            del self._small[key]
+            return
+        root, removed = self._root.dissoc(key, hash(key), 0, self._owner)
+        if not removed:
+            raise KeyError(key)
+        # the root is never removed, only emptied
+        assert root is not None
+        self._root = root
+        self._len -= 1
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._small is not None:
+            return iter(self._small)
+        return (key for key, _ in self._root.items())
+
+    def __len__(self) -> int:
+        if self._small is not None:
+            return len(self._small)
+        return self._len
+
+    def _items(self) -> Iterable[Tuple[Any, Any]]:
+        if self._small is not None:
+            return self._small.items()
+        return self._root.items()
+
+    def __repr__(self) -> str:
+        entries = ", ".join(f"{k!r}: {v!r}" for k, v in self._items())
+        return f"{type(self).__name__}({{{entries}}})"
+
+    def copy(self) -> "PersistentMap":
+        """Returns a copy of the map which, unless the map is small, shares its
+        nodes with this map"""
+        other = PersistentMap.__new__(PersistentMap)
+        if self._small is not None:
+            other._small = self._small.copy()
+            other._owner = object()
+            # the (empty) root of this map is filled in place once it outgrows the
+            # dict, so the copy needs a root of its own
+            other._root = _Node(0, [], [], other._owner)
+            other._len = 0
+            return other
+        # From now on the existing nodes are shared, so neither map may update
+        # them in place.
+        self._owner = object()
+        other._small = None
+        other._root = self._root
+        other._len = self._len
+        other._owner = object()
+        return other
@@ -3,36 +3,54 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import Tuple
+from typing import Optional, Tuple
 
 import torch
 import torch.autograd
 from torch._vmap_internals import _vmap as vmap
 
 
-def gradients(
-    outputs: torch.Tensor, inputs: torch.Tensor, allow_unused: bool = True
-) -> Tuple[torch.Tensor, torch.Tensor]:
-    """
-    Compute the first and the second gradient of the output Tensor
-    w.r.t. the input Tensor.
+# The ways of computing the diagonal of the Hessian (or, for simplex, the diagonal
+# minus the maximum off-diagonal entry of each column) which halfspace_gradients and
+# simplex_gradients support:
+#   "dense": computes the full Hessian, then keeps what is needed.
+#   "blocked": as "dense", but computes the Hessian a block of rows at a time, so it
+#       only needs O(n) memory rather than O(n^2); it still needs n backward passes.
+#   "separable": a single Hessian-vector product with a vector of ones. This is exact
+#       when the output is a sum of functions of the individual inputs, e.g. the log
+#       prob of a vector of independent Gammas, so that the Hessian is diagonal.
+#   "hutchinson": (half space only) the unbiased estimate E[z * Hz] of the diagonal,
+#       averaged over num_probes random vectors z of +1s and -1s. The estimate is
+#       random unless the probes are given; see rademacher_probes.
+HESSIAN_ESTIMATORS = ("dense", "blocked", "separable", "hutchinson")
 
-    :param output: A Tensor variable with a single element.
-    :param input: A 1-d tensor input variable that was used to compute the
-                output. Note: the input must have requires_grad=True
-    :returns: tuple of Tensor variables -- The first and the second gradient.
-    """
+# the number of rows of the Hessian computed at once by the "blocked" estimator
+_HESSIAN_BLOCK_SIZE = 256
+
+
+def _first_gradient(
+    outputs: torch.Tensor, inputs: torch.Tensor, allow_unused: bool
+) -> torch.Tensor:
     if outputs.numel() != 1:
         raise ValueError(
             f"output tensor must have exactly one element, got {outputs.numel()}"
         )
 
-    grad1 = torch.autograd.grad(
+    return torch.autograd.grad(
         outputs, inputs, create_graph=True, retain_graph=True, allow_unused=allow_unused
     )[0].reshape(-1)
 
-    # using identity matrix to reconstruct the full hessian from vector-Jacobian product
-    hessians = vmap(
+
+def _hessian_vector_products(
+    grad1: torch.Tensor,
+    inputs: torch.Tensor,
+    vecs: torch.Tensor,
+    allow_unused: bool,
+) -> torch.Tensor:
+    """Returns the product of the Hessian with each row of vecs, as the rows of the
+    result. Since the Hessian is symmetric, these are also the products of the rows
+    of vecs with the Hessian."""
+    return vmap(
         lambda vec: torch.autograd.grad(
             grad1,
             inputs,
@@ -41,12 +59,64 @@ def gradients(
             retain_graph=True,
             allow_unused=allow_unused,
         )[0].reshape(-1)
-    )(torch.eye(grad1.size(0)))
-    return grad1.detach(), hessians.detach()
+    )(vecs).detach()
 
 
-def halfspace_gradients(
+def _hessian_blocks(grad1: torch.Tensor, inputs: torch.Tensor, allow_unused: bool):
+    """Yields the index of the first row of each block of rows of the Hessian,
+    along with the block"""
+    n = grad1.size(0)
+    for start in range(0, n, _HESSIAN_BLOCK_SIZE):
+        end = min(start + _HESSIAN_BLOCK_SIZE, n)
+        rows = torch.zeros(end - start, n, dtype=grad1.dtype, device=grad1.device)
+        torch.diagonal(rows, start).fill_(1.0)
+        yield start, _hessian_vector_products(grad1, inputs, rows, allow_unused)
+
+
+def rademacher_probes(
+    num_probes: int, n: int, dtype: torch.dtype, device: torch.device
+) -> torch.Tensor:
+    """Returns num_probes random vectors of length n, whose entries are +1 or -1
+    with equal probability, as the rows of a tensor."""
+    probes = torch.randint(0, 2, (num_probes, n), device=device) * 2 - 1
+    return probes.to(dtype)
+
+
+def _check_estimator(hessian: str, supported: Tuple[str, ...]) -> None:
+    if hessian not in supported:
+        raise ValueError(
+            f"Unknown Hessian estimator {hessian}; expected one of {supported}."
+        )
+
+
+def gradients(
     outputs: torch.Tensor, inputs: torch.Tensor, allow_unused: bool = True
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Compute the first and the second gradient of the output Tensor
+    w.r.t. the input Tensor.
+
+    :param output: A Tensor variable with a single element.
+    :param input: A 1-d tensor input variable that was used to compute the
+                output. Note: the input must have requires_grad=True
+    :returns: tuple of Tensor variables -- The first and the second gradient.
+    """
+    grad1 = _first_gradient(outputs, inputs, allow_unused)
+
+    # using identity matrix to reconstruct the full hessian from vector-Jacobian product
+    hessians = _hessian_vector_products(
+        grad1, inputs, torch.eye(grad1.size(0)), allow_unused
+    )
+    return grad1.detach(), hessians
+
+
+def halfspace_gradients(
+    outputs: torch.Tensor,
+    inputs: torch.Tensor,
+    allow_unused: bool = True,
+    hessian: str = "dense",
+    num_probes: int = 16,
+    probes: Optional[torch.Tensor] = None,
 ) -> Tuple[torch.Tensor, torch.Tensor]:
     """
     Compute the first and the second gradient of the output Tensor w.r.t. the input
@@ -55,14 +125,42 @@ def halfspace_gradients(
     :param output: A Tensor variable with a single element.
     :param input: A 1-d tensor input variable that was used to compute the
                 output. Note: the input must have requires_grad=True
-    :returns: tuple of Tensor variables -- The first and the second gradient.
+    :param hessian: How to compute the diagonal of the Hessian; one of
+                HESSIAN_ESTIMATORS.
+    :param num_probes: The number of random vectors used by "hutchinson".
+    :param probes: The random vectors used by "hutchinson", as the rows of a
+                tensor; if None, num_probes new ones are drawn.
+    :returns: tuple of Tensor variables -- The first and the diagonal of the second
+                gradient.
     """
-    grad1, hessians = gradients(outputs, inputs, allow_unused)
-    return grad1, torch.diagonal(hessians)
+    _check_estimator(hessian, HESSIAN_ESTIMATORS)
+    if hessian == "dense":
+        grad1, hessians = gradients(outputs, inputs, allow_unused)
+        return grad1, torch.diagonal(hessians)
+
+    grad1 = _first_gradient(outputs, inputs, allow_unused)
+    if hessian == "blocked":
+        hessian_diag = torch.empty_like(grad1).detach()
+        for start, rows in _hessian_blocks(grad1, inputs, allow_unused):
+            hessian_diag[start : start + len(rows)] = torch.diagonal(rows, start)
+    elif hessian == "separable":
+        ones = torch.ones_like(grad1).unsqueeze(0)
+        hessian_diag = _hessian_vector_products(grad1, inputs, ones, allow_unused)[0]
+    else:
+        if probes is None:
+            probes = rademacher_probes(
+                num_probes, grad1.size(0), grad1.dtype, grad1.device
+            )
+        products = _hessian_vector_products(grad1, inputs, probes, allow_unused)
+        hessian_diag = (probes * products).mean(dim=0)
+    return grad1.detach(), hessian_diag
 
 
 def simplex_gradients(
-    outputs: torch.Tensor, inputs: torch.Tensor, allow_unused: bool = True
+    outputs: torch.Tensor,
+    inputs: torch.Tensor,
+    allow_unused: bool = True,
+    hessian: str = "dense",
 ) -> Tuple[torch.Tensor, torch.Tensor]:
     """
     Compute the first and the second gradient of the output Tensor w.r.t. the input
@@ -71,11 +169,38 @@ def simplex_gradients(
     :param output: A Tensor variable with a single element.
     :param input: A 1-d tensor input variable that was used to compute the
                 output. Note: the input must have requires_grad=True
-    :returns: tuple of Tensor variables -- The first and the second gradient.
+    :param hessian: How to compute the second gradient; one of HESSIAN_ESTIMATORS
+                except "hutchinson", which cannot estimate the maximum.
+                "separable" assumes that the off-diagonal entries are all zero,
+                rather than computing their maximum.
+    :returns: tuple of Tensor variables -- The first gradient, and the diagonal of
+                the second gradient minus the maximum off-diagonal entry of each
+                column.
     """
-    grad1, hessians = gradients(outputs, inputs, allow_unused)
-    hessian_diag = torch.diagonal(hessians).clone()
-    # mask diagonal entries
-    hessians[torch.eye(hessians.size(0)).bool()] = float("-inf")
-    hessian_diag -= hessians.max(dim=0)[0]
-    return grad1, hessian_diag
+    _check_estimator(hessian, ("dense", "blocked", "separable"))
+    if hessian == "dense":
+        grad1, hessians = gradients(outputs, inputs, allow_unused)
+        hessian_diag = torch.diagonal(hessians).clone()
+        # mask diagonal entries
+        hessians[torch.eye(hessians.size(0)).bool()] = float("-inf")
+        hessian_diag -= hessians.max(dim=0)[0]
+        return grad1, hessian_diag
+
+    grad1 = _first_gradient(outputs, inputs, allow_unused)
+    if hessian == "blocked":
+        hessian_diag = torch.empty_like(grad1).detach()
+        max_off_diag = torch.full_like(hessian_diag, float("-inf"))
+        for start, rows in _hessian_blocks(grad1, inputs, allow_unused):
+            hessian_diag[start : start + len(rows)] = torch.diagonal(rows, start)
+            # mask diagonal entries
+            torch.diagonal(rows, start).fill_(float("-inf"))
+            max_off_diag = torch.maximum(max_off_diag, rows.max(dim=0)[0])
+    else:
+        ones = torch.ones_like(grad1).unsqueeze(0)
+        hessian_diag = _hessian_vector_products(grad1, inputs, ones, allow_unused)[0]
+        # this assumes that the Hessian is diagonal, i.e. that all of the
+        # off-diagonal entries are zero
+        max_off_diag = torch.full_like(
+            hessian_diag, 0.0 if hessian_diag.numel() > 1 else float("-inf")
+        )
+    return grad1.detach(), hessian_diag - max_off_diag
@@ -0,0 +1,43 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import contextlib
+import threading
+from typing import Iterator, Optional
+
+import torch.distributions as dist
+
+
+# Validating the arguments of a distribution requires data-dependent control flow,
+# which torch.func.vmap does not support, so it has to be disabled while a model is
+# vmapped. Whether distributions validate their arguments is a process-wide
+# default, and the model may be vmapped in several threads at once (e.g. chains
+# run with parallel_backend="thread"), so the default is only disabled by the first
+# thread to enter argument_validation_disabled, and restored by the last one to
+# exit it.
+_lock = threading.Lock()
+_num_active = 0
+_saved_default: Optional[bool] = None
+
+
+@contextlib.contextmanager
+def argument_validation_disabled() -> Iterator[None]:
+    """Disables the validation of the arguments of distributions inside the with
+    block. Note that this also disables it in any other thread while the block runs;
+    Bean Machine disables it by default anyway."""
+    global _num_active, _saved_default
+    with _lock:
+        if _num_active == 0:
+            _saved_default = dist.Distribution._validate_args
+            dist.Distribution.set_default_validate_args(False)
+        _num_active += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _num_active -= 1
+            if _num_active == 0:
+                assert _saved_default is not None
+                dist.Distribution.set_default_validate_args(_saved_default)
@@ -6,17 +6,25 @@
 from __future__ import annotations
 
 from abc import ABCMeta, abstractmethod
-from typing import Optional
+from contextvars import ContextVar
+from typing import Optional, Tuple
 
 import torch
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
 
 
-_WORLD_STACK: list[BaseWorld] = []
+# The stack of worlds entered in the current context. Each thread (and asyncio task)
+# has a context of its own, so chains running in different threads of the same
+# process don't see each other's worlds. The stack is an immutable tuple which is
+# replaced, rather than mutated, on every enter and exit.
+_WORLD_STACK: ContextVar[Tuple[BaseWorld, ...]] = ContextVar(
+    "beanmachine_world_stack", default=()
+)
 
 
 def get_world_context() -> Optional[BaseWorld]:
-    return _WORLD_STACK[-1] if _WORLD_STACK else None
+    stack = _WORLD_STACK.get()
+    return stack[-1] if stack else None
 
 
 class BaseWorld(metaclass=ABCMeta):
@@ -38,11 +46,11 @@ class BaseWorld(metaclass=ABCMeta):
             # back to updating world1
         ```
         """
-        _WORLD_STACK.append(self)
+        _WORLD_STACK.set(_WORLD_STACK.get() + (self,))
         return self
 
     def __exit__(self, *args) -> None:
-        _WORLD_STACK.pop()
+        _WORLD_STACK.set(_WORLD_STACK.get()[:-1])
 
     def call(self, node: RVIdentifier):
         """
@@ -0,0 +1,143 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Fused evaluation of the log probabilities of homogeneous families of variables.
+
+Models often contain many sites from the same random variable family, e.g. ``y(i)``
+for every observation ``i``, whose distributions only differ in their parameters.
+Rather than calling ``log_prob`` once per site, the parameters and values of such a
+family are stacked and evaluated with a single call to ``log_prob`` of a batched
+distribution, which avoids most of the per-site dispatch overhead."""
+
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Type
+
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.world.variable import Variable
+from torch.distributions.utils import lazy_property
+
+# Families with fewer uncached sites than this are evaluated one site at a time,
+# since the cost of stacking outweighs the savings for them.
+MIN_FUSED_SIZE = 8
+
+# Attributes which distributions set, and that are not parameters. (``_param`` is
+# whichever of ``probs`` and ``logits`` e.g. a Bernoulli was constructed with.)
+_BASE_ATTRIBUTES = frozenset(
+    ["_batch_shape", "_event_shape", "_validate_args", "_param"]
+)
+
+_ParamsKey = Tuple[Tuple[str, torch.Size], ...]
+
+
+class LogProbPlan:
+    """
+    Partitions the variables of a world into families which share the same random
+    variable function (``RVIdentifier.wrapper``) and the same type of distribution.
+    A plan only depends on the structure of the world, so it can be shared between
+    a world and its copies until the structure changes.
+
+    Args:
+        variables: The variables of the world, keyed by their RVIdentifiers.
+    """
+
+    def __init__(self, variables: Mapping[RVIdentifier, Variable]):
+        groups: Dict[Tuple[Any, Type[dist.Distribution]], List[RVIdentifier]] = {}
+        for node, var in variables.items():
+            key = (node.wrapper, type(var.distribution))
+            groups.setdefault(key, []).append(node)
+        self.groups: List[List[RVIdentifier]] = list(groups.values())
+        self.group_of: Dict[RVIdentifier, int] = {
+            node: i for i, group in enumerate(self.groups) for node in group
+        }
+        self.num_nodes = len(self.group_of)
+
+    def partition(self, nodes: Iterable[RVIdentifier]) -> List[List[RVIdentifier]]:
+        """Returns the given nodes, grouped by family. Nodes which are not part of
+        the plan are returned in a group of their own."""
+        groups: Dict[Any, List[RVIdentifier]] = {}
+        for node in nodes:
+            groups.setdefault(self.group_of.get(node, node), []).append(node)
+        return list(groups.values())
+
+
+def _params_of(distribution: dist.Distribution) -> Optional[Dict[str, torch.Tensor]]:
+    """Returns the tensors from which the distribution can be re-constructed by
+    passing them to its constructor as keyword arguments, or None if it cannot be"""
+    cls = type(distribution)
+    attributes = vars(distribution)
+    params = {}
+    for name, value in attributes.items():
+        if name in _BASE_ATTRIBUTES:
+            continue
+        if name in distribution.arg_constraints and isinstance(value, torch.Tensor):
+            params[name] = value
+        elif not isinstance(getattr(cls, name, None), lazy_property):
+            # the distribution has some state other than its parameters
+            return None
+    if "probs" in params and "logits" in params and "_param" in attributes:
+        # one of them was computed from the other, which is held in _param
+        name = "logits" if attributes["_param"] is params["probs"] else "probs"
+        del params[name]
+    return params or None
+
+
+def _fused_log_prob(variables: List[Variable]) -> Optional[torch.Tensor]:
+    """Computes the log probabilities of variables whose distributions have the same
+    type, parameter shapes and value shapes as a single batch. Returns the stacked
+    log probabilities, or None if the variables cannot be evaluated together."""
+    first = variables[0].distribution
+    shape = first.batch_shape + first.event_shape
+    all_params = []
+    key: Optional[_ParamsKey] = None
+    for var in variables:
+        params = _params_of(var.distribution)
+        if params is None or var.value.shape != shape:
+            return None
+        params_key = tuple((name, value.shape) for name, value in params.items())
+        if key is None:
+            key = params_key
+        elif params_key != key:
+            return None
+        all_params.append(params)
+    assert key is not None
+    try:
+        batched = type(first)(
+            **{name: torch.stack([p[name] for p in all_params]) for name, _ in key},
+            validate_args=False,
+        )
+        log_prob = batched.log_prob(torch.stack([var.value for var in variables]))
+    except (TypeError, ValueError, RuntimeError, NotImplementedError):
+        # e.g. the constructor has other required arguments
+        return None
+    if log_prob.shape[:1] != (len(variables),):
+        return None
+    return log_prob
+
+
+def group_log_prob(variables: List[Variable]) -> torch.Tensor:
+    """
+    Returns the sum of the log probabilities of the given variables, which should be
+    members of the same family. Variables whose log probabilities have not been
+    computed yet are evaluated together where possible, and their log probabilities
+    are cached on the variables as usual.
+    """
+    cached, uncached = [], []
+    for var in variables:
+        (cached if "log_prob" in vars(var) else uncached).append(var)
+    if len(uncached) >= MIN_FUSED_SIZE:
+        log_probs = _fused_log_prob(uncached)
+        if log_probs is not None:
+            for var, log_prob in zip(uncached, log_probs.unbind()):
+                # populate the lazy property of the variable
+                setattr(var, "log_prob", log_prob)
+            total = log_probs.sum()
+            for var in cached:
+                total = total + torch.sum(var.log_prob)
+            return total
+    total = torch.tensor(0.0)
+    for var in variables:
+        total = total + torch.sum(var.log_prob)
+    return total
@@ -13,6 +13,7 @@ from typing import (
     Iterator,
     List,
     Mapping,
+    MutableMapping,
     Optional,
     Set,
     Tuple,
@@ -22,9 +23,15 @@ from typing import (
 import torch
 import torch.distributions as dist
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
+from beanmachine.ppl.utils.persistent_map import PersistentMap
 from beanmachine.ppl.world import init_to_uniform
 from beanmachine.ppl.world.base_world import BaseWorld
 from beanmachine.ppl.world.initialize_fn import init_from_prior, InitializeFn
+from beanmachine.ppl.world.log_prob_plan import (
+    group_log_prob,
+    LogProbPlan,
+    MIN_FUSED_SIZE,
+)
 from beanmachine.ppl.world.variable import Variable
 
 
@@ -71,7 +78,12 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
     ) -> None:
         self.observations: RVDict = observations or {}
         self._initialize_fn: InitializeFn = initialize_fn
-        self._variables: Dict[RVIdentifier, Variable] = {}
+        # a persistent map, so that copying a world (e.g. in replace) takes constant
+        # time and only the updated variables are copied
+        self._variables: MutableMapping[RVIdentifier, Variable] = PersistentMap()
+        # groups the variables into families whose log probs are evaluated together;
+        # reset whenever the structure of the graph changes
+        self._log_prob_plan: Optional[LogProbPlan] = None
 
         self._call_stack: List[_TempVar] = []
 
@@ -162,6 +174,8 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
             new_distribution, new_parents = new_world._run_node(node)
             # Update children's dependencies
             old_node_var = new_world._variables[node]
+            if type(new_distribution) is not type(old_node_var.distribution):
+                new_world._log_prob_plan = None
             new_world._variables[node] = old_node_var.replace(
                 parents=new_parents, distribution=new_distribution
             )
@@ -193,6 +207,7 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
         """
         world_copy = World(self.observations.copy(), self._initialize_fn)
         world_copy._variables = self._variables.copy()
+        world_copy._log_prob_plan = self._log_prob_plan
         return world_copy
 
     def initialize_value(self, node: RVIdentifier) -> None:
@@ -209,6 +224,7 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
             distribution=distribution,
             parents=parents,
         )
+        self._log_prob_plan = None
 
     def update_graph(self, node: RVIdentifier) -> torch.Tensor:
         """
@@ -241,12 +257,22 @@ class World(BaseWorld, Mapping[RVIdentifier, torch.Tensor]):
         Returns:
           The joint log prob of all of the nodes in the current world
         """
-        if nodes is None:
-            nodes = self._variables.keys()
-
+        if nodes is not None and len(nodes) < MIN_FUSED_SIZE:
+            log_prob = torch.tensor(0.0)
+            for node in set(nodes):
+                log_prob = log_prob + torch.sum(self._variables[node].log_prob)
+            return log_prob
+
+        # Variables of the same family (e.g. y(i) for all i) are evaluated with a
+        # single call to log_prob, see log_prob_plan.py
+        plan = self._log_prob_plan
+        if plan is None or plan.num_nodes != len(self._variables):
+            plan = self._log_prob_plan = LogProbPlan(self._variables)
+        groups = plan.groups if nodes is None else plan.partition(set(nodes))
         log_prob = torch.tensor(0.0)
-        for node in set(nodes):
-            log_prob = log_prob + torch.sum(self._variables[node].log_prob)
+        for group in groups:
+            variables = [self._variables[node] for node in group]
+            log_prob = log_prob + group_log_prob(variables)
         return log_prob
 
     def enumerate_node(self, node: RVIdentifier) -> torch.Tensor:
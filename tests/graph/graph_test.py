@@ -420,6 +420,38 @@ digraph "graph" {
         self.assertEqual(type(samples_all[1][0][1]), bool)
         self.assertTrue(samples_all[1][0][1])
 
+    def test_infer_to_numpy(self):
+        def create_graph():
+            g, Rain, Sprinkler, GrassWet = self._create_graph()
+            g.observe(GrassWet, True)
+            g.query(Rain)
+            g.query(GrassWet)
+            g.query(g.add_constant_real(2.5))
+            g.query(g.add_constant_real_matrix(np.array([1.5, -0.5])))
+            g.query(g.add_constant_real_matrix(np.array([[1.0, 2.0, 3.0], [4, 5, 6]])))
+            return g
+
+        samples = create_graph().infer(num_samples=5, n_chains=2)
+        arrays = create_graph().infer_to_numpy(num_samples=5, n_chains=2)
+        self.assertEqual(len(arrays), 5)
+        self.assertEqual(arrays[0].dtype, np.bool_)
+        self.assertEqual(arrays[0].shape, (2, 5))
+        self.assertEqual(arrays[2].dtype, np.float64)
+        self.assertEqual(arrays[2].shape, (2, 5))
+        # Column vectors are flattened and matrices are transposed.
+        self.assertEqual(arrays[3].shape, (2, 5, 2))
+        self.assertEqual(arrays[4].shape, (2, 5, 3, 2))
+        self.assertTrue(arrays[0].flags["C_CONTIGUOUS"])
+        for chain in range(2):
+            for i in range(5):
+                self.assertEqual(arrays[0][chain, i], samples[chain][i][0])
+                self.assertTrue(arrays[1][chain, i])
+                self.assertEqual(arrays[2][chain, i], 2.5)
+                np.testing.assert_array_equal(arrays[3][chain, i], [1.5, -0.5])
+                np.testing.assert_array_equal(
+                    arrays[4][chain, i], samples[chain][i][4].T
+                )
+
     def test_infer_mean(self):
         g = graph.Graph()
         c1 = g.add_constant_probability(1.0)
@@ -0,0 +1,107 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Tests for reusing compiled BMG graphs across calls to BMGInference.infer"""
+import tempfile
+import unittest
+
+import beanmachine.ppl as bm
+from beanmachine.ppl.compiler.compilation_cache import CompilationCache
+from beanmachine.ppl.inference import BMGInference
+from torch import tensor
+from torch.distributions import Bernoulli, Beta, Normal
+
+
+@bm.random_variable
+def beta(n):
+    return Beta(2.0, 2.0)
+
+
+@bm.random_variable
+def flip(n):
+    return Bernoulli(beta(0))
+
+
+@bm.random_variable
+def flip_beta():
+    return Bernoulli(tensor([beta(0), beta(1)]))
+
+
+@bm.random_variable
+def mu():
+    return Normal(0.0, 1.0)
+
+
+@bm.random_variable
+def x(n):
+    return Normal(mu(), 1.0)
+
+
+class CompilationCacheTest(unittest.TestCase):
+    def _assert_same_samples(self, queries, observations, cache) -> None:
+        expected = BMGInference().infer(queries, observations, 10, 1)
+        observed = BMGInference(cache).infer(queries, observations, 10, 1)
+        for rv in queries:
+            self.assertTrue(expected[rv].equal(observed[rv]))
+
+    def test_compilation_cache_scalar_observations(self) -> None:
+        self.maxDiff = None
+        cache = CompilationCache()
+        queries = [mu()]
+
+        self._assert_same_samples(
+            queries, {x(0): tensor(1.0), x(1): tensor(2.5)}, cache
+        )
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 0)
+        self.assertEqual(len(cache), 1)
+
+        # Same structure, new values: the cached graph is re-observed.
+        self._assert_same_samples(
+            queries, {x(0): tensor(-1.0), x(1): tensor(0.5)}, cache
+        )
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 1)
+
+        # A different set of observed random variables is a different graph.
+        self._assert_same_samples(queries, {x(0): tensor(-1.0)}, cache)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_compilation_cache_devectorized_observations(self) -> None:
+        cache = CompilationCache()
+        queries = [beta(0), beta(1)]
+        self._assert_same_samples(queries, {flip_beta(): tensor([0.0, 1.0])}, cache)
+        self._assert_same_samples(queries, {flip_beta(): tensor([1.0, 1.0])}, cache)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 1)
+
+    def test_compilation_cache_on_disk(self) -> None:
+        queries = [mu()]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = CompilationCache(cache_dir)
+            self._assert_same_samples(queries, {x(0): tensor(1.0)}, cache)
+            self.assertEqual(cache.misses, 1)
+
+            # A fresh cache on the same directory finds the persisted graph.
+            cache = CompilationCache(cache_dir)
+            self._assert_same_samples(queries, {x(0): tensor(3.0)}, cache)
+            self.assertEqual(cache.misses, 0)
+            self.assertEqual(cache.hits, 1)
+
+    def test_compilation_cache_folded_observations(self) -> None:
+        # The beta-bernoulli conjugacy rewrite folds the observed values into
+        # the graph; such graphs must not be cached.
+        cache = CompilationCache()
+        queries = [beta(0)]
+        observations = {flip(0): tensor(0.0), flip(1): tensor(1.0)}
+        expected = BMGInference().infer(
+            queries, observations, 10, 1, skip_optimizations=set()
+        )
+        observed = BMGInference(cache).infer(
+            queries, observations, 10, 1, skip_optimizations=set()
+        )
+        self.assertTrue(expected[beta(0)].equal(observed[beta(0)]))
+        self.assertEqual(len(cache), 0)
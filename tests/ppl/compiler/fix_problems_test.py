@@ -5,10 +5,20 @@
 
 """Tests for fix_problems.py"""
 import unittest
+from unittest import mock
 
 from beanmachine.ppl.compiler.bm_graph_builder import BMGraphBuilder
+from beanmachine.ppl.compiler.fix_arithmetic import neg_neg_fixer
+from beanmachine.ppl.compiler.fix_problem import (
+    ancestors_first_graph_fixer,
+    fixpoint_graph_fixer,
+    node_fixer_first_match,
+    worklist_graph_fixer,
+)
 from beanmachine.ppl.compiler.fix_problems import fix_problems
 from beanmachine.ppl.compiler.gen_dot import to_dot
+from beanmachine.ppl.compiler.lattice_typer import LatticeTyper
+from beanmachine.ppl.compiler.profiler import ProfilerData
 
 from beanmachine.ppl.model.rv_identifier import RVIdentifier
 from torch import tensor
@@ -1059,3 +1069,78 @@ digraph "graph" {
 }
 """
         self.assertEqual(expected.strip(), observed.strip())
+
+    def test_fix_problems_15(self) -> None:
+        """test_fix_problems_15"""
+
+        # The arithmetic fixers are run to a fixpoint by a worklist engine, which
+        # after the first round only revisits the nodes which changed and their
+        # descendants; it should produce the same graph as running the fixers over
+        # the whole graph until nothing changes.
+
+        def build() -> BMGraphBuilder:
+            bmg = BMGraphBuilder()
+            two = bmg.add_constant(tensor(2.0))
+            beta = bmg.add_beta(two, two)
+            samples = [bmg.add_sample(beta) for _ in range(4)]
+            # (((s0 + s1) + s2) + s3) becomes a single sum
+            total = samples[0]
+            for s in samples[1:]:
+                total = bmg.add_addition(total, s)
+            # -(-total) becomes total
+            neg = bmg.add_negate(bmg.add_negate(total))
+            norm = bmg.add_normal(neg, two)
+            bmg.add_sample(norm)
+            return bmg
+
+        bmg = build()
+        bmg._pd = ProfilerData()
+        bmg, error_report = fix_problems(bmg)
+        self.assertEqual(str(error_report).strip(), "")
+        report = bmg._pd.to_report()
+        self.assertEqual(report.counts["multiary_addition_fixer fixes"], 1)
+        self.assertEqual(report.counts["neg_neg_fixer fixes"], 1)
+        self.assertGreater(report.fix_problems.neg_neg_fixer.calls, 0)
+        observed = to_dot(bmg, node_types=True, edge_requirements=True)
+
+        with mock.patch(
+            "beanmachine.ppl.compiler.fix_problems.worklist_graph_fixer",
+            lambda typer, fixers: fixpoint_graph_fixer(
+                ancestors_first_graph_fixer(
+                    typer, node_fixer_first_match(list(fixers.values()))
+                )
+            ),
+        ):
+            expected_bmg, _ = fix_problems(build())
+        expected = to_dot(expected_bmg, node_types=True, edge_requirements=True)
+        self.assertEqual(expected.strip(), observed.strip())
+
+    def test_fix_problems_16(self) -> None:
+        """test_fix_problems_16"""
+
+        # After the first round, the worklist engine only revisits the nodes which
+        # were modified and their descendants, not the independent parts of the
+        # graph.
+
+        bmg = BMGraphBuilder()
+        two = bmg.add_constant(tensor(2.0))
+        beta = bmg.add_beta(two, two)
+        for _ in range(10):
+            bmg.add_sample(bmg.add_normal(bmg.add_sample(beta), two))
+        s = bmg.add_sample(beta)
+        norm = bmg.add_normal(bmg.add_negate(bmg.add_negate(s)), two)
+        bmg.add_sample(norm)
+        bmg._pd = ProfilerData()
+        ancestors = len(bmg.all_ancestor_nodes())
+
+        fixer = worklist_graph_fixer(LatticeTyper(), {"neg_neg": neg_neg_fixer(bmg)})
+        bmg, made_progress, errors = fixer(bmg)
+
+        self.assertTrue(made_progress)
+        self.assertFalse(errors.any())
+        self.assertIs(norm.inputs[0], s)
+        counts = bmg._pd.counts
+        self.assertEqual(counts["worklist_graph_fixer rounds"], 2)
+        # The second round visits only the sample s, the normal and its sample.
+        self.assertEqual(counts["worklist_graph_fixer visits"], ancestors + 3)
+        self.assertEqual(counts["neg_neg fixes"], 1)
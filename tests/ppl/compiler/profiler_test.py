@@ -55,3 +55,25 @@ Total time: 800 ms
         self.assertEqual(700000000, report.A.total_time)
         self.assertEqual(500000000, report.A.B.total_time)
         self.assertEqual(200000000, report.A.B.C.total_time)
+
+    def test_profiler_record(self) -> None:
+        self.maxDiff = None
+        pd = ProfilerData()
+        pd.begin("A", 1000000000)
+        # 1000 short calls of B which took 300 ms altogether
+        pd.record("B", 1000, 300000000, 1500000000)
+        pd.increment("B fixes", 3)
+        pd.increment("B fixes")
+        pd.finish("A", 1700000000)
+
+        report = pd.to_report()
+        expected = """
+A:(1) 700 ms
+  B:(1000) 300 ms
+  unattributed: 400 ms
+Total time: 700 ms
+B fixes: 4
+"""
+        self.assertEqual(expected.strip(), str(report).strip())
+        self.assertEqual(1000, report.A.B.calls)
+        self.assertEqual({"B fixes": 4}, report.counts)
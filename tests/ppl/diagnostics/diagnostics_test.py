@@ -230,6 +230,87 @@ class DiagnosticsTest(unittest.TestCase):
         self.assertAlmostEqual(dim1, 1.9605, delta=0.001)
         self.assertAlmostEqual(dim2, 15.1438, delta=0.001)
 
+    def test_effective_sample_size_initial_positive_sequence(self):
+        torch.manual_seed(0)
+        # a random walk is strongly autocorrelated, white noise is not
+        samples = torch.stack(
+            [torch.randn(3, 200).cumsum(dim=1), torch.randn(3, 200)], dim=-1
+        ).double()
+        n_eff = common_statistics.effective_sample_size(samples)
+        self.assertEqual(n_eff.shape, (2,))
+        self.assertLess(n_eff[0], 50)
+        self.assertGreater(n_eff[1], 300)
+        # every dimension is truncated independently of the others
+        for i in range(2):
+            self.assertAlmostEqual(
+                common_statistics.effective_sample_size(samples[..., i]).item(),
+                n_eff[i].item(),
+                delta=1e-6,
+            )
+
+    def test_initial_positive_sum_matches_loop(self):
+        torch.manual_seed(0)
+        # random autocorrelations, which start positive and decay into noise
+        rho = torch.randn(51, 4, 3).double() * 0.3 + torch.linspace(
+            1, -0.5, 51
+        ).double().reshape(51, 1, 1)
+        rho[7, 2, 1] = float("nan")
+        rho_sum = common_statistics._initial_positive_sum(rho)
+        self.assertEqual(rho_sum.shape, (4, 3))
+        for i in range(4):
+            for j in range(3):
+                expected = torch.tensor(0.0, dtype=rho.dtype)
+                for t in range(rho.shape[0] // 2):
+                    pair = rho[2 * t, i, j] + rho[2 * t + 1, i, j]
+                    if pair < 0:
+                        break
+                    expected += pair
+                if expected.isnan():
+                    self.assertTrue(rho_sum[i, j].isnan())
+                else:
+                    self.assertAlmostEqual(
+                        rho_sum[i, j].item(), expected.item(), delta=1e-9
+                    )
+
+    def test_tail_effective_sample_size_quantiles(self):
+        torch.manual_seed(0)
+        samples = torch.randn(3, 101, 2).double()
+        split = common_statistics._split_chains(samples)
+        quantiles = torch.quantile(
+            split.reshape(-1, 2), torch.tensor([0.05, 0.95]).double(), dim=0
+        )
+        expected = torch.minimum(
+            common_statistics.effective_sample_size((split <= quantiles[0]).double()),
+            common_statistics.effective_sample_size((split <= quantiles[1]).double()),
+        )
+        tail = common_statistics.tail_effective_sample_size(samples)
+        self.assertTrue(torch.allclose(tail, expected))
+
+    def test_rank_normalize(self):
+        samples = torch.tensor([[[1.0, 5.0], [3.0, 5.0]], [[2.0, 5.0], [4.0, 5.0]]])
+        z = common_statistics.rank_normalize(samples)
+        self.assertEqual(z.shape, samples.shape)
+        # the normal scores preserve the order of the samples
+        self.assertTrue(
+            torch.equal(z[..., 0].flatten().argsort(), torch.tensor([0, 2, 1, 3]))
+        )
+        # ties get the same score, which is the median one
+        self.assertTrue(torch.allclose(z[..., 1], torch.zeros(2, 2), atol=1e-6))
+
+    def test_bulk_and_tail_effective_sample_size(self):
+        torch.manual_seed(0)
+        samples = torch.randn(4, 100, 3)
+        bulk = common_statistics.bulk_effective_sample_size(samples)
+        tail = common_statistics.tail_effective_sample_size(samples)
+        self.assertEqual(bulk.shape, (3,))
+        self.assertEqual(tail.shape, (3,))
+        # the bulk effective sample size is invariant to monotone transformations
+        self.assertTrue(
+            torch.allclose(
+                bulk, common_statistics.bulk_effective_sample_size(samples.exp())
+            )
+        )
+
     def test_effective_sample_size_columns(self):
         mh = bm.SingleSiteAncestralMetropolisHastings()
         samples = mh.infer([normal()], {}, 5, 2)
@@ -3,8 +3,11 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import sys
+
 import pytest
 import torch
+from beanmachine.ppl.diagnostics.common_statistics import effective_sample_size, r_hat
 
 from beanmachine.ppl.experimental.causal_inference.models.bart.bart_model import (
     BART,
@@ -72,3 +75,30 @@ def test_predict_with_quantiles_xbart(X_test, xbart):
     assert (1 - xbart.num_samples % 2) or torch.all(
         torch.median(posterior_samples, dim=1)[0] == qvals
     )
+
+
+@pytest.mark.skipif(
+    sys.platform.startswith("win"), reason="the fork start method needs a POSIX system"
+)
+@pytest.mark.parametrize(
+    "model, num_samples",
+    [(BART(num_trees=1), 9), (XBART(num_trees=1), 5)],
+)
+def test_fit_multiple_chains(X, y, X_test, model, num_samples):
+    model.fit(
+        X=X,
+        y=y,
+        num_burn=1,
+        num_samples=num_samples,
+        num_chains=2,
+        mp_context="fork",
+    )
+    assert model.num_chains == 2
+    posterior_samples = model.get_posterior_predictive_samples(X_test)
+    assert posterior_samples.shape == (len(X_test), 2 * num_samples)
+    chains = model.get_posterior_predictive_chains(X_test)
+    assert chains.shape == (2, num_samples, len(X_test))
+    # the chains are laid out chain by chain in the pooled draws
+    assert torch.equal(chains[1, :, 0], posterior_samples[0, num_samples:])
+    assert r_hat(chains) is not None
+    assert effective_sample_size(chains).shape == (len(X_test),)
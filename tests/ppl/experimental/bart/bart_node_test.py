@@ -103,6 +103,22 @@ def test_grow_node(leaf_node, left_rule, right_rule, X):
     assert grown_leaf.most_recent_rule() == left_rule
 
 
+def test_grow_and_prune_cached_observations(loose_leaf, left_rule, right_rule, X):
+    loose_leaf.cache_observations(X)
+    grown_leaf = LeafNode.grow_node(
+        loose_leaf, left_rule=left_rule, right_rule=right_rule
+    )
+    for node in [grown_leaf, grown_leaf.left_child, grown_leaf.right_child]:
+        # the cached rows are the rows which satisfy the rules of the node
+        mask = node.composite_rules.condition_on_rules(X)
+        assert torch.equal(node.index_in_node(X), torch.nonzero(mask).reshape(-1))
+        # an equal but different input matrix is conditioned on the rules
+        assert node.index_in_node(X.clone()).dtype == torch.bool
+    assert torch.equal(grown_leaf.left_child.data_in_node(X), X[1:])
+    pruned_node = SplitNode.prune_node(grown_leaf)
+    assert pruned_node.index_in_node(X) is grown_leaf.index_in_node(X)
+
+
 def test_prune_node(leaf_node, composite_rule):
     split_node = SplitNode(
         left_child=leaf_node,
@@ -0,0 +1,87 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import pytest
+import torch
+
+from beanmachine.ppl.experimental.causal_inference.models.bart.mutation import (
+    GrowMutation,
+)
+from beanmachine.ppl.experimental.causal_inference.models.bart.node import LeafNode
+from beanmachine.ppl.experimental.causal_inference.models.bart.packed_trees import (
+    PackedTrees,
+)
+from beanmachine.ppl.experimental.causal_inference.models.bart.split_rule import (
+    CompositeRules,
+    Operator,
+    SplitRule,
+)
+from beanmachine.ppl.experimental.causal_inference.models.bart.tree import Tree
+
+
+@pytest.fixture
+def X():
+    return torch.Tensor([[3.0, 1.0], [4.0, -1.0], [1.5, 1.0], [-1.0, 2.0]])
+
+
+def _leaf(val):
+    return LeafNode(depth=0, composite_rules=CompositeRules(all_dims=[0, 1]), val=val)
+
+
+def _grow(tree, leaf, grow_dim, grow_val, left_val, right_val):
+    split_node = LeafNode.grow_node(
+        leaf,
+        left_rule=SplitRule(grow_dim=grow_dim, grow_val=grow_val, operator=Operator.le),
+        right_rule=SplitRule(
+            grow_dim=grow_dim, grow_val=grow_val, operator=Operator.gt
+        ),
+    )
+    split_node.left_child.val = left_val
+    split_node.right_child.val = right_val
+    tree.mutate(GrowMutation(old_node=leaf, new_node=split_node))
+    return split_node
+
+
+@pytest.fixture
+def draws():
+    stump = Tree(nodes=[_leaf(0.5)])
+    deep_root = _leaf(0.0)
+    deep = Tree(nodes=[deep_root])
+    split_node = _grow(deep, deep_root, 0, 1.5, 0.0, 0.0)
+    right = _grow(deep, split_node.right_child, 1, 0.0, -2.0, 3.0)
+    _grow(deep, right.right_child, 0, 3.0, 7.0, 11.0)
+    _grow(deep, split_node.left_child, 1, 1.0, -5.0, 13.0)
+    shallow_root = _leaf(0.0)
+    shallow = Tree(nodes=[shallow_root])
+    _grow(shallow, shallow_root, 1, 1.0, 1.0, 2.0)
+    return [[stump, deep], [shallow, stump]]
+
+
+def test_predict(X, draws):
+    packed = PackedTrees.from_trees(draws)
+    assert len(packed) == 2 and packed.num_trees == 2
+    expected = torch.cat(
+        [sum(tree.predict(X) for tree in trees) for trees in draws], dim=-1
+    )
+    assert torch.allclose(packed.predict(X), expected)
+
+
+def test_concatenate(X, draws):
+    packed = PackedTrees.concatenate(
+        [PackedTrees.from_trees([trees]) for trees in draws]
+    )
+    assert torch.allclose(packed.predict(X), PackedTrees.from_trees(draws).predict(X))
+    assert PackedTrees.concatenate([]).predict(X).shape == (len(X), 0)
+    with pytest.raises(ValueError):
+        PackedTrees.from_trees([draws[0], draws[1][:1]])
+
+
+def test_save_load(X, draws, tmp_path):
+    packed = PackedTrees.from_trees(draws)
+    path = str(tmp_path / "trees.npz")
+    packed.save(path)
+    loaded = PackedTrees.load(path)
+    assert loaded.depth == packed.depth
+    assert torch.equal(loaded.predict(X), packed.predict(X))
@@ -149,6 +149,23 @@ def test_prediction(tree, X):
         assert float(x1) * tree.predict(x1) >= 0
 
 
+def test_copy(tree, X):
+    tree_copy = tree.copy()
+    assert tree_copy.num_nodes() == tree.num_nodes()
+    assert torch.equal(tree_copy.predict(X), tree.predict(X))
+    # changing the copy leaves the original alone
+    original_prediction = tree.predict(X)
+    for leaf in tree_copy.leaf_nodes():
+        leaf.val = 0.0
+    prunable = tree_copy.prunable_split_nodes()[0]
+    tree_copy.mutate(
+        PruneMutation(old_node=prunable, new_node=SplitNode.prune_node(prunable))
+    )
+    assert tree.num_nodes() == 5
+    assert tree_copy.num_nodes() == 3
+    assert torch.equal(tree.predict(X), original_prediction)
+
+
 def test_mutate_prune(tree, root, l1_non_growable, r1_grown):
     old_tree_len = tree.num_nodes()
     pruned_r1 = SplitNode.prune_node(r1_grown)
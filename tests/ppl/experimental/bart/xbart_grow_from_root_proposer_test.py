@@ -69,12 +69,13 @@ def test_get_uniq_elems(gfr_proposer, X):
     num_observations, num_dims = X.shape
     for inp_dim in range(num_dims):
         dim_val_counts = val_counts[inp_dim]
-        assert sum(dim_val_counts.values()) == num_observations
-        for id_, uniq_val in enumerate(uniq_vals[inp_dim]):
-            assert dim_val_counts[uniq_val] > 0
-            if id_ > 0:
-                assert uniq_val >= uniq_vals[inp_dim][id_ - 1]
-        assert set(uniq_vals[inp_dim]) == {_.item() for _ in X[:, inp_dim]}
+        assert dim_val_counts.shape == uniq_vals[inp_dim].shape
+        assert dim_val_counts.sum().item() == num_observations
+        assert torch.all(dim_val_counts > 0)
+        assert torch.all(uniq_vals[inp_dim][1:] > uniq_vals[inp_dim][:-1])
+        assert set(uniq_vals[inp_dim].tolist()) == {_.item() for _ in X[:, inp_dim]}
+        for uniq_val, count in zip(uniq_vals[inp_dim], dim_val_counts):
+            assert (X[:, inp_dim] == uniq_val).sum() == count
 
 
 @pytest.fixture
@@ -217,15 +218,20 @@ def test_sift(
     )
 
     for dim in range(invariants.O_.shape[0]):
-        assert set(invariants.uniq_vals[dim]) == set(
-            left_invariants.uniq_vals[dim]
-        ).union(set(right_invariants.uniq_vals[dim]))
-        for val in invariants.uniq_vals[dim]:
-            assert (
-                invariants.val_counts[dim][val]
-                == left_invariants.val_counts[dim][val]
-                + right_invariants.val_counts[dim][val]
-            )
+        val_counts = [
+            dict(zip(inv.uniq_vals[dim].tolist(), inv.val_counts[dim].tolist()))
+            for inv in [invariants, left_invariants, right_invariants]
+        ]
+        assert set(val_counts[0]) == set(val_counts[1]).union(set(val_counts[2]))
+        for val, count in val_counts[0].items():
+            assert count == val_counts[1].get(val, 0) + val_counts[2].get(val, 0)
+
+    # the partition is stable, so both sides remain sorted along every dimension
+    for side in [left_invariants, right_invariants]:
+        for dim in range(side.O_.shape[0]):
+            dim_vals = X[side.O_[dim], dim]
+            assert torch.all(dim_vals[1:] >= dim_vals[:-1])
+            assert side.uniq_vals[dim].tolist() == sorted(set(dim_vals.tolist()))
 
 
 def test_propose(
@@ -115,6 +115,41 @@ def test_inference_config():
     assert {proposers[1].node, proposers[2].node} == {model.bar(0), model.bar(1)}
 
 
+def test_proposer_plan_is_cached():
+    model = SampleModel()
+    nuts = bm.GlobalNoUTurnSampler()
+    compositional = bm.CompositionalInference(
+        {model.foo: nuts, ...: bm.SingleSiteAncestralMetropolisHastings()}
+    )
+    world = World.initialize_world([model.bar(0), model.bar(1)], {})
+    with patch.object(nuts, "get_proposers", wraps=nuts.get_proposers) as mock:
+        proposers = compositional.get_proposers(world, world.latent_nodes, 0)
+        assert len(proposers) == 3
+        # the plan is reused while the latent nodes stay the same
+        assert compositional.get_proposers(world, world.latent_nodes, 0) == proposers
+        mock.assert_called_once()
+
+        # adding a node only re-plans the block of its family
+        new_world = World.initialize_world([model.baz()], {})
+        new_proposers = compositional.get_proposers(
+            new_world, new_world.latent_nodes, 0
+        )
+        mock.assert_called_once()
+        assert isinstance(new_proposers[0], NUTSProposer)
+        assert {proposer.node for proposer in new_proposers[1:]} == {
+            model.bar(0),
+            model.bar(1),
+            model.baz(),
+        }
+
+        # and removing it drops its proposer again
+        proposers = compositional.get_proposers(world, world.latent_nodes, 0)
+        assert {proposer.node for proposer in proposers[1:]} == {
+            model.bar(0),
+            model.bar(1),
+        }
+
+
 def test_config_inference_with_tuple_of_rv():
     model = SampleModel()
     nuts = bm.GlobalNoUTurnSampler()
@@ -72,6 +72,81 @@ def test_inference(multiprocess):
     )
 
 
+def test_thread_parallel_chains():
+    model = SampleModel()
+    nuts = bm.GlobalNoUTurnSampler(nnc_compile=False)
+    observations = {model.bar(): torch.tensor(0.5)}
+    num_samples = 200
+    num_chains = 8
+    samples = nuts.infer(
+        [model.foo(), model.baz()],
+        observations,
+        num_samples,
+        num_adaptive_samples=100,
+        num_chains=num_chains,
+        run_in_parallel=True,
+        parallel_backend="thread",
+        show_progress_bar=False,
+    )
+    foo = samples[model.foo()]
+    assert foo.shape == (num_chains, num_samples)
+    assert samples.get_log_likelihoods(model.bar()).shape == (num_chains, num_samples)
+    # the chains are independent of each other...
+    for i in range(num_chains):
+        for j in range(i + 1, num_chains):
+            assert not torch.equal(foo[i], foo[j])
+    # ...and the log likelihoods of each chain are computed from its own samples
+    expected = dist.Normal(foo, 1.0).log_prob(torch.tensor(0.5))
+    assert torch.allclose(samples.get_log_likelihoods(model.bar()), expected)
+    # the posterior of foo is Normal(0.25, 0.5 ** 0.5)
+    assert foo.mean().item() == pytest.approx(0.25, abs=0.15)
+
+    with pytest.raises(ValueError):
+        nuts.infer(
+            [model.foo()],
+            observations,
+            num_samples,
+            run_in_parallel=True,
+            parallel_backend="greenlet",
+        )
+
+
+def test_vectorized_chains():
+    model = SampleModel()
+    hmc = bm.GlobalHamiltonianMonteCarlo(trajectory_length=1.0)
+    queries = [model.foo(), model.baz()]
+    observations = {model.bar(): torch.tensor(0.5)}
+    num_samples = 30
+    num_chains = 3
+    samples = hmc.infer(
+        queries,
+        observations,
+        num_samples,
+        num_adaptive_samples=num_samples,
+        num_chains=num_chains,
+        vectorize_chains=True,
+    )
+    assert samples[model.foo()].shape == (num_chains, num_samples)
+    assert samples[model.baz()].shape == (num_chains, num_samples)
+    assert samples.get_num_samples(include_adapt_steps=True) == num_samples * 2
+    assert samples.get_log_likelihoods(model.bar()).shape == (num_chains, num_samples)
+    assert not torch.equal(
+        samples.get_chain(0)[model.foo()], samples.get_chain(1)[model.foo()]
+    )
+
+    mh = bm.SingleSiteAncestralMetropolisHastings()
+    with pytest.raises(NotImplementedError, match="vectorized chains"):
+        mh.infer(queries, observations, num_samples, vectorize_chains=True)
+    with pytest.raises(ValueError):
+        hmc.infer(
+            queries,
+            observations,
+            num_samples,
+            run_in_parallel=True,
+            vectorize_chains=True,
+        )
+
+
 def test_get_proposers():
     world = World()
     model = SampleModel()
@@ -0,0 +1,84 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference import RandomMinibatch, StreamingMinibatch
+from beanmachine.ppl.inference.vi import ADVI
+
+
+class NormalModel:
+    @bm.random_variable
+    def mu(self):
+        return dist.Normal(0.0, 10.0)
+
+    @bm.random_variable
+    def y(self, i):
+        return dist.Normal(self.mu(), 1.0)
+
+
+model = NormalModel()
+data = torch.randn(200) + 3.0
+observations = {model.y(i): data[i] for i in range(len(data))}
+# the conjugate posterior of mu given all of the data
+posterior_var = 1 / (1 / 100 + len(data))
+posterior_mean = posterior_var * data.sum()
+
+
+def test_random_minibatch():
+    minibatch = RandomMinibatch(observations, batch_size=20)
+    batch = minibatch.next_batch()
+    assert len(batch) == 20
+    assert all(observations[node] is value for node, value in batch.items())
+    assert minibatch.size == 200
+    assert minibatch.scale(batch) == 10.0
+    with pytest.raises(ValueError):
+        RandomMinibatch(observations, batch_size=0)
+    with pytest.raises(ValueError):
+        RandomMinibatch(observations, batch_size=201)
+
+
+def test_streaming_minibatch():
+    loader = [(torch.arange(i, i + 50), data[i : i + 50]) for i in range(0, 200, 50)]
+
+    def to_observations(batch):
+        indices, values = batch
+        return {model.y(i): value for i, value in zip(indices.tolist(), values)}
+
+    minibatch = StreamingMinibatch(loader, 200, to_observations)
+    batches = [minibatch.next_batch() for _ in range(6)]
+    # the loader is read again once it is exhausted
+    assert batches[0] == batches[4]
+    assert batches[1] == batches[5]
+    assert set().union(*batches[:4]) == set(observations)
+    assert minibatch.scale(batches[0]) == 4.0
+    with pytest.raises(ValueError):
+        StreamingMinibatch([], 200).next_batch()
+
+
+def test_vi_minibatch():
+    bm.seed(0)
+    vi = ADVI(
+        queries=[model.mu()],
+        observations={},
+        minibatch=RandomMinibatch(observations, batch_size=20),
+        optimizer=lambda params: torch.optim.Adam(params, lr=1e-1),
+    )
+    world = vi.infer(num_steps=500, num_samples=8)
+    mu_approx = world.get_guide_distribution(model.mu())
+    assert mu_approx.mean.item() == pytest.approx(posterior_mean.item(), abs=0.3)
+
+
+def test_sgld():
+    bm.seed(0)
+    sgld = bm.StochasticGradientLangevinDynamics(
+        step_size=1e-3, minibatch=RandomMinibatch(observations, batch_size=20)
+    )
+    samples = sgld.infer([model.mu()], {}, num_samples=500, num_chains=1)
+    mu_samples = samples[model.mu()][0, 100:]
+    assert mu_samples.mean().item() == pytest.approx(posterior_mean.item(), abs=0.3)
+    assert mu_samples.std().item() < 1.0
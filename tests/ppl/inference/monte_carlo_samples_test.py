@@ -3,7 +3,9 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
 import pickle
+import tempfile
 import unittest
 
 import beanmachine.ppl as bm
@@ -127,6 +129,87 @@ class MonteCarloSamplesTest(unittest.TestCase):
         # check the values still exist and have the correct shape
         self.assertEqual(reloaded_samples[reloaded_model.foo()].shape, (2, 10))
 
+    def test_save_and_load(self):
+        model = self.SampleModel()
+        mh = bm.SingleSiteAncestralMetropolisHastings()
+        foo_key, bar_key = model.foo(), model.bar()
+        samples = mh.infer(
+            [foo_key],
+            {bar_key: torch.tensor(0.5)},
+            num_samples=10,
+            num_chains=2,
+            num_adaptive_samples=3,
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "samples")
+            samples.save(path)
+            with self.assertRaises(ValueError):
+                samples.save(path)
+
+            loaded = MonteCarloSamples.load(path)
+            (loaded_foo_key,) = loaded.keys()
+            loaded_model = loaded_foo_key.arguments[0]
+            self.assertEqual(loaded_foo_key, loaded_model.foo())
+            self.assertEqual(loaded.num_chains, 2)
+            self.assertEqual(loaded.num_adaptive_samples, 3)
+            self.assertEqual(loaded.get_num_samples(), 10)
+            self.assertTrue(torch.equal(loaded[loaded_foo_key], samples[foo_key]))
+            for thinning in [1, 2, 4]:
+                self.assertTrue(
+                    torch.equal(
+                        loaded.get_variable(loaded_foo_key, True, thinning),
+                        samples.get_variable(foo_key, True, thinning),
+                    )
+                )
+            self.assertTrue(
+                torch.equal(
+                    loaded.get_chain(1)[loaded_foo_key], samples.get_chain(1)[foo_key]
+                )
+            )
+            self.assertTrue(
+                torch.equal(
+                    loaded.get_log_likelihoods(loaded_model.bar(), True),
+                    samples.get_log_likelihoods(bar_key, True),
+                )
+            )
+            self.assertEqual(loaded.observations[loaded_model.bar()], 0.5)
+
+            # the loaded tensors can be modified without changing the saved samples
+            loaded[loaded_foo_key][0, 0] = 100.0
+            reloaded = MonteCarloSamples.load(path)
+            self.assertTrue(torch.equal(reloaded[loaded_foo_key], samples[foo_key]))
+
+    def test_save_and_load_namespaces(self):
+        model = self.SampleModel()
+        mh = bm.SingleSiteAncestralMetropolisHastings()
+        samples = mh.infer([model.foo()], {}, num_samples=10, num_chains=1)
+        bar_samples = MonteCarloSamples(
+            {model.bar(): torch.randn(1, 5, 2)}, default_namespace="bar"
+        )
+        bar_samples.add_groups(samples)
+        chain_view = bar_samples.get_chain(0)
+        with tempfile.TemporaryDirectory() as directory:
+            bar_samples.save(os.path.join(directory, "bar"))
+            loaded = MonteCarloSamples.load(os.path.join(directory, "bar"))
+            self.assertEqual(loaded.default_namespace, "bar")
+            self.assertIsNone(loaded.log_likelihoods)
+            self.assertEqual(set(loaded.namespaces), {"bar", "posterior"})
+            (bar_key,) = loaded.keys()
+            self.assertEqual(loaded[bar_key].shape, (1, 5, 2))
+            (foo_key,) = loaded.namespaces["posterior"].samples.keys()
+            self.assertTrue(
+                torch.equal(
+                    loaded.get_variable(foo_key, namespace="posterior"),
+                    samples[model.foo()],
+                )
+            )
+
+            chain_view.save(os.path.join(directory, "chain"))
+            loaded = MonteCarloSamples.load(os.path.join(directory, "chain"))
+            self.assertTrue(loaded.single_chain_view)
+            (bar_key,) = loaded.keys()
+            self.assertEqual(loaded[bar_key].shape, (5, 2))
+
     def test_get_rv_with_default(self):
         model = self.SampleModel()
         mh = bm.SingleSiteAncestralMetropolisHastings()
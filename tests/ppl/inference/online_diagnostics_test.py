@@ -0,0 +1,117 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.diagnostics.common_statistics import r_hat
+from beanmachine.ppl.inference import OnlineDiagnostics
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(torch.zeros(2), 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo().sum(), 1.0)
+
+
+model = SampleModel()
+
+
+def test_running_r_hat_matches_r_hat():
+    samples = torch.randn(3, 50, 2)
+    samples[1] += 1.0
+    diagnostics = OnlineDiagnostics(report_every=1000)
+    diagnostics.begin([model.foo()], num_chains=3)
+    for i in range(samples.shape[1]):
+        diagnostics.update([samples[:, i]])
+    assert diagnostics.num_samples == 50
+    assert torch.allclose(diagnostics.r_hat()[model.foo()], r_hat(samples), atol=1e-5)
+
+
+def test_effective_sample_size():
+    torch.manual_seed(0)
+    diagnostics = OnlineDiagnostics(report_every=1000)
+    diagnostics.begin([model.foo()], num_chains=2)
+    assert diagnostics.effective_sample_size()[model.foo()] is None
+    # independent samples on the first dimension, a random walk on the second
+    walk = torch.zeros(2)
+    for _ in range(2000):
+        walk = walk + torch.randn(2)
+        diagnostics.update([torch.stack([torch.randn(2), walk], dim=-1)])
+    ess = diagnostics.effective_sample_size()[model.foo()]
+    assert ess.shape == (2,)
+    assert 2000 < ess[0] < 8000
+    assert ess[1] < 200
+
+
+def test_report_every():
+    reports = []
+    diagnostics = OnlineDiagnostics(
+        report_every=3, callback=lambda d: reports.append(d.num_samples)
+    )
+    diagnostics.begin([model.foo()], num_chains=2)
+    for _ in range(10):
+        diagnostics.update([torch.randn(2, 2)])
+    assert reports == [3, 6, 9]
+
+
+def test_stop_early():
+    diagnostics = OnlineDiagnostics(max_r_hat=1.1, min_ess=10.0, min_samples=50)
+    samples = bm.GlobalNoUTurnSampler(nnc_compile=False).infer(
+        [model.foo()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=1000,
+        num_chains=2,
+        num_adaptive_samples=20,
+        diagnostics=diagnostics,
+    )
+    num_samples = samples.get_num_samples()
+    assert 50 <= num_samples < 1000
+    assert diagnostics.num_samples == num_samples
+    assert samples[model.foo()].shape == (2, num_samples, 2)
+    assert samples.get_num_samples(include_adapt_steps=True) == num_samples + 20
+    assert samples.get_log_likelihoods(model.bar()).shape == (2, num_samples)
+
+
+@pytest.mark.parametrize("vectorize_chains", [False, True])
+def test_no_stopping_criterion(vectorize_chains):
+    diagnostics = OnlineDiagnostics(report_every=5)
+    samples = bm.GlobalHamiltonianMonteCarlo(1.0).infer(
+        [model.foo()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=20,
+        num_chains=2,
+        num_adaptive_samples=0,
+        vectorize_chains=vectorize_chains,
+        diagnostics=diagnostics,
+    )
+    assert samples[model.foo()].shape == (2, 20, 2)
+    assert diagnostics.num_samples == 20
+    assert diagnostics.r_hat()[model.foo()].shape == (2,)
+
+
+def test_diagnostics_errors():
+    with pytest.raises(ValueError):
+        bm.SingleSiteAncestralMetropolisHastings().infer(
+            [model.foo()],
+            {},
+            num_samples=10,
+            num_chains=2,
+            run_in_parallel=True,
+            diagnostics=OnlineDiagnostics(),
+        )
+    with pytest.raises(ValueError):
+        bm.SingleSiteAncestralMetropolisHastings().infer(
+            [model.foo()],
+            {},
+            num_samples=10,
+            num_chains=1,
+            diagnostics=OnlineDiagnostics(max_r_hat=1.01),
+        )
@@ -60,6 +60,14 @@ class PredictiveTest(unittest.TestCase):
         assert predictives[self.prior()].shape == (1, 10)
         assert predictives[self.likelihood()].shape == (1, 10)
 
+    def test_prior_predictive_vector(self):
+        queries = [self.prior_2(), self.likelihood_2(0)]
+        predictives = bm.simulate(queries, num_samples=10, chunk_size=4)
+        assert predictives[self.prior_2()].shape == (1, 10, 2)
+        assert predictives[self.likelihood_2(0)].shape == (1, 10, 2)
+        # every draw is simulated independently
+        assert predictives[self.prior_2()].unique().numel() == 20
+
     def test_posterior_predictive(self):
         obs = {
             self.likelihood_i(0): torch.tensor(1.0),
@@ -100,6 +108,26 @@ class PredictiveTest(unittest.TestCase):
         assert predictives[self.likelihood_dynamic(0)].shape == (2, 10)
         assert predictives[self.likelihood_dynamic(1)].shape == (2, 10)
 
+    def test_predictive_dynamic_partial_fallback(self):
+        obs = {
+            self.likelihood_dynamic(0): torch.tensor([0.9]),
+            self.likelihood_i(1): torch.tensor(1.0),
+        }
+        post_samples = bm.SingleSiteAncestralMetropolisHastings().infer(
+            [self.prior()], obs, num_samples=10, num_chains=2
+        )
+        # likelihood_dynamic(0) cannot be vmapped, and is simulated draw by draw
+        # together with likelihood_i(0), but not with likelihood_i(1)
+        queries = [
+            self.likelihood_dynamic(0),
+            self.likelihood_i(0),
+            self.likelihood_i(1),
+        ]
+        predictives = bm.simulate(queries, post_samples, chunk_size=3)
+        assert predictives[self.likelihood_dynamic(0)].shape == (2, 10)
+        assert predictives[self.likelihood_i(0)].shape == (2, 10)
+        assert predictives[self.likelihood_i(1)].shape == (2, 10)
+
     def test_predictive_data(self):
         x = torch.randn(4)
         y = torch.randn(4) + 2.0
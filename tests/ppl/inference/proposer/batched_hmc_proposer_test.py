@@ -0,0 +1,112 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import beanmachine.ppl as bm
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference.proposer.batched_hmc_proposer import BatchedHMCProposer
+from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
+from beanmachine.ppl.world import World
+
+
+@bm.random_variable
+def foo():
+    return dist.Uniform(0.0, 1.0)
+
+
+@bm.random_variable
+def bar():
+    return dist.Normal(foo(), 1.0)
+
+
+@pytest.fixture
+def worlds():
+    worlds = []
+    for _ in range(3):
+        w = World()
+        w.call(bar())
+        worlds.append(w)
+    return worlds
+
+
+@pytest.fixture
+def hmc(worlds):
+    return BatchedHMCProposer(worlds, worlds[0].latent_nodes, 10, 1.0)
+
+
+def test_potential_grads(worlds, hmc):
+    pe, pe_grad = hmc._potential_grads(hmc._positions)
+    assert pe.shape == (3,)
+    assert pe_grad.shape == hmc._positions.shape
+    # the vectorized energies should agree with those of the individual chains
+    for i, world in enumerate(worlds):
+        single = HMCProposer(world, world.latent_nodes, 10, 1.0)
+        assert torch.allclose(pe[i], single._pe)
+        assert torch.allclose(pe_grad[i], single._pe_grad)
+
+
+def test_per_chain_step_sizes(hmc):
+    assert hmc.step_size.shape == (3,)
+    momentums = hmc._initialize_momentums(hmc._positions)
+    assert momentums.shape == hmc._positions.shape
+    ke = hmc._kinetic_energy(momentums, hmc._mass_inv)
+    assert ke.shape == (3,)
+    # a chain with a step size of zero never moves
+    step_size = torch.tensor([0.0, 0.1, 0.2])
+    new_positions, _, _, _ = hmc._leapfrog_step(
+        hmc._positions, momentums, step_size.unsqueeze(-1), hmc._mass_inv
+    )
+    assert torch.equal(new_positions[0], hmc._positions[0])
+    assert not torch.equal(new_positions[1], hmc._positions[1])
+
+
+def test_leapfrog_updates_per_chain_num_steps(hmc):
+    momentums = hmc._initialize_momentums(hmc._positions)
+    # the chains take 1, 2 and 4 steps respectively
+    step_size = torch.tensor([1.0, 0.5, 0.25])
+    positions, _, pe, _ = hmc._leapfrog_updates(
+        hmc._positions, momentums, 1.0, step_size, hmc._mass_inv, hmc._pe_grad
+    )
+    one_step_positions, _, one_step_pe, _ = hmc._leapfrog_step(
+        hmc._positions,
+        momentums,
+        step_size.unsqueeze(-1),
+        hmc._mass_inv,
+        hmc._pe_grad,
+    )
+    assert torch.allclose(positions[0], one_step_positions[0])
+    assert torch.allclose(pe[0], one_step_pe[0])
+    assert not torch.allclose(positions[1], one_step_positions[1])
+
+
+@pytest.mark.parametrize("full_mass_matrix", [False, True])
+def test_propose_and_adapt(worlds, full_mass_matrix):
+    hmc = BatchedHMCProposer(
+        worlds, worlds[0].latent_nodes, 30, 1.0, full_mass_matrix=full_mass_matrix
+    )
+    for _ in range(30):
+        world, _ = hmc.propose(worlds[0])
+        assert world is worlds[0]
+        hmc.do_adaptation()
+    hmc.finish_adaptation()
+    assert hmc._alpha is None
+    values = hmc.call(lambda w: [w[foo()]])
+    assert values[0].shape == (3,)
+    assert torch.all((values[0] > 0.0) & (values[0] < 1.0))
+
+
+def test_fall_back_to_one_chain_at_a_time(worlds):
+    @bm.random_variable
+    def baz():
+        # data-dependent control flow can't be vectorized
+        return dist.Normal(1.0 if foo() > 0.5 else -1.0, 1.0)
+
+    for w in worlds:
+        w.call(baz())
+    with pytest.warns(UserWarning, match="Unable to vectorize"):
+        hmc = BatchedHMCProposer(worlds, worlds[0].latent_nodes, 10, 1.0)
+    assert not hmc._use_vmap
+    assert hmc._pe.shape == (3,)
@@ -7,6 +7,7 @@ import beanmachine.ppl as bm
 import pytest
 import torch
 import torch.distributions as dist
+from beanmachine.ppl.experimental.torch_jit_backend import TorchJITBackend
 from beanmachine.ppl.inference.proposer.hmc_proposer import HMCProposer
 from beanmachine.ppl.world import World
 
@@ -81,3 +82,70 @@ def test_step_size_exception(algorithm):
             num_samples=20,
             num_chains=1,
         )
+
+
+@bm.random_variable
+def branching_bar():
+    if foo() > 0.5:
+        return dist.Normal(foo(), 1.0)
+    return dist.Normal(0.0, foo())
+
+
+def test_traced_potential(world):
+    hmc = HMCProposer(
+        world,
+        world.latent_nodes,
+        10,
+        trajectory_length=1.0,
+        jit_backend=TorchJITBackend.NONE,
+        trace_potential=True,
+    )
+    assert hmc._traced_potential is not None
+    positions = hmc._positions + 0.3
+    pe, pe_grad = hmc._potential_grads(positions)
+    eager_hmc = HMCProposer(
+        world,
+        world.latent_nodes,
+        10,
+        trajectory_length=1.0,
+        jit_backend=TorchJITBackend.NONE,
+    )
+    assert eager_hmc._traced_potential is None
+    eager_pe, eager_pe_grad = eager_hmc._potential_grads(positions)
+    assert torch.allclose(pe, eager_pe)
+    assert torch.allclose(pe_grad, eager_pe_grad)
+    # the trace stays valid for the worlds the proposer moves to
+    for _ in range(5):
+        world, _ = hmc.propose(world)
+    assert hmc._traced_potential is not None
+
+
+def test_traced_potential_falls_back():
+    world = World()
+    world.call(branching_bar())
+    hmc = HMCProposer(
+        world,
+        world.latent_nodes,
+        10,
+        trajectory_length=1.0,
+        jit_backend=TorchJITBackend.NONE,
+        trace_potential=True,
+    )
+    # the model branches on the value of foo(), which a trace cannot capture
+    assert hmc._traced_potential is None
+
+
+def test_traced_potential_guard(world):
+    hmc = HMCProposer(
+        world,
+        {foo()},
+        10,
+        trajectory_length=1.0,
+        jit_backend=TorchJITBackend.NONE,
+        trace_potential=True,
+    )
+    assert hmc._traced_potential is not None
+    # bar() is baked into the trace, so changing it invalidates the trace
+    new_world = world.replace({bar(): torch.tensor(0.1)})
+    hmc.propose(new_world)
+    assert hmc._traced_potential is None
@@ -73,3 +73,36 @@ class SingleSiteHalfSpaceNewtonianMonteCarloProposerTest(unittest.TestCase):
         self.assertAlmostEqual(
             beta.sum().item(), (predicted_beta).sum().item(), delta=0.0001
         )
+
+    def test_hessian_estimators_for_gamma(self):
+        alpha = torch.full((300,), 2.0)
+        beta = torch.full((300,), 3.0)
+
+        @bm.random_variable
+        def gamma():
+            return dist.Gamma(alpha, beta)
+
+        world = World()
+        with world:
+            gamma()
+        _, expected_alpha, expected_beta = SingleSiteHalfSpaceNMCProposer(
+            gamma()
+        ).compute_alpha_beta(world)
+        for hessian in ["blocked", "separable"]:
+            nw_proposer = SingleSiteHalfSpaceNMCProposer(gamma(), hessian=hessian)
+            is_valid, predicted_alpha, predicted_beta = nw_proposer.compute_alpha_beta(
+                world
+            )
+            self.assertTrue(is_valid)
+            self.assertTrue(predicted_alpha.allclose(expected_alpha))
+            self.assertTrue(predicted_beta.allclose(expected_beta))
+
+        with self.assertRaises(ValueError):
+            SingleSiteHalfSpaceNMCProposer(gamma(), hessian="sparse")
+
+        # the Hessian of independent Gammas is diagonal, so Hutchinson's estimate
+        # is exact whichever probes a proposal draws
+        nw_proposer = SingleSiteHalfSpaceNMCProposer(gamma(), hessian="hutchinson")
+        new_world, accept_log_prob = nw_proposer.propose(world)
+        self.assertTrue(torch.isfinite(accept_log_prob))
+        self.assertIsNone(nw_proposer._probes)
@@ -87,3 +87,63 @@ def test_build_tree(tree_node, tree_args, nuts):
     assert isinstance(tree, _Tree)
     assert tree.turned_or_diverged or (tree.left is not tree.right)
     assert tree.turned_or_diverged or tree.num_proposals == 2**tree_depth
+
+
+@pytest.mark.parametrize("direction", [-1, 1])
+def test_build_tree_matches_recursive(tree_node, tree_args, nuts, direction):
+    tree_args = tree_args._replace(direction=torch.tensor(direction))
+    for tree_depth in range(6):
+        tree = nuts._build_tree(tree_node, tree_depth, tree_args)
+        expected = nuts._build_tree_recursively(tree_node, tree_depth, tree_args)
+        # both take the same leapfrog steps and stop at the same U-turn
+        assert tree.num_proposals == expected.num_proposals
+        assert bool(tree.turned_or_diverged) == bool(expected.turned_or_diverged)
+        assert torch.isclose(tree.sum_accept_prob, expected.sum_accept_prob)
+        if not expected.turned_or_diverged:
+            assert torch.allclose(tree.left.positions, expected.left.positions)
+            assert torch.allclose(tree.right.positions, expected.right.positions)
+            assert torch.allclose(tree.sum_momentums, expected.sum_momentums)
+            assert torch.isclose(tree.log_weight, expected.log_weight)
+
+
+class NormalNormalModel:
+    @bm.random_variable
+    def mu(self):
+        return dist.Normal(torch.zeros(3), 1.0)
+
+    @bm.random_variable
+    def y(self):
+        return dist.Normal(self.mu().sum(), 1.0)
+
+
+@pytest.mark.parametrize("multinomial_sampling", [True, False])
+def test_iterative_and_recursive_kernels_agree(monkeypatch, multinomial_sampling):
+    model = NormalNormalModel()
+    observations = {model.y(): torch.tensor(2.0)}
+
+    def draw(seed):
+        bm.seed(seed)
+        nuts = bm.GlobalNoUTurnSampler(
+            nnc_compile=False, multinomial_sampling=multinomial_sampling
+        )
+        samples = nuts.infer(
+            [model.mu()],
+            observations,
+            num_samples=2000,
+            num_adaptive_samples=500,
+            num_chains=1,
+            show_progress_bar=False,
+        )
+        return samples[model.mu()][0]
+
+    samples = draw(0)
+    monkeypatch.setattr(
+        NUTSProposer, "_build_tree", NUTSProposer._build_tree_recursively
+    )
+    expected = draw(1)
+    # the posterior of mu is Normal(0.5, covariance I - 1/4) in every dimension
+    for mu in (samples, expected):
+        assert torch.allclose(mu.mean(0), torch.full((3,), 0.5), atol=0.15)
+        assert torch.allclose(mu.var(0), torch.full((3,), 0.75), atol=0.15)
+    assert torch.allclose(samples.mean(0), expected.mean(0), atol=0.2)
+    assert torch.allclose(samples.var(0), expected.var(0), atol=0.2)
@@ -0,0 +1,158 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import sys
+
+import beanmachine.ppl as bm
+import numpy as np
+import pytest
+import torch
+import torch.distributions as dist
+from beanmachine.ppl.inference import (
+    InMemorySink,
+    NetCDFSink,
+    NumpyMemmapSink,
+    SharedMemorySink,
+)
+
+
+class SampleModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Normal(torch.zeros(2), 1.0)
+
+    @bm.random_variable
+    def bar(self):
+        return dist.Normal(self.foo().sum(), 1.0)
+
+    @bm.random_variable
+    def flip(self):
+        return dist.Bernoulli(0.5)
+
+    @bm.functional
+    def is_heads(self):
+        return self.flip() == 1.0
+
+
+model = SampleModel()
+
+
+def _infer(sink, thin=1, **kwargs):
+    bm.seed(0)
+    return bm.SingleSiteAncestralMetropolisHastings().infer(
+        [model.foo(), model.is_heads()],
+        {model.bar(): torch.tensor(0.5)},
+        num_samples=25,
+        num_adaptive_samples=10,
+        num_chains=2,
+        sink=sink,
+        thin=thin,
+        **kwargs,
+    )
+
+
+def _assert_same_samples(expected, observed):
+    for rv in [model.foo(), model.is_heads()]:
+        assert torch.equal(
+            expected.get_variable(rv, include_adapt_steps=True),
+            observed.get_variable(rv, include_adapt_steps=True),
+        )
+    assert torch.equal(
+        expected.get_log_likelihoods(model.bar()),
+        observed.get_log_likelihoods(model.bar()),
+    )
+
+
+def test_in_memory_sink():
+    sink = InMemorySink(chunk_size=7)
+    samples = _infer(sink)
+    assert samples[model.foo()].shape == (2, 25, 2)
+    assert samples[model.is_heads()].dtype == torch.bool
+    assert samples.get_num_samples(include_adapt_steps=True) == 35
+    _assert_same_samples(_infer(None), samples)
+    # the chains wrote into the tensors the sink allocated, which hold all chains
+    assert samples[model.foo()]._base is sink.columns[0]
+
+
+@pytest.mark.skipif(
+    sys.platform.startswith("win"),
+    reason="Windows does not support fork-based multiprocessing",
+)
+def test_in_memory_sink_in_parallel():
+    samples = _infer(
+        InMemorySink(chunk_size=7), run_in_parallel=True, mp_context="fork"
+    )
+    assert samples[model.foo()].shape == (2, 25, 2)
+    assert not torch.equal(
+        samples.get_chain(0)[model.foo()], samples.get_chain(1)[model.foo()]
+    )
+
+
+def test_thinning():
+    samples = _infer(None)
+    thinned = _infer(None, thin=3)
+    # ceil(25 / 3) samples and ceil(10 / 3) adaptive samples
+    assert thinned[model.foo()].shape == (2, 9, 2)
+    assert thinned.get_num_samples(include_adapt_steps=True) == 13
+    assert torch.equal(thinned[model.foo()], samples[model.foo()][:, ::3])
+    with pytest.raises(ValueError):
+        _infer(None, thin=0)
+
+
+def test_numpy_memmap_sink(tmp_path):
+    samples = _infer(NumpyMemmapSink(str(tmp_path), chunk_size=4))
+    _assert_same_samples(_infer(None), samples)
+    # one file per column, holding all chains
+    assert np.load(tmp_path / "0.npy", mmap_mode="r").shape == (2, 35, 2)
+    # the directory already holds samples
+    with pytest.raises(ValueError, match="already contains samples"):
+        _infer(NumpyMemmapSink(str(tmp_path)))
+
+
+@pytest.mark.skipif(
+    sys.platform.startswith("win"),
+    reason="Windows does not support fork-based multiprocessing",
+)
+def test_numpy_memmap_sink_in_parallel(tmp_path):
+    samples = _infer(
+        NumpyMemmapSink(str(tmp_path), chunk_size=4),
+        run_in_parallel=True,
+        mp_context="fork",
+    )
+    assert samples[model.foo()].shape == (2, 25, 2)
+    assert not torch.equal(
+        samples.get_chain(0)[model.foo()], samples.get_chain(1)[model.foo()]
+    )
+
+
+def test_shared_memory_sink():
+    sink = SharedMemorySink(chunk_size=4)
+    samples = _infer(sink)
+    _assert_same_samples(_infer(None), samples)
+    assert sink.columns[0].is_shared()
+    assert sink.num_written.tolist() == [35, 35]
+
+
+@pytest.mark.skipif(
+    sys.platform.startswith("win"),
+    reason="Windows does not support fork-based multiprocessing",
+)
+def test_shared_memory_sink_in_parallel():
+    sink = SharedMemorySink(chunk_size=4)
+    samples = _infer(sink, run_in_parallel=True, mp_context="fork")
+    assert samples[model.foo()].shape == (2, 25, 2)
+    # the samples were written by the chains into the tensors the sink allocated
+    assert samples[model.foo()]._base is sink.columns[0]
+    assert sink.columns[0].is_shared()
+    assert sink.num_written.tolist() == [35, 35]
+    assert not torch.equal(
+        samples.get_chain(0)[model.foo()], samples.get_chain(1)[model.foo()]
+    )
+
+
+def test_netcdf_sink(tmp_path):
+    pytest.importorskip("netCDF4")
+    samples = _infer(NetCDFSink(str(tmp_path), chunk_size=4))
+    _assert_same_samples(_infer(None), samples)
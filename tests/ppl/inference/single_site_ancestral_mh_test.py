@@ -6,6 +6,10 @@
 import beanmachine.ppl as bm
 import torch
 import torch.distributions as dist
+from beanmachine.ppl.inference.proposer.single_site_ancestral_proposer import (
+    SingleSiteAncestralProposer,
+)
+from beanmachine.ppl.world import World
 
 
 class SampleModel:
@@ -32,6 +36,25 @@ class ReproducibleModel:
         return dist.Normal(0, 1)
 
 
+class DynamicModel:
+    @bm.random_variable
+    def foo(self):
+        return dist.Bernoulli(0.5)
+
+    @bm.random_variable
+    def bar(self, i: int):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def baz(self):
+        mu = self.bar(int(self.foo()))
+        return dist.Normal(mu, 1.0)
+
+    @bm.random_variable
+    def unrelated(self):
+        return dist.Normal(0.0, 1.0)
+
+
 def test_single_site_ancestral_mh():
     model = SampleModel()
     mh = bm.SingleSiteAncestralMetropolisHastings()
@@ -67,3 +90,32 @@ def test_single_site_ancestral_mh_reproducible_results():
     samples = mh.infer(queries, observations, num_samples=5, num_chains=1)
     run_3 = samples.get_variable(model.mu()).clone()
     assert not run_1.allclose(run_3)
+
+
+def test_markov_blanket_accept_log_prob():
+    model = DynamicModel()
+    observations = {model.baz(): torch.tensor(1.5)}
+    for _ in range(10):
+        world = World.initialize_world([model.foo(), model.unrelated()], observations)
+        local_proposer = SingleSiteAncestralProposer(model.foo())
+        global_proposer = SingleSiteAncestralProposer(
+            model.foo(), use_markov_blanket=False
+        )
+
+        torch.manual_seed(42)
+        local_world, local_accept_log_prob = local_proposer.propose(world)
+        torch.manual_seed(42)
+        global_world, global_accept_log_prob = global_proposer.propose(world)
+
+        assert local_world[model.foo()] == global_world[model.foo()]
+        assert len(local_world) == len(global_world)
+        assert torch.isclose(local_accept_log_prob, global_accept_log_prob)
+
+
+def test_single_site_ancestral_mh_without_markov_blanket():
+    model = SampleModel()
+    mh = bm.SingleSiteAncestralMetropolisHastings(use_markov_blanket=False)
+    samples = mh.infer(
+        [model.foo()], {model.bar(): torch.tensor(0.0)}, num_samples=10, num_chains=1
+    )
+    assert samples[model.foo()].shape == (1, 10)
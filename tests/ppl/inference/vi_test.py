@@ -12,8 +12,13 @@ import pytest
 import scipy.stats
 import torch
 import torch.distributions as dist
+from beanmachine.ppl.distributions.delta import Delta
 from beanmachine.ppl.inference.vi import ADVI, MAP, VariationalInfer
-from beanmachine.ppl.inference.vi.gradient_estimator import monte_carlo_approximate_sf
+from beanmachine.ppl.inference.vi.discrepancy import kl_reverse
+from beanmachine.ppl.inference.vi.gradient_estimator import (
+    monte_carlo_approximate_reparam,
+    monte_carlo_approximate_sf,
+)
 from beanmachine.ppl.inference.vi.variational_world import VariationalWorld
 from beanmachine.ppl.world import init_from_prior, RVDict
 from torch import optim
@@ -416,7 +421,8 @@ class TestStochasticVariationalInfer:
 
         assert sample_mean_alpha_neg_10 > sample_mean_alpha_10
 
-    def test_discrete_mixture(self):
+    @pytest.mark.parametrize("vectorized", [False, True])
+    def test_discrete_mixture(self, vectorized):
         model = BinaryGaussianMixture()
 
         N = 10
@@ -440,7 +446,10 @@ class TestStochasticVariationalInfer:
             optimizer=lambda p: optim.Adam(p, lr=5e-1),
         )
         world = vi.infer(
-            num_steps=30, num_samples=50, mc_approx=monte_carlo_approximate_sf
+            num_steps=30,
+            num_samples=50,
+            mc_approx=monte_carlo_approximate_sf,
+            vectorized=vectorized,
         )
 
         accuracy = (
@@ -569,3 +578,80 @@ class TestStochasticVariationalInfer:
             assert (mu_approx.mean - expected_mean).norm() > 0.05 or (
                 mu_approx.stddev - expected_stddev
             ).norm() > 0.05
+
+    def test_vectorized_normal_normal_guide(self):
+        normal_normal_model = NormalNormal()
+        log_scale_normal_model = LogScaleNormal()
+
+        world = VariationalInfer(
+            queries_to_guides={normal_normal_model.mu(): log_scale_normal_model.q_mu()},
+            observations={
+                normal_normal_model.x(1): torch.tensor(9.0),
+                normal_normal_model.x(2): torch.tensor(10.0),
+            },
+            optimizer=lambda params: torch.optim.Adam(params, lr=1e0),
+        ).infer(num_steps=100, num_samples=32, vectorized=True)
+        mu_approx = world.get_variable(log_scale_normal_model.q_mu()).distribution
+
+        sample_mean = mu_approx.sample((100, 1)).mean()
+        assert sample_mean > 5.0
+
+        sample_var = mu_approx.sample((100, 1)).var()
+        assert sample_var > 0.1
+
+    def test_vectorized_estimate_matches_sequential(self):
+        normal_normal_model = NormalNormal()
+
+        @bm.param
+        def phi():
+            return torch.ones(1)
+
+        @bm.random_variable
+        def q_mu():
+            # a point mass, so that every particle has the same value
+            return Delta(phi())
+
+        vi = VariationalInfer(
+            queries_to_guides={normal_normal_model.mu(): q_mu()},
+            observations={
+                normal_normal_model.x(1): torch.tensor(9.0),
+                normal_normal_model.x(2): torch.tensor(10.0),
+            },
+        )
+        losses, grads = [], []
+        for vectorized in [False, True]:
+            loss = monte_carlo_approximate_reparam(
+                vi.observations,
+                8,
+                kl_reverse,
+                vi.params,
+                vi.queries_to_guides,
+                vectorized=vectorized,
+            )
+            (grad,) = torch.autograd.grad(loss, [vi.params[phi()]])
+            losses.append(loss)
+            grads.append(grad)
+        assert losses[0].shape == losses[1].shape == (1,)
+        assert torch.allclose(losses[0], losses[1])
+        assert torch.allclose(grads[0], grads[1])
+
+    def test_vectorized_falls_back_without_vmap(self, caplog):
+        @bm.random_variable
+        def mu():
+            return dist.Normal(0.0, 1.0)
+
+        @bm.random_variable
+        def x():
+            # branching on the value of mu cannot be vmapped
+            if mu() > 0:
+                return dist.Normal(mu(), 1.0)
+            return dist.Normal(-mu(), 1.0)
+
+        vi = ADVI(queries=[mu()], observations={x(): torch.tensor(1.0)})
+        loss = vi.step(num_samples=4, vectorized=True)
+        assert loss.shape == (1,)
+        assert torch.isfinite(loss)
+        # the fallback is only reported once
+        vi.step(num_samples=4, vectorized=True)
+        fallbacks = [r for r in caplog.records if "one particle at a time" in r.message]
+        assert len(fallbacks) == 1
@@ -6,7 +6,9 @@
 """Tests for memoize.py"""
 import unittest
 
-from beanmachine.ppl.utils.memoize import memoize
+import beanmachine.ppl.utils.memoize as memoize_module
+import torch
+from beanmachine.ppl.utils.memoize import MemoizationKey, memoize, memoizer_report
 
 
 count1 = 0
@@ -41,3 +43,64 @@ class MemoizeTest(unittest.TestCase):
         f10 = fib_mem(10)
         self.assertEqual(f10, 89)
         self.assertEqual(count2, 11)
+
+    def test_memoize_tensors(self) -> None:
+        """Tensor arguments are memoized by dtype, shape and value"""
+        calls = []
+
+        @memoize
+        def identity(t):
+            calls.append(t)
+            return t
+
+        x = torch.arange(6.0).reshape(2, 3)
+        self.assertIs(identity(x), x)
+        self.assertIs(identity(x.clone()), x)
+        self.assertEqual(len(calls), 1)
+        # same values, different dtype or shape
+        identity(x.double())
+        identity(x.reshape(3, 2))
+        self.assertEqual(len(calls), 3)
+        identity(x + 1)
+        self.assertEqual(len(calls), 4)
+
+    def test_scalar_tensor_keys(self) -> None:
+        """Scalar tensors are keyed like the numbers they stand for"""
+        f = memoize(lambda x: x)
+        self.assertEqual(
+            MemoizationKey(f, (torch.tensor(2.0),)), MemoizationKey(f, (2,))
+        )
+        self.assertNotEqual(
+            MemoizationKey(f, (torch.tensor([2.0]),)),
+            MemoizationKey(f, (torch.tensor([3.0]),)),
+        )
+
+    def test_memoize_max_size(self) -> None:
+        calls = []
+
+        @memoize(max_size=2)
+        def square(n):
+            calls.append(n)
+            return n * n
+
+        evictions = memoize_module.total_cache_evictions
+        self.assertEqual([square(n) for n in [1, 2, 1, 3, 1, 2]], [1, 4, 1, 9, 1, 4])
+        # 1 is used most recently when 3 is added, so 2 is evicted
+        self.assertEqual(calls, [1, 2, 3, 2])
+        self.assertEqual(memoize_module.total_cache_evictions - evictions, 2)
+
+    def test_memoizer_report(self) -> None:
+        memoize_module.count_calls = True
+        try:
+
+            @memoize
+            def double(n):
+                return 2 * n
+
+            double(1)
+            double(1)
+            double(2)
+        finally:
+            memoize_module.count_calls = False
+        self.assertIn("double: 3 (hits: 1 misses: 2)", memoizer_report())
+        self.assertIn("evictions: ", memoizer_report())
@@ -0,0 +1,98 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Tests for persistent_map.py"""
+import random
+import unittest
+
+from beanmachine.ppl.utils.persistent_map import PersistentMap
+
+
+class Collider:
+    # A key whose hash collides with every other Collider
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __hash__(self) -> int:
+        return 42
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Collider) and other.name == self.name
+
+
+class PersistentMapTest(unittest.TestCase):
+    def test_basic_operations(self) -> None:
+        m = PersistentMap({"a": 1, "b": 2})
+        m["c"] = 3
+        m["a"] = 4
+        del m["b"]
+        self.assertEqual(dict(m), {"a": 4, "c": 3})
+        self.assertEqual(len(m), 2)
+        self.assertIn("a", m)
+        self.assertNotIn("b", m)
+        self.assertIsNone(m.get("b"))
+        with self.assertRaises(KeyError):
+            m["b"]
+        with self.assertRaises(KeyError):
+            del m["b"]
+
+    def test_copies_are_independent(self) -> None:
+        for size in (10, 1000):
+            m = PersistentMap((i, i) for i in range(size))
+            c = m.copy()
+            c[0] = -1
+            del c[1]
+            c[size] = size
+            m[2] = -2
+            self.assertEqual(m[0], 0)
+            self.assertEqual(m[1], 1)
+            self.assertNotIn(size, m)
+            self.assertEqual(c[2], 2)
+            self.assertEqual(len(m), size)
+            self.assertEqual(len(c), size)
+
+    def test_copies_of_small_maps_grow_independently(self) -> None:
+        m = PersistentMap({i: i for i in range(10)})
+        c = m.copy()
+        # both maps outgrow the dict they started as
+        for i in range(100, 200):
+            m[i] = i
+        for i in range(300, 400):
+            c[i] = i
+        self.assertEqual(set(m), set(range(10)) | set(range(100, 200)))
+        self.assertEqual(set(c), set(range(10)) | set(range(300, 400)))
+        self.assertEqual(len(c), 110)
+        self.assertNotIn(100, c)
+
+    def test_hash_collisions(self) -> None:
+        keys = [Collider(str(i)) for i in range(100)]
+        m = PersistentMap((k, k.name) for k in keys)
+        c = m.copy()
+        for k in keys[::2]:
+            del c[k]
+        self.assertEqual(len(m), 100)
+        self.assertEqual(len(c), 50)
+        self.assertEqual(m[Collider("10")], "10")
+        self.assertNotIn(Collider("10"), c)
+        self.assertEqual(c[Collider("11")], "11")
+
+    def test_matches_dict(self) -> None:
+        rng = random.Random(0)
+        m = PersistentMap()
+        d = {}
+        snapshots = []
+        for _ in range(5000):
+            key = rng.randrange(500)
+            if rng.random() < 0.3 and key in d:
+                del m[key]
+                del d[key]
+            else:
+                m[key] = d[key] = rng.random()
+            if rng.random() < 0.01:
+                snapshots.append((m.copy(), dict(d)))
+        self.assertEqual(dict(m), d)
+        for snapshot, expected in snapshots:
+            self.assertEqual(dict(snapshot), expected)
+            self.assertEqual(len(snapshot), len(expected))
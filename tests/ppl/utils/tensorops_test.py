@@ -51,6 +51,52 @@ class TensorOpsTest(unittest.TestCase):
             self.assertEqual(grad.dtype, type_, "gradient dtype must match input")
             self.assertEqual(hess.dtype, type_, "hessian dtype must match input")
 
+    def test_hessian_estimators(self) -> None:
+        prec = torch.Tensor([[1, 0.1, 0], [0.1, 2, 0.5], [0, 0.5, 3]]).double()
+        mu = torch.randn(3, dtype=torch.float64)
+
+        def f(x):
+            return -(x - mu) @ prec @ (x - mu) / 2
+
+        x = torch.randn(3, requires_grad=True, dtype=torch.float64)
+        for hessian in ["dense", "blocked"]:
+            grad, hess = tensorops.halfspace_gradients(f(x), x, hessian=hessian)
+            self.assertTrue(grad.allclose(-(x - mu) @ prec))
+            self.assertTrue(hess.allclose(-torch.diagonal(prec)))
+            grad, hess = tensorops.simplex_gradients(f(x), x, hessian=hessian)
+            self.assertTrue(hess.allclose(-torch.tensor([1.0, 1.9, 3.0]).double()))
+
+        # Hutchinson's estimate of the diagonal is unbiased
+        torch.manual_seed(0)
+        grad, hess = tensorops.halfspace_gradients(
+            f(x), x, hessian="hutchinson", num_probes=4000
+        )
+        self.assertTrue(hess.allclose(-torch.diagonal(prec), atol=0.05))
+        with self.assertRaises(ValueError):
+            tensorops.simplex_gradients(f(x), x, hessian="hutchinson")
+
+        # the same probes give the same estimate
+        probes = tensorops.rademacher_probes(8, 3, torch.float64, x.device)
+        _, hess1 = tensorops.halfspace_gradients(
+            f(x), x, hessian="hutchinson", probes=probes
+        )
+        _, hess2 = tensorops.halfspace_gradients(
+            f(x), x, hessian="hutchinson", probes=probes
+        )
+        self.assertTrue(hess1.equal(hess2))
+
+        # a separable function has a diagonal hessian, which a single
+        # Hessian-vector product computes exactly
+        y = torch.rand(5, requires_grad=True, dtype=torch.float64)
+        g = (2 * y.log() - 3 * y + y**3).sum()
+        expected = -2 / y**2 + 6 * y
+        _, hess = tensorops.halfspace_gradients(g, y, hessian="separable")
+        self.assertTrue(hess.allclose(expected))
+        _, hess = tensorops.simplex_gradients(g, y, hessian="separable")
+        self.assertTrue(hess.allclose(expected))
+        _, hess = tensorops.simplex_gradients(g, y, hessian="blocked")
+        self.assertTrue(hess.allclose(expected))
+
     def test_gradients_negative(self) -> None:
         # output must have one element
         x = torch.randn(3, requires_grad=True)
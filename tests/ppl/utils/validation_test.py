@@ -0,0 +1,51 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import threading
+import unittest
+
+import torch.distributions as dist
+from beanmachine.ppl.utils.validation import argument_validation_disabled
+
+
+class ValidationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.default = dist.Distribution._validate_args
+        dist.Distribution.set_default_validate_args(True)
+
+    def tearDown(self) -> None:
+        dist.Distribution.set_default_validate_args(self.default)
+
+    def test_argument_validation_disabled(self) -> None:
+        with argument_validation_disabled():
+            self.assertFalse(dist.Distribution._validate_args)
+            with argument_validation_disabled():
+                self.assertFalse(dist.Distribution._validate_args)
+            self.assertFalse(dist.Distribution._validate_args)
+        self.assertTrue(dist.Distribution._validate_args)
+
+    def test_argument_validation_disabled_in_threads(self) -> None:
+        # the threads enter and exit in an interleaved order; the default is
+        # restored only once all of them have exited
+        entered = threading.Barrier(4)
+        first_exited = threading.Event()
+        validate_args = []
+
+        def run(i: int) -> None:
+            with argument_validation_disabled():
+                entered.wait()
+                if i > 0:
+                    first_exited.wait()
+                    validate_args.append(dist.Distribution._validate_args)
+            if i == 0:
+                first_exited.set()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(validate_args, [False, False, False])
+        self.assertTrue(dist.Distribution._validate_args)
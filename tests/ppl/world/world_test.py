@@ -3,10 +3,13 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import beanmachine.ppl as bm
 import torch
 import torch.distributions as dist
-from beanmachine.ppl.world import World
+from beanmachine.ppl.world import get_world_context, World
 
 
 class SampleModel:
@@ -61,6 +64,18 @@ class ChangeSupportModel:
         return dist.Bernoulli(self.foo())
 
 
+class FamilyModel:
+    @bm.random_variable
+    def theta(self, i: int):
+        return dist.Normal(0.0, 1.0)
+
+    @bm.random_variable
+    def y(self, i: int):
+        if i < 0:
+            return dist.Normal(self.theta(0), 1.0)
+        return dist.Bernoulli(logits=self.theta(i % 3))
+
+
 def test_basic_operations():
     model = SampleModel()
     observations = {model.bar(): torch.rand(())}
@@ -154,3 +169,71 @@ def test_distribution_and_log_prob_update():
     baz_var2 = world2.get_variable(model.baz())  # Bernoulli(1.0)
     # recall that baz() is observed to be 1.0
     assert baz_var.log_prob < baz_var2.log_prob
+
+
+def test_fused_log_prob():
+    model = FamilyModel()
+    observations = {model.y(i): torch.tensor(float(i % 2)) for i in range(-5, 20)}
+    world = World.initialize_world([], observations)
+    theta = torch.tensor([0.3, -1.2, 2.0], requires_grad=True)
+    world = world.replace({model.theta(i): theta[i] for i in range(3)})
+
+    expected = sum(
+        world.get_variable(node).distribution.log_prob(world[node]) for node in world
+    )
+    log_prob = world.log_prob()
+    assert torch.isclose(log_prob, expected)
+    # the log probs of the individual sites are cached as usual
+    node = model.y(4)
+    assert torch.isclose(
+        world.get_variable(node).log_prob,
+        dist.Bernoulli(logits=theta[1]).log_prob(torch.tensor(0.0)),
+    )
+    (grad,) = torch.autograd.grad(log_prob, theta)
+    (expected_grad,) = torch.autograd.grad(expected, theta)
+    assert torch.allclose(grad, expected_grad)
+
+    # evaluating a subset of the nodes
+    nodes = [model.y(i) for i in range(10)]
+    expected = sum(world.get_variable(node).log_prob for node in nodes)
+    assert torch.isclose(world.log_prob(nodes), expected)
+
+
+def test_fused_log_prob_plan_invalidation():
+    model = ChangeSupportModel()
+    with World(observations={model.baz(): torch.tensor(1.0)}) as world:
+        model.bar()
+        model.baz()
+    world = world.replace({model.foo(): torch.tensor(0.0)})
+    world.log_prob()
+    plan = world._log_prob_plan
+    # the type of the distribution of bar changes
+    world2 = world.replace({model.foo(): torch.tensor(1.0)})
+    assert world2._log_prob_plan is not plan
+    expected = sum(world2.get_variable(node).log_prob for node in world2)
+    assert torch.isclose(world2.log_prob(), expected)
+
+
+def test_world_context_is_per_thread():
+    model = DynamicModel()
+    num_threads = 8
+    barrier = threading.Barrier(num_threads)
+
+    def run(thread_id):
+        world = World()
+        with world:
+            # wait until every thread has entered its own world
+            barrier.wait()
+            assert get_world_context() is world
+            for i in range(50):
+                model.bar(thread_id * 100 + i)
+        assert get_world_context() is None
+        return world
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        worlds = list(executor.map(run, range(num_threads)))
+    for thread_id, world in enumerate(worlds):
+        # each world only contains the variables of its own thread
+        assert set(world) == {model.bar(thread_id * 100 + i) for i in range(50)}
+    # the threads don't affect the world stack of the main thread
+    assert get_world_context() is None